@@ -0,0 +1,80 @@
+"""
+Benchmark de chamadas à Graph API contra o stub local: requests sem sessão (uma conexão
+por chamada) versus GraphClient (keep-alive) e AsyncGraphClient (chamadas concorrentes)
+
+Uso:
+    python -m benchmarks.bench_graph_client --requests 300 --latency-ms 5 --concurrency 20
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+import requests
+
+from whatsapp.graph_client import AsyncGraphClient, GraphClient
+from whatsapp.graph_stub import StubServer
+
+PHONE_NUMBER_ID = "123456789"
+
+def build_message(index: int) -> dict:
+    return {
+        "messaging_product": "whatsapp",
+        "recipient_type": "individual",
+        "to": f"+55119{index:08d}",
+        "type": "text",
+        "text": {"body": "Olá! Como posso ajudar?"}
+    }
+
+def run_without_session(base_url: str, total: int) -> float:
+    """Fluxo anterior: requests.post sem sessão nem timeout"""
+    start = time.perf_counter()
+    for index in range(total):
+        requests.post(f"{base_url}/{PHONE_NUMBER_ID}/messages", json=build_message(index)).json()
+    return time.perf_counter() - start
+
+def run_pooled(base_url: str, total: int) -> float:
+    client = GraphClient(api_token="bench", base_url=base_url)
+    try:
+        start = time.perf_counter()
+        for index in range(total):
+            client.send_message(PHONE_NUMBER_ID, build_message(index))
+        return time.perf_counter() - start
+    finally:
+        client.close()
+
+async def run_async(base_url: str, total: int, concurrency: int) -> float:
+    client = AsyncGraphClient(api_token="bench", base_url=base_url, pool_size=concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send(index: int):
+        async with semaphore:
+            await client.send_message(PHONE_NUMBER_ID, build_message(index))
+
+    try:
+        start = time.perf_counter()
+        await asyncio.gather(*(send(index) for index in range(total)))
+        return time.perf_counter() - start
+    finally:
+        await client.aclose()
+
+def report(name: str, total: int, elapsed: float):
+    print(f"{name:>16}: {elapsed * 1000 / total:.3f}ms/call  {total / elapsed:.1f} calls/s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do cliente da Graph API")
+    parser.add_argument("--requests", type=int, default=300, help="Chamadas por cenário")
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="Latência simulada do stub")
+    parser.add_argument("--concurrency", type=int, default=20, help="Chamadas simultâneas no cenário async")
+    parser.add_argument("--port", type=int, default=5055)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    with StubServer(port=args.port, latency_ms=args.latency_ms) as stub:
+        print(f"requests={args.requests} latency_ms={args.latency_ms} concurrency={args.concurrency}")
+        report("no session", args.requests, run_without_session(stub.base_url, args.requests))
+        report("pooled sync", args.requests, run_pooled(stub.base_url, args.requests))
+        report("pooled async", args.requests, asyncio.run(run_async(stub.base_url, args.requests, args.concurrency)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Benchmark do custo de logging na thread que processa mensagens: f-strings com logger.info
+e StreamHandler síncrono (configuração antiga) versus eventos estruturados via QueueHandler,
+com e sem amostragem. `--sink-latency-us` simula um destino lento (pipe do stderr cheio,
+driver de log do container), onde a escrita síncrona bloqueia quem registra.
+
+Uso:
+    python -m benchmarks.bench_logging --messages 20000 --sample-rate 0.01 --sink-latency-us 50
+"""
+import argparse
+import logging
+import os
+import time
+import uuid
+
+from observability import configure_logging, log_event, stop_logging
+
+logger = logging.getLogger("bench.logging")
+
+def old_message_path(client_hub: str, conversation_uuid: str, content: str):
+    # Mesmas linhas que o caminho de uma mensagem emitia antes (service + repository + canal)
+    logger.debug(f"Getting or creating conversation for client {client_hub} on channel whatsapp")
+    logger.info(f"Conversation retrieved for client {client_hub}: {conversation_uuid}")
+    logger.info(f"Mensagem recebida de Maria Silva: {content}")
+    logger.debug(f"Adding message to conversation {conversation_uuid}")
+    logger.info(f"Message added to conversation {conversation_uuid}. Conversation closed: False")
+
+def new_message_path(client_hub: str, conversation_uuid: str, content: str):
+    log_event(logger, "conversation.resolve", logging.DEBUG, client_hub=client_hub, channel="whatsapp")
+    log_event(logger, "conversation.resolved", client_hub=client_hub, conversation_uuid=conversation_uuid, created=False)
+    log_event(logger, "message.received", user_id=1, type="text", chars=len(content))
+    log_event(logger, "message.add", logging.DEBUG, conversation_uuid=conversation_uuid)
+    log_event(logger, "message.added", conversation_uuid=conversation_uuid, conversation_closed=False)
+
+class SlowSink:
+    """Destino de log em que cada escrita leva `latency_us`"""
+
+    def __init__(self, latency_us: float):
+        self.latency_us = latency_us
+
+    def write(self, data: str):
+        if self.latency_us:
+            time.sleep(self.latency_us / 1_000_000)
+
+    def flush(self):
+        pass
+
+def measure(path, messages: int) -> float:
+    """Tempo médio por mensagem (µs) gasto na thread chamadora"""
+    conversation_uuid = str(uuid.uuid4())
+    content = "Olá, gostaria de saber o status do meu pedido número 12345"
+    start = time.perf_counter()
+    for index in range(messages):
+        path(f"user_{index % 100}", conversation_uuid, content)
+    return (time.perf_counter() - start) / messages * 1_000_000
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de overhead de logging")
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--sample-rate", type=float, default=0.01, help="Taxa de amostragem dos eventos INFO por mensagem")
+    parser.add_argument("--sink-latency-us", type=float, default=50.0, help="Latência de escrita do destino lento")
+    args = parser.parse_args()
+
+    rate = args.sample_rate
+    sampling = {"conversation.resolved": rate, "message.received": rate, "message.added": rate}
+    print(f"messages={args.messages} (5 log calls each, 3 at INFO)")
+    with open(os.devnull, "w") as devnull:
+        for sink_name, sink in (("devnull", devnull), (f"sink {args.sink_latency_us:g}µs", SlowSink(args.sink_latency_us))):
+            root = logging.getLogger()
+            handler = logging.StreamHandler(sink)
+            handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+            root.handlers = [handler]
+            root.setLevel(logging.INFO)
+            print(f"{sink_name:>14} {'sync f-strings':>22}: {measure(old_message_path, args.messages):7.2f} µs/message")
+
+            configure_logging("INFO", stream=sink, queue_size=1_000_000)
+            print(f"{sink_name:>14} {'queue, no sampling':>22}: {measure(new_message_path, args.messages):7.2f} µs/message")
+
+            configure_logging("INFO", stream=sink, sampling=sampling, queue_size=1_000_000)
+            print(f"{sink_name:>14} {f'queue, sampling {rate}':>22}: {measure(new_message_path, args.messages):7.2f} µs/message")
+
+            configure_logging("INFO", output="json", stream=sink, sampling=sampling, queue_size=1_000_000)
+            print(f"{sink_name:>14} {f'json, sampling {rate}':>22}: {measure(new_message_path, args.messages):7.2f} µs/message")
+            stop_logging()
+
+if __name__ == "__main__":
+    main()
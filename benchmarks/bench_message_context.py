@@ -0,0 +1,119 @@
+"""
+Benchmark do custo de pré-processamento por webhook: caminho antigo (parse, autenticação e
+extração repetidos no handler e no background) versus MessageContext calculado uma única vez
+
+Uso:
+    python -m benchmarks.bench_message_context --users 5000 --iterations 500 --transcription-ms 20
+"""
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import Callable, Dict
+
+from whatsapp.whatsapp_models import MessageContext, Payload
+from whatsapp.whatsapp_service import WhatsappService
+
+def build_payload(phone: str, message_type: str, index: int) -> Dict:
+    """Monta um payload de webhook com uma mensagem"""
+    message = {
+        "from": phone,
+        "id": f"wamid.bench.{index}",
+        "timestamp": str(int(time.time())),
+        "type": message_type
+    }
+    if message_type == "audio":
+        message["audio"] = {"mime_type": "audio/ogg", "sha256": "bench", "id": f"audio_{index}", "voice": True}
+    else:
+        message["text"] = {"body": "Olá, preciso de ajuda com meu pedido"}
+
+    return {
+        "object": "whatsapp_business_account",
+        "entry": [{
+            "id": "bench_entry",
+            "changes": [{
+                "field": "messages",
+                "value": {
+                    "messaging_product": "whatsapp",
+                    "metadata": {"display_phone_number": "15551234567", "phone_number_id": "123456789"},
+                    "messages": [message]
+                }
+            }]
+        }]
+    }
+
+def old_path(service: WhatsappService, data: Dict):
+    """Fluxo anterior: o handler valida e o background repete tudo a partir do payload"""
+    # Handler
+    payload = Payload(**data)
+    message = service.parse_message(payload)
+    service.is_message_too_old(message.timestamp)
+    service.get_current_user(message)
+    service.message_extractor(message, service.parse_audio_file(message))
+    service.parse_image_file(message)
+
+    # Background
+    message = service.parse_message(payload)
+    service.is_message_too_old(message.timestamp)
+    service.get_current_user(message)
+    service.extract_message_content(message)
+
+def context_path(service: WhatsappService, data: Dict):
+    """Fluxo com MessageContext: validação única, contexto serializado no job e reaproveitado"""
+    # Handler
+    payload = Payload(**data)
+    message = service.parse_messages(payload)[0]
+    context, _ = service.build_message_context(message, service.get_users([message.from_]))
+    job_payload = json.dumps({"context": context.model_dump(mode="json", by_alias=True)})
+
+    # Background
+    context = MessageContext.model_validate(json.loads(job_payload)["context"])
+    service.is_message_too_old(context.message_timestamp)
+    context.content or service.extract_message_content(context.message)
+
+def measure(func: Callable, service: WhatsappService, data: Dict, iterations: int) -> float:
+    """Retorna o tempo médio por webhook em ms"""
+    func(service, data)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func(service, data)
+    return (time.perf_counter() - start) * 1000 / iterations
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do MessageContext por webhook")
+    parser.add_argument("--users", type=int, default=1000, help="Tamanho do allowed_users.json")
+    parser.add_argument("--iterations", type=int, default=200, help="Webhooks por cenário")
+    parser.add_argument("--transcription-ms", type=float, default=20.0, help="Latência simulada da transcrição")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    previous_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            users = [
+                {"id": i, "phone": f"+55119{i:08d}", "first_name": "Bench", "last_name": str(i)}
+                for i in range(args.users)
+            ]
+            with open("allowed_users.json", "w", encoding="utf-8") as file:
+                json.dump(users, file)
+
+            service = WhatsappService(conversation_service=None)
+            # Transcrição simulada: evita rede e torna o custo do áudio explícito
+            service.transcribe_audio = lambda audio: time.sleep(args.transcription_ms / 1000) or "transcrição"
+            phone = users[-1]["phone"]  # Pior caso da busca linear
+
+            print(f"users={args.users} iterations={args.iterations} transcription_ms={args.transcription_ms}")
+            for message_type in ("text", "audio"):
+                data = build_payload(phone, message_type, 0)
+                old_ms = measure(old_path, service, data, args.iterations)
+                new_ms = measure(context_path, service, data, args.iterations)
+                saving = (1 - new_ms / old_ms) * 100 if old_ms else 0.0
+                print(f"{message_type:>5}: old={old_ms:.3f}ms context={new_ms:.3f}ms saving={saving:.1f}%")
+        finally:
+            os.chdir(previous_dir)
+
+if __name__ == "__main__":
+    main()
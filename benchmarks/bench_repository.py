@@ -0,0 +1,303 @@
+"""
+Benchmark do ConversationRepository em volume realista: popula o banco (SQLite ou um PostgreSQL
+local) com `--clients` clientes e `--messages-per-client` mensagens e mede as operações do caminho
+quente com uma e com várias threads. O resultado pode ser gravado em JSON (`--json`) e comparado
+com o de outro commit (`--compare`).
+
+Uso:
+    python -m benchmarks.bench_repository --clients 10000 --messages-per-client 20 --threads 1,8
+    python -m benchmarks.bench_repository --clients 100000 --messages-per-client 100 --db-path bench.db --json results.json
+    python -m benchmarks.bench_repository --database-type postgresql --pg-database bench --compare results.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+import sqlalchemy
+from sqlalchemy import func, insert
+
+from conversation.db import DatabaseConfig
+from conversation.models import Conversation, ConversationStatus, Message, MessageData, MessageOwner, MessageType
+from conversation.repository import ConversationRepository
+from observability import percentile
+
+SEED_CHUNK_SIZE = 10_000
+
+def client_hub(index: int) -> str:
+    return f"user_bench_{index}"
+
+def seed(repository: ConversationRepository, clients: int, messages_per_client: int,
+         closed_per_client: int, idle_timeout_minutes: int, cleanup_days: int) -> float:
+    """
+    Insere em lotes (Core, sem ORM) uma conversa ativa por cliente e `closed_per_client`
+    conversas encerradas há mais de `cleanup_days` dias; as mensagens são divididas entre elas
+    """
+    start = time.perf_counter()
+    now = datetime.now()
+    old = now - timedelta(days=cleanup_days + 1)
+    conversations, messages = [], []
+
+    def flush(connection, force: bool = False):
+        if conversations and (force or len(conversations) >= SEED_CHUNK_SIZE):
+            connection.execute(insert(Conversation), conversations)
+            conversations.clear()
+        if messages and (force or len(messages) >= SEED_CHUNK_SIZE):
+            connection.execute(insert(Message), messages)
+            messages.clear()
+
+    with repository.engine.begin() as connection:
+        for index in range(clients):
+            hub = client_hub(index)
+            owned = []
+            for _ in range(closed_per_client):
+                conversation_uuid = uuid.uuid4()
+                owned.append((conversation_uuid, old))
+                conversations.append({
+                    "conversation_uuid": conversation_uuid, "client_hub": hub, "channel": "whatsapp",
+                    "created_at": old, "updated_at": old, "last_activity_at": old,
+                    "status": ConversationStatus.IDLE_TIMEOUT, "idle_timeout_minutes": idle_timeout_minutes,
+                    "closed_at": old
+                })
+            conversation_uuid = uuid.uuid4()
+            owned.append((conversation_uuid, now))
+            conversations.append({
+                "conversation_uuid": conversation_uuid, "client_hub": hub, "channel": "whatsapp",
+                "created_at": now, "updated_at": now, "last_activity_at": now,
+                "status": ConversationStatus.ACTIVE, "idle_timeout_minutes": idle_timeout_minutes,
+                "closed_at": None
+            })
+            for position in range(messages_per_client):
+                conversation_uuid, base = owned[position % len(owned)]
+                messages.append({
+                    "id": uuid.uuid4(), "conversation_uuid": conversation_uuid, "type": MessageType.TEXT,
+                    "message": f"Mensagem {position} do cliente {index}",
+                    "timestamp": base - timedelta(seconds=messages_per_client - position),
+                    "owner": MessageOwner.USER if position % 2 == 0 else MessageOwner.AGENT,
+                    "channel": "whatsapp", "closes_conversation": False
+                })
+            flush(connection)
+        flush(connection, force=True)
+    return time.perf_counter() - start
+
+def seeded_clients(repository: ConversationRepository) -> int:
+    with repository.get_session() as session:
+        return session.query(func.count(func.distinct(Conversation.client_hub))).filter(
+            Conversation.client_hub.like("user_bench_%")
+        ).scalar()
+
+def build_operations(repository: ConversationRepository, clients: int, cleanup_days: int) -> Dict[str, Callable[[int], Any]]:
+    """Cada operação recebe o índice da chamada e escolhe um cliente aleatório já populado"""
+    active = {}
+    lock = threading.Lock()
+
+    def conversation_of(hub: str) -> str:
+        with lock:
+            conversation_uuid = active.get(hub)
+        if conversation_uuid is None:
+            conversation_uuid, _ = repository.get_or_create_conversation_uuid(hub)
+            with lock:
+                active[hub] = conversation_uuid
+        return conversation_uuid
+
+    def random_hub() -> str:
+        return client_hub(random.randrange(clients))
+
+    def add_message(call: int):
+        data = MessageData(message=f"Mensagem de benchmark {call}", type="text", owner=MessageOwner.USER)
+        return repository.add_message(conversation_of(random_hub()), data)
+
+    return {
+        "get_or_create_conversation_uuid": lambda call: repository.get_or_create_conversation_uuid(random_hub()),
+        "add_message": add_message,
+        "get_conversation_history": lambda call: repository.get_conversation_history(random_hub(), limit=50),
+        "get_conversation_history_closed": lambda call: repository.get_conversation_history(random_hub(), limit=50, include_closed=True),
+        "get_conversation_stats": lambda call: repository.get_conversation_stats(random_hub()),
+        "get_conversation_stats_global": lambda call: repository.get_conversation_stats(),
+        "cleanup_old_conversations": lambda call: repository.cleanup_old_conversations(days_old=cleanup_days),
+    }
+
+def measure(operation: Callable[[int], Any], calls: int, threads: int) -> Dict[str, Any]:
+    """Executa `calls` chamadas distribuídas em `threads` threads; latência por chamada e vazão total"""
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    lock = threading.Lock()
+
+    def call(index: int):
+        start = time.perf_counter()
+        try:
+            operation(index)
+        except Exception as e:
+            with lock:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+            return
+        elapsed = (time.perf_counter() - start) * 1000
+        with lock:
+            latencies.append(elapsed)
+
+    start = time.perf_counter()
+    if threads == 1:
+        for index in range(calls):
+            call(index)
+    else:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            list(executor.map(call, range(calls)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+
+    return {
+        "threads": threads,
+        "calls": calls,
+        "errors": sum(errors.values()),
+        "error_types": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_per_s": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": {
+            "avg": round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+            "p50": round(percentile(latencies, 0.5), 3),
+            "p95": round(percentile(latencies, 0.95), 3),
+            "p99": round(percentile(latencies, 0.99), 3),
+            "max": round(max(latencies, default=0.0), 3)
+        }
+    }
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def show_results(results: List[Dict[str, Any]]):
+    print(f"{'operation':>32} {'threads':>7} {'calls':>6} {'err':>4} {'ops/s':>9} "
+          f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for result in results:
+        latency = result["latency_ms"]
+        print(f"{result['operation']:>32} {result['threads']:>7} {result['calls']:>6} {result['errors']:>4} "
+              f"{result['throughput_per_s']:>9.1f} {latency['p50']:>9.3f} {latency['p95']:>9.3f} "
+              f"{latency['p99']:>9.3f} {latency['max']:>9.3f}")
+
+def show_comparison(results: List[Dict[str, Any]], baseline: Dict[str, Any]):
+    """Variação de p50/p95 e vazão em relação a um resultado anterior (mesma operação e threads)"""
+    previous = {(result["operation"], result["threads"]): result for result in baseline["results"]}
+    print(f"\ncompared with {baseline['meta'].get('commit') or 'baseline'}:")
+    print(f"{'operation':>32} {'threads':>7} {'p50':>9} {'p95':>9} {'ops/s':>9}")
+    for result in results:
+        before = previous.get((result["operation"], result["threads"]))
+        if not before:
+            continue
+
+        def change(new: float, old: float) -> str:
+            return f"{(new - old) / old * 100:+8.1f}%" if old else f"{'n/a':>9}"
+
+        print(f"{result['operation']:>32} {result['threads']:>7} "
+              f"{change(result['latency_ms']['p50'], before['latency_ms']['p50'])} "
+              f"{change(result['latency_ms']['p95'], before['latency_ms']['p95'])} "
+              f"{change(result['throughput_per_s'], before['throughput_per_s'])}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do ConversationRepository")
+    parser.add_argument("--database-type", choices=("sqlite", "postgresql"), default="sqlite")
+    parser.add_argument("--db-path", help="Arquivo SQLite (reutilizado se já populado; padrão: arquivo temporário)")
+    parser.add_argument("--pg-host", default=os.getenv("PGHOST", "localhost"))
+    parser.add_argument("--pg-port", type=int, default=int(os.getenv("PGPORT", "5432")))
+    parser.add_argument("--pg-database", default=os.getenv("PGDATABASE", "conversation_bench"))
+    parser.add_argument("--pg-user", default=os.getenv("PGUSER", "postgres"))
+    parser.add_argument("--pg-password", default=os.getenv("PGPASSWORD", ""))
+    parser.add_argument("--clients", type=int, default=10_000)
+    parser.add_argument("--messages-per-client", type=int, default=20)
+    parser.add_argument("--closed-per-client", type=int, default=1, help="Conversas antigas encerradas por cliente (alvo do cleanup)")
+    parser.add_argument("--idle-timeout-minutes", type=int, default=24 * 60, help="Timeout das conversas ativas populadas")
+    parser.add_argument("--cleanup-days", type=int, default=30)
+    parser.add_argument("--reseed", action="store_true", help="Popula novamente mesmo se o banco já tiver os clientes")
+    parser.add_argument("--calls", type=int, default=500, help="Chamadas por operação e nível de concorrência")
+    parser.add_argument("--heavy-calls", type=int, default=20, help="Chamadas das operações globais (stats global, cleanup)")
+    parser.add_argument("--threads", default="1,8", help="Níveis de concorrência separados por vírgula")
+    parser.add_argument("--operations", help="Subconjunto das operações, separadas por vírgula")
+    parser.add_argument("--json", dest="json_path", help="Grava os resultados em JSON ('-' para stdout)")
+    parser.add_argument("--compare", help="JSON de uma execução anterior para comparar")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    random.seed(args.seed)
+
+    temporary = None
+    if args.database_type == "sqlite":
+        if not args.db_path:
+            temporary = tempfile.TemporaryDirectory()
+            args.db_path = os.path.join(temporary.name, "bench_repository.db")
+        database = DatabaseConfig("", "sqlite", db_path=args.db_path)
+    else:
+        database = DatabaseConfig(
+            "", "postgresql", host=args.pg_host, port=args.pg_port, database=args.pg_database,
+            username=args.pg_user, password=args.pg_password
+        )
+    repository = ConversationRepository(database)
+
+    seed_seconds = None
+    existing = seeded_clients(repository)
+    if args.reseed or existing < args.clients:
+        if existing:
+            print(f"database has {existing} bench clients, seeding {args.clients} more")
+        seed_seconds = seed(repository, args.clients, args.messages_per_client, args.closed_per_client,
+                            args.idle_timeout_minutes, args.cleanup_days)
+        print(f"seeded {args.clients} clients / {args.clients * args.messages_per_client} messages "
+              f"in {seed_seconds:.1f}s")
+    else:
+        print(f"reusing {existing} seeded clients")
+
+    operations = build_operations(repository, args.clients, args.cleanup_days)
+    selected = args.operations.split(",") if args.operations else list(operations)
+    heavy = {"get_conversation_stats_global", "cleanup_old_conversations"}
+    thread_levels = [int(value) for value in args.threads.split(",") if value]
+
+    results = []
+    for name in selected:
+        for threads in thread_levels:
+            calls = args.heavy_calls if name in heavy else args.calls
+            results.append({"operation": name, **measure(operations[name], calls, threads)})
+
+    show_results(results)
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlalchemy": sqlalchemy.__version__,
+            "database_type": args.database_type,
+            "clients": args.clients,
+            "messages_per_client": args.messages_per_client,
+            "closed_per_client": args.closed_per_client,
+            "seed_seconds": round(seed_seconds, 3) if seed_seconds is not None else None
+        },
+        "results": results
+    }
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            show_comparison(results, json.load(file))
+    if args.json_path == "-":
+        print(json.dumps(report, indent=2))
+    elif args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+        print(f"results written to {args.json_path}")
+
+    repository.engine.dispose()
+    if temporary:
+        temporary.cleanup()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Benchmark de latência de mensagens de texto durante uma rajada de áudios: transcrição inline
+nos mesmos workers versus faixa de texto separada e pool de transcrição dedicado
+
+Uso:
+    python -m benchmarks.bench_transcription --senders 50 --audio-ratio 0.3 --transcription-ms 300
+"""
+import argparse
+import io
+import logging
+import random
+import threading
+import time
+from typing import Dict, List
+
+from channel.dispatcher import KeyedDispatcher
+from observability import percentile
+from whatsapp.transcription import FakeTranscriber, TranscriptionPool
+
+def build_workload(senders: int, messages_per_sender: int, audio_ratio: float) -> List[Dict]:
+    workload = []
+    for index in range(senders * messages_per_sender):
+        sender = f"+55119{index % senders:08d}"
+        kind = "audio" if random.random() < audio_ratio else "text"
+        workload.append({"sender": sender, "kind": kind})
+    return workload
+
+def run(workload: List[Dict], transcriber: FakeTranscriber, workers: int, split: bool,
+        media_workers: int, transcription_workers: int) -> Dict[str, List[float]]:
+    latencies: Dict[str, List[float]] = {"text": [], "audio": []}
+    lock = threading.Lock()
+    pool = TranscriptionPool(max_workers=transcription_workers, max_pending=len(workload)) if split else None
+
+    def handle(items: List[Dict]):
+        # Como em respond_to_contexts: os áudios do lote são agendados antes de processar em ordem
+        futures = {
+            id(item): pool.submit(transcriber, io.BytesIO(b"\0" * 1024), "bench.ogg")
+            for item in items if pool and item["kind"] == "audio"
+        }
+        for item in items:
+            if item["kind"] == "audio":
+                if pool:
+                    pool.result(futures[id(item)])
+                else:
+                    transcriber(io.BytesIO(b"\0" * 1024), "bench.ogg")
+            with lock:
+                latencies[item["kind"]].append((time.monotonic() - item["submitted_at"]) * 1000)
+
+    text_lane = KeyedDispatcher(handle, num_workers=workers, max_queue_size=len(workload), name="bench-text")
+    media_lane = KeyedDispatcher(handle, num_workers=media_workers, max_queue_size=len(workload), name="bench-media") if split else text_lane
+    text_lane.start()
+    if split:
+        media_lane.start()
+
+    for item in workload:
+        item = dict(item, submitted_at=time.monotonic())
+        lane = media_lane if item["kind"] == "audio" else text_lane
+        lane.submit(item["sender"], item)
+
+    text_lane.join()
+    media_lane.join()
+    text_lane.stop()
+    if split:
+        media_lane.stop()
+        pool.shutdown()
+    return latencies
+
+def report(name: str, latencies: Dict[str, List[float]]):
+    for kind in ("text", "audio"):
+        values = sorted(latencies[kind])
+        print(f"{name:>7} {kind:>5}: n={len(values):4d} p50={percentile(values, 0.5):8.1f}ms "
+              f"p95={percentile(values, 0.95):8.1f}ms max={max(values, default=0):8.1f}ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do pool de transcrição")
+    parser.add_argument("--senders", type=int, default=50)
+    parser.add_argument("--messages-per-sender", type=int, default=4)
+    parser.add_argument("--audio-ratio", type=float, default=0.3)
+    parser.add_argument("--transcription-ms", type=float, default=300.0)
+    parser.add_argument("--workers", type=int, default=4, help="Workers da faixa de texto (e do modo inline)")
+    parser.add_argument("--media-workers", type=int, default=2)
+    parser.add_argument("--transcription-workers", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    random.seed(args.seed)
+    workload = build_workload(args.senders, args.messages_per_sender, args.audio_ratio)
+    transcriber = FakeTranscriber(args.transcription_ms)
+
+    print(f"messages={len(workload)} audio_ratio={args.audio_ratio} transcription_ms={args.transcription_ms}")
+    report("inline", run(workload, transcriber, args.workers, False, args.media_workers, args.transcription_workers))
+    report("split", run(workload, transcriber, args.workers, True, args.media_workers, args.transcription_workers))
+
+if __name__ == "__main__":
+    main()
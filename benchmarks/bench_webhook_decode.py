@@ -0,0 +1,118 @@
+"""
+Benchmark de decodificação e validação do /webhook com payloads representativos da Meta:
+rota antiga (`data: dict` + Payload(**data) + json.dumps em DEBUG) versus corpo bruto
+validado por TypeAdapter.validate_json
+
+Uso:
+    python -m benchmarks.bench_webhook_decode --requests 3000
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+from typing import Callable, Dict
+
+import httpx
+from fastapi import FastAPI, Request
+
+from whatsapp.webhook_handler import PAYLOAD_ADAPTER, json_response, orjson
+from whatsapp.whatsapp_models import Payload
+
+METADATA = {"display_phone_number": "15551234567", "phone_number_id": "123456789"}
+
+def text_message(index: int) -> Dict:
+    return {
+        "from": f"5511{index:09d}",
+        "id": f"wamid.HBgNNTUxMTk5OTk5OTk5ORUCABIYFDNBMEI{index:012d}",
+        "timestamp": str(int(time.time())),
+        "type": "text",
+        "text": {"body": "Olá, gostaria de saber o status do meu pedido número 12345"}
+    }
+
+def build_payload(messages: int = 0, statuses: int = 0) -> Dict:
+    value = {"messaging_product": "whatsapp", "metadata": METADATA}
+    if messages:
+        value["contacts"] = [{"profile": {"name": f"Cliente {i}"}, "wa_id": f"5511{i:09d}"} for i in range(messages)]
+        value["messages"] = [text_message(i) for i in range(messages)]
+    if statuses:
+        value["statuses"] = [
+            {
+                "id": f"wamid.HBgNNTUxMTk5OTk5OTk5ORUCABEYEjQ{i:012d}",
+                "status": "delivered",
+                "timestamp": str(int(time.time())),
+                "recipient_id": f"5511{i:09d}",
+                "conversation": {"id": "c0ffee", "origin": {"type": "service"}},
+                "pricing": {"billable": True, "pricing_model": "CBP", "category": "service"}
+            }
+            for i in range(statuses)
+        ]
+    return {
+        "object": "whatsapp_business_account",
+        "entry": [{"id": "102290129340398", "changes": [{"field": "messages", "value": value}]}]
+    }
+
+SCENARIOS = {
+    "single text": build_payload(messages=1),
+    "batch 10 texts": build_payload(messages=10),
+    "statuses 20": build_payload(statuses=20)
+}
+
+def build_app(debug: bool) -> FastAPI:
+    """Rotas com apenas a etapa de decodificação/validação de cada abordagem"""
+    app = FastAPI()
+
+    @app.post("/old")
+    async def old_route(data: dict):
+        if debug:
+            json.dumps(data, indent=2)
+        payload = Payload(**data)
+        return {"entries": len(payload.entry)}
+
+    @app.post("/new")
+    async def new_route(request: Request):
+        body = await request.body()
+        if debug:
+            body[:2000].decode("utf-8", "replace")
+        payload = PAYLOAD_ADAPTER.validate_json(body)
+        return json_response({"entries": len(payload.entry)})
+
+    return app
+
+async def requests_per_second(app: FastAPI, path: str, body: bytes, total: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        headers = {"content-type": "application/json"}
+        await client.post(path, content=body, headers=headers)
+        start = time.perf_counter()
+        for _ in range(total):
+            await client.post(path, content=body, headers=headers)
+        return total / (time.perf_counter() - start)
+
+def decode_per_second(func: Callable[[bytes], object], body: bytes, total: int) -> float:
+    func(body)
+    start = time.perf_counter()
+    for _ in range(total):
+        func(body)
+    return total / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de decodificação do webhook")
+    parser.add_argument("--requests", type=int, default=3000, help="Requisições por cenário")
+    parser.add_argument("--debug", action="store_true", help="Inclui o log do payload (modo DEBUG)")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    app = build_app(args.debug)
+    print(f"requests={args.requests} debug={args.debug} orjson={'yes' if orjson else 'no'}")
+    for name, data in SCENARIOS.items():
+        body = json.dumps(data).encode("utf-8")
+        old_decode = decode_per_second(lambda raw: Payload(**json.loads(raw)), body, args.requests)
+        new_decode = decode_per_second(PAYLOAD_ADAPTER.validate_json, body, args.requests)
+        old_rps = asyncio.run(requests_per_second(app, "/old", body, args.requests))
+        new_rps = asyncio.run(requests_per_second(app, "/new", body, args.requests))
+        print(f"{name:>15} ({len(body):5d} B): decode old={old_decode:9.0f}/s new={new_decode:9.0f}/s | "
+              f"http old={old_rps:7.0f} req/s new={new_rps:7.0f} req/s")
+
+if __name__ == "__main__":
+    main()
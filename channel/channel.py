@@ -1,12 +1,442 @@
+import time
+import logging
 from abc import ABC, abstractmethod
-from typing import Any, Dict, Optional
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+
+from channel.pipeline import StageTimer
+from channel.response_engine import ResponseEngineRunner, ResponseTimeoutError, TemplateResponseEngine
+from conversation.models import MessageData, MessageOwner
+from observability import log_event
+from observability.metrics import ERRORS_TOTAL, MESSAGES_TOTAL
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
 
 class Channel(ABC):
+    """
+    Pipeline em estágios compartilhado pelos canais:
+    parse → dedup → auth → extract → generate → persist → send
+
+    Os canais implementam apenas o parse do payload, a autenticação dos remetentes,
+    a extração de mídia e a entrega da resposta; os demais estágios (e a medição
+    de cada um em `stages`) são comuns, então caches e lotes ficam em um só lugar.
+
+    O pipeline tem duas metades: `admit_messages` (dedup e auth, no recebimento) e
+    `respond_to_contexts` (extract em diante). Entre elas o canal pode usar uma fila
+    durável; sem fila, `respond_and_send_message` executa as duas em sequência.
+    """
+
+    # Nome do canal gravado nas mensagens
+    name = "default"
+    # Modelo do contexto validado (message, user, content, message_timestamp, received_at)
+    context_model: Type = None
+    # Erros de extração transitórios: a mensagem é marcada para nova tentativa
+    retryable_errors: Tuple[Type[Exception], ...] = ()
+
+    def __init__(self, conversation_service, response_engine: ResponseEngineRunner = None,
+                 deduplicator=None, stage_timer: StageTimer = None):
+        self.conversation_service = conversation_service
+        # Sem motor configurado as respostas usam os templates fixos
+        self.response_engine = response_engine
+        # Sem deduplicador todas as mensagens são consideradas novas
+        self.deduplicator = deduplicator
+        self.stages = stage_timer or StageTimer(channel=self.name)
+        self.MESSAGE_EXPIRY_MINUTES = settings.MESSAGE_EXPIRY_MINUTES
+
+    # Estágios específicos de cada canal
+
     @abstractmethod
-    def respond_and_send_message(self, payload: Any, channel: str = "default") -> Dict:
-        """Processa uma mensagem e retorna resultado"""
-        pass
+    def parse_messages(self, payload: Any) -> List[Any]:
+        """Extrai as mensagens do payload"""
+
+    @abstractmethod
+    def get_users(self, senders: List[str]) -> Dict[str, Any]:
+        """Autentica os remetentes de um lote (remetente → usuário)"""
 
     @abstractmethod
     def extract_message_content(self, message: Any) -> Optional[str]:
-        pass
\ No newline at end of file
+        """Extrai o conteúdo da mensagem baseado no tipo"""
+
+    @abstractmethod
+    def deliver(self, message: Any, user: Any, response: str) -> Optional[str]:
+        """Entrega a resposta persistida; retorna o status do envio (None quando não há envio)"""
+
+    def prepare_extraction(self, contexts: List[Any]) -> Dict[int, Future]:
+        """Agenda extrações lentas do lote de uma vez (ex: transcrições); índice → Future"""
+        return {}
+
+    def wait_extraction(self, future: Future) -> Optional[str]:
+        return future.result()
+
+    # Estágios compartilhados
+
+    def is_message_too_old(self, message_timestamp: str, max_age_minutes: int = None) -> bool:
+        """
+        Verifica se uma mensagem é muito antiga para ser processada.
+
+        Args:
+            message_timestamp: Timestamp da mensagem (string ou int/float)
+            max_age_minutes: Idade máxima em minutos antes de considerar muito antiga
+
+        Returns:
+            bool: True se a mensagem for muito antiga, False caso contrário
+        """
+        if max_age_minutes is None:
+            max_age_minutes = self.MESSAGE_EXPIRY_MINUTES
+
+        try:
+            message_time = float(message_timestamp)
+        except (ValueError, TypeError):
+            # Se não conseguir fazer parse do timestamp, considerar muito antigo por segurança
+            return True
+
+        return (time.time() - message_time) / 60 > max_age_minutes
+
+    def generate_response(self, user_message: str, user: Any) -> str:
+        """Gera uma resposta para a mensagem do usuário pelo motor de resposta configurado"""
+        if self.response_engine is None:
+            return TemplateResponseEngine.render(user_message, user)
+        return self.response_engine.generate(user_message, user, self.history_loader(user))
+
+    def submit_response(self, user_message: str, user: Any, previous_turns: List[Dict] = None) -> Future:
+        """
+        Agenda a geração no motor de resposta; as gerações de um lote rodam concorrentemente
+
+        `previous_turns` são perguntas e respostas do mesmo remetente ainda não persistidas
+        (mensagens anteriores do mesmo lote), acrescentadas ao histórico carregado do banco.
+        """
+        if self.response_engine is None:
+            future = Future()
+            future.set_result(TemplateResponseEngine.render(user_message, user))
+            return future
+        return self.response_engine.submit(user_message, user, self.history_loader(user, previous_turns))
+
+    def history_loader(self, user: Any, previous_turns: List[Dict] = None) -> Optional[Callable[[], List[Dict]]]:
+        """Carrega o histórico recente da conversa (executado em paralelo com a geração)"""
+        limit = settings.RESPONSE_HISTORY_LIMIT
+        if not limit:
+            return None
+
+        def load() -> List[Dict]:
+            history = self.conversation_service.get_conversation_history(client_hub=f"user_{user.id}", limit=limit)
+            return (history + previous_turns)[-limit:] if previous_turns else history
+        return load
+
+    def parse(self, payload: Any) -> List[Any]:
+        with self.stages.stage("parse"):
+            return self.parse_messages(payload)
+
+    def build_message_context(self, message: Any, users: Dict[str, Any]) -> Tuple[Optional[Any], Optional[Dict]]:
+        """
+        Valida uma mensagem uma única vez (idade, usuário e conteúdo de texto)
+
+        Mídia não é processada aqui: é extraída uma única vez no estágio extract.
+
+        Returns:
+            (context, error) - error é None quando a mensagem pode ser processada
+        """
+        try:
+            message_timestamp = float(message.timestamp)
+        except (ValueError, TypeError):
+            message_timestamp = None
+
+        if message_timestamp is None or self.is_message_too_old(message_timestamp):
+            logger.warning(f"Message too old: {message.timestamp}")
+            return None, {
+                "status": "expired",
+                "error": "Message is too old to be processed",
+                "max_age_minutes": self.MESSAGE_EXPIRY_MINUTES
+            }
+
+        user = users.get(message.from_)
+        if not user:
+            logger.warning(f"User not found for sender: {message.from_}")
+            return None, {"status": "user_not_found", "error": "User not found"}
+
+        content = message.text.body if message.type == "text" and message.text else None
+        has_media = (message.type == "audio" and message.audio) or (message.type == "image" and message.image)
+        if not content and not has_media:
+            logger.warning("No message content found")
+            return None, {"status": "no_content", "error": "No message content found"}
+
+        return self.context_model(
+            message=message,
+            user=user,
+            content=content,
+            message_timestamp=message_timestamp,
+            received_at=time.time()
+        ), None
+
+    def admit_messages(self, messages: List[Any]) -> List[Tuple[Any, Optional[Any], Optional[Dict]]]:
+        """
+        Estágios dedup e auth de um lote: reentregas são descartadas e os remetentes
+        autenticados em uma única consulta
+
+        Returns:
+            (message, context, error) para cada mensagem, na ordem recebida
+        """
+        message_ids = [message.id for message in messages]
+        with self.stages.stage("dedup", len(messages)):
+            new_ids = self.deduplicator.filter_new(message_ids, channel=self.name) if self.deduplicator else set(message_ids)
+
+        claimed = list(new_ids)
+        try:
+            with self.stages.stage("auth", len(new_ids)):
+                users = self.get_users([message.from_ for message in messages if message.id in new_ids])
+                admitted = []
+                for message in messages:
+                    if message.id not in new_ids:
+                        admitted.append((message, None, {"status": "duplicate"}))
+                        continue
+                    # IDs repetidos no mesmo lote são processados uma única vez
+                    new_ids.discard(message.id)
+                    context, error = self.build_message_context(message, users)
+                    admitted.append((message, context, error))
+        except Exception:
+            # Falha depois da reivindicação: libera os IDs para que a reentrega seja aceita
+            self.release_messages(claimed)
+            raise
+        return admitted
+
+    def release_messages(self, message_ids: List[str]):
+        """Esquece IDs reivindicados no dedup cujo processamento não pôde ser garantido"""
+        if self.deduplicator and message_ids:
+            self.deduplicator.release(message_ids, channel=self.name)
+
+    def respond_to_contexts(self, contexts: List[Any], channel: str = None, strict_order: bool = False) -> Dict:
+        """
+        Estágios extract → generate → persist → send de um lote de mensagens já validadas
+
+        Remetentes diferentes são respondidos concorrentemente; as mensagens do mesmo
+        remetente são geradas em sequência, cada uma com as anteriores do lote no histórico.
+        Perguntas e respostas são persistidas em uma única escrita em lote, na ordem do lote.
+
+        Com `strict_order` (fila durável), depois de uma falha com nova tentativa as mensagens
+        seguintes do mesmo remetente no lote não são respondidas: voltam como `deferred`
+        para serem processadas depois da mensagem que falhou.
+        """
+        channel = channel or self.name
+        start_time = time.time()
+        results: List[Dict] = [{} for _ in contexts]
+        ready = []
+        processed = []
+        # Índice da primeira falha com nova tentativa de cada remetente
+        failed_at: Dict[str, int] = {}
+
+        def deferred(index: int, message: Any) -> bool:
+            if not strict_order or failed_at.get(message.from_, index) >= index:
+                return False
+            results[index] = {
+                "message_id": message.id,
+                "status": "deferred",
+                "message": "Waiting for an earlier message from the same sender",
+                "retryable": True
+            }
+            return True
+
+        # O estágio extract é registrado uma única vez por lote: preparação mais as esperas
+        pending: Dict[int, Future] = {}
+        media = [context for context in contexts if not context.content]
+        extract_seconds = 0.0
+        if media:
+            extract_start = time.perf_counter()
+            try:
+                pending = self.prepare_extraction(contexts)
+            finally:
+                extract_seconds += time.perf_counter() - extract_start
+
+        for index, context in enumerate(contexts):
+            message, user = context.message, context.user
+            if deferred(index, message):
+                continue
+            try:
+                if context.content:
+                    message_content = context.content
+                else:
+                    extract_start = time.perf_counter()
+                    try:
+                        if index in pending:
+                            message_content = self.wait_extraction(pending[index])
+                        else:
+                            message_content = self.extract_message_content(message)
+                    finally:
+                        extract_seconds += time.perf_counter() - extract_start
+                if not message_content:
+                    logger.warning("No message content found")
+                    results[index] = {"message_id": message.id, "status": "no_content", "error": "No message content found"}
+                    continue
+
+                log_event(logger, "message.received", user_id=user.id, type=message.type, chars=len(message_content))
+                ready.append((index, message, user, message_content))
+
+            except self.retryable_errors as e:
+                # Extração indisponível no momento: a mensagem volta para a fila com backoff
+                logger.warning(f"Content unavailable for message {message.id}: {e}")
+                results[index] = {"message_id": message.id, "status": "error", "message": str(e), "retryable": True}
+                failed_at.setdefault(message.from_, index)
+            except ValueError as e:
+                logger.error(f"Validation error: {e}")
+                results[index] = {"message_id": message.id, "status": "error", "message": str(e)}
+            except Exception as e:
+                logger.error(f"Unexpected error processing message {message.id}: {e}", exc_info=True)
+                results[index] = {"message_id": message.id, "status": "error", "message": "Internal server error", "retryable": True}
+                failed_at.setdefault(message.from_, index)
+        if media:
+            self.stages.record("extract", extract_seconds, len(media))
+
+        # Rodadas de geração: a rodada N gera a N-ésima mensagem de cada remetente (concorrentemente,
+        # limitadas pelo motor), com as perguntas e respostas das rodadas anteriores no histórico
+        by_sender: Dict[str, List[Tuple]] = {}
+        for item in ready:
+            by_sender.setdefault(item[1].from_, []).append(item)
+        batch_turns: Dict[str, List[Dict]] = {}
+        responses: Dict[int, str] = {}
+        generate_start = time.perf_counter()
+        generated = 0
+        for position in range(max((len(items) for items in by_sender.values()), default=0)):
+            generating = []
+            for items in by_sender.values():
+                if position >= len(items):
+                    continue
+                index, message, user, message_content = items[position]
+                if deferred(index, message):
+                    continue
+                previous_turns = batch_turns.get(message.from_)
+                generating.append((items[position], self.submit_response(message_content, user, previous_turns)))
+
+            for (index, message, user, message_content), future in generating:
+                generated += 1
+                try:
+                    response = self.response_engine.result(future) if self.response_engine else future.result()
+                except ResponseTimeoutError as e:
+                    logger.warning(f"Response generation timed out for message {message.id}: {e}")
+                    results[index] = {"message_id": message.id, "status": "error", "message": str(e), "retryable": True}
+                    failed_at.setdefault(message.from_, index)
+                    continue
+                except Exception as e:
+                    logger.error(f"Unexpected error generating response for message {message.id}: {e}", exc_info=True)
+                    results[index] = {"message_id": message.id, "status": "error", "message": "Internal server error", "retryable": True}
+                    failed_at.setdefault(message.from_, index)
+                    continue
+                responses[index] = response
+                batch_turns.setdefault(message.from_, []).extend([
+                    {"owner": MessageOwner.USER.value, "message": message_content},
+                    {"owner": MessageOwner.AGENT.value, "message": response}
+                ])
+        if generated:
+            self.stages.record("generate", time.perf_counter() - generate_start, generated)
+
+        # Pergunta e resposta são gravadas intercaladas, na ordem do lote
+        agent_type = self.response_engine.engine.name if self.response_engine else "local_agent"
+        to_persist = []
+        for index, message, user, message_content in ready:
+            if index not in responses:
+                continue
+            response = responses[index]
+            client_hub = f"user_{user.id}"
+            to_persist.append((client_hub, channel, MessageData(
+                message=message_content,
+                type=message.type,
+                owner=MessageOwner.USER,
+                meta={"original_message_id": message.id},
+                channel=channel
+            )))
+            to_persist.append((client_hub, channel, MessageData(
+                message=response,
+                type=message.type,
+                owner=MessageOwner.AGENT,
+                meta={"agent_type": agent_type, "response_to": message.id},
+                channel=channel
+            )))
+            processed.append((index, message, user, response))
+
+        try:
+            with self.stages.stage("persist", len(to_persist)):
+                saved = self.conversation_service.add_messages_batch(to_persist) if to_persist else []
+        except Exception as e:
+            logger.error(f"Unexpected error persisting message batch: {e}", exc_info=True)
+            for index, message, _, _ in processed:
+                results[index] = {"message_id": message.id, "status": "error", "message": "Internal server error", "retryable": True}
+            saved = []
+            processed = []
+
+        with self.stages.stage("send", len(processed)):
+            for position, (index, message, user, response) in enumerate(processed):
+                conversation_uuid, user_message_dict, _ = saved[2 * position]
+                _, agent_message_dict, _ = saved[2 * position + 1]
+                results[index] = {
+                    "message_id": message.id,
+                    "status": "processed",
+                    "user": {
+                        "id": user.id,
+                        "name": f"{user.first_name} {user.last_name}"
+                    },
+                    "conversation_uuid": conversation_uuid,
+                    "user_message": user_message_dict,
+                    "agent_response": agent_message_dict,
+                    "response_text": response
+                }
+                send_status = self.deliver(message, user, response)
+                if send_status is not None:
+                    results[index]["send_status"] = send_status
+
+        for result in results:
+            status = result.get("status", "unknown")
+            MESSAGES_TOTAL.labels(channel, status).inc()
+            if status == "error":
+                ERRORS_TOTAL.labels("pipeline").inc()
+
+        processing_time = round((time.time() - start_time) * 1000, 2)
+        log_event(logger, "batch.processed", total=len(contexts), answered=len(processed), ms=processing_time)
+
+        return {
+            "status": "processed" if processed else "not_processed",
+            "total": len(contexts),
+            "processed": len(processed),
+            "results": results,
+            "processing_time_ms": processing_time
+        }
+
+    def respond_to_messages(self, messages: List[Any], channel: str = None) -> Dict:
+        """Executa o pipeline completo sobre um lote de mensagens brutas"""
+        start_time = time.time()
+        results: List[Dict] = [{} for _ in messages]
+        contexts = []
+        positions = []
+
+        for index, (message, context, error) in enumerate(self.admit_messages(messages)):
+            if error:
+                results[index] = {"message_id": message.id, **error}
+            else:
+                contexts.append(context)
+                positions.append(index)
+
+        batch_result = self.respond_to_contexts(contexts, channel=channel)
+        for index, result in zip(positions, batch_result["results"]):
+            results[index] = result
+
+        return {
+            "status": batch_result["status"],
+            "total": len(messages),
+            "processed": batch_result["processed"],
+            "results": results,
+            "processing_time_ms": round((time.time() - start_time) * 1000, 2)
+        }
+
+    def respond_and_send_message(self, payload: Any, channel: str = None) -> Dict:
+        """Processa todas as mensagens do payload e gera as respostas"""
+        try:
+            messages = self.parse(payload)
+            if not messages:
+                logger.warning("No message found in payload")
+                return {"status": "no_message", "error": "No message found in payload"}
+
+            return self.respond_to_messages(messages, channel=channel)
+
+        except Exception as e:
+            logger.error(f"Unexpected error processing message: {e}", exc_info=True)
+            return {"status": "error", "message": "Internal server error"}
+
+    def stage_stats(self) -> Dict[str, Dict]:
+        return self.stages.stats()
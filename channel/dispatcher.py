@@ -0,0 +1,141 @@
+"""
+Dispatcher por chave: ordem estrita dentro de uma chave, chaves diferentes em paralelo
+"""
+import logging
+import queue
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, List, Optional
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+class DispatcherFullError(Exception):
+    """Exceção quando a fila do worker responsável pela chave está cheia"""
+    def __init__(self, key: str, worker_index: int):
+        self.key = key
+        self.worker_index = worker_index
+        super().__init__(f"Dispatcher queue {worker_index} is full (key {key})")
+
+class _WorkerLane:
+    """Fila limitada e métricas de um worker"""
+
+    def __init__(self, max_queue_size: int):
+        self.queue: "queue.Queue" = queue.Queue(maxsize=max_queue_size)
+        self.processed = 0
+        self.last_lag_ms = 0.0
+        self.max_lag_ms = 0.0
+        self.thread: Optional[threading.Thread] = None
+
+class KeyedDispatcher:
+    """
+    Distribui itens em N filas pelo hash da chave (ex: telefone do remetente)
+
+    Cada fila é consumida por uma única thread, então itens com a mesma chave são
+    processados na ordem de submissão; chaves diferentes rodam em paralelo.
+    O handler recebe lotes (até max_batch_size itens já disponíveis na fila).
+    """
+
+    def __init__(self, handler: Callable[[List[Any]], None], num_workers: int = 4,
+                 max_queue_size: int = 100, max_batch_size: int = 20, name: str = "dispatcher"):
+        self.handler = handler
+        self.num_workers = num_workers
+        self.max_batch_size = max_batch_size
+        self.name = name
+        self._lanes = [_WorkerLane(max_queue_size) for _ in range(num_workers)]
+        self._stop_event = threading.Event()
+
+    def worker_index(self, key: str) -> int:
+        """Índice da fila responsável pela chave (estável entre processos)"""
+        return zlib.crc32(key.encode("utf-8")) % self.num_workers
+
+    def submit(self, key: str, item: Any, timeout: Optional[float] = None):
+        """
+        Enfileira um item na fila da chave
+
+        Bloqueia enquanto a fila estiver cheia (backpressure); com timeout,
+        levanta DispatcherFullError se não houver espaço a tempo.
+        """
+        index = self.worker_index(key)
+        try:
+            self._lanes[index].queue.put((time.monotonic(), item), timeout=timeout)
+        except queue.Full:
+            raise DispatcherFullError(key, index)
+
+    def start(self):
+        """Inicia uma thread por fila"""
+        self._stop_event.clear()
+        for index, lane in enumerate(self._lanes):
+            if lane.thread and lane.thread.is_alive():
+                continue
+            lane.thread = threading.Thread(target=self._run, args=(lane,), name=f"{self.name}-{index}", daemon=True)
+            lane.thread.start()
+        logger.info(f"{self.name} started with {self.num_workers} workers")
+
+    def stop(self, drain: bool = True, timeout: float = 10.0):
+        """Para os workers; com drain=True processa antes o que já está nas filas"""
+        if drain:
+            deadline = time.monotonic() + timeout
+            while self.pending() and time.monotonic() < deadline:
+                time.sleep(0.05)
+        self._stop_event.set()
+        for lane in self._lanes:
+            if lane.thread:
+                lane.thread.join(max(0.0, timeout))
+                lane.thread = None
+        logger.info(f"{self.name} stopped ({self.pending()} items left in queues)")
+
+    def join(self):
+        """Aguarda até que todos os itens submetidos tenham sido processados"""
+        for lane in self._lanes:
+            lane.queue.join()
+
+    def pending(self) -> int:
+        """Total de itens aguardando nas filas"""
+        return sum(lane.queue.qsize() for lane in self._lanes)
+
+    def _run(self, lane: _WorkerLane):
+        while not self._stop_event.is_set():
+            try:
+                entries = [lane.queue.get(timeout=0.2)]
+            except queue.Empty:
+                continue
+
+            while len(entries) < self.max_batch_size:
+                try:
+                    entries.append(lane.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            now = time.monotonic()
+            lag_ms = (now - entries[0][0]) * 1000
+            lane.last_lag_ms = lag_ms
+            lane.max_lag_ms = max(lane.max_lag_ms, lag_ms)
+
+            try:
+                self.handler([item for _, item in entries])
+            except Exception as e:
+                logger.error(f"{self.name} handler error: {e}", exc_info=True)
+            finally:
+                lane.processed += len(entries)
+                for _ in entries:
+                    lane.queue.task_done()
+
+    def stats(self) -> Dict[str, Any]:
+        """Profundidade, lag (tempo em fila do item mais antigo do último lote) e itens processados por fila"""
+        return {
+            "workers": self.num_workers,
+            "pending": self.pending(),
+            "queues": [
+                {
+                    "index": index,
+                    "depth": lane.queue.qsize(),
+                    "capacity": lane.queue.maxsize,
+                    "last_lag_ms": round(lane.last_lag_ms, 2),
+                    "max_lag_ms": round(lane.max_lag_ms, 2),
+                    "processed": lane.processed
+                }
+                for index, lane in enumerate(self._lanes)
+            ]
+        }
@@ -0,0 +1,76 @@
+"""
+Medição dos estágios do pipeline compartilhado pelos canais
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+from observability.metrics import PIPELINE_STAGE_SECONDS, latency_summary
+
+# Ordem dos estágios: parse → dedup → auth → extract → generate → persist → send
+STAGES = ("parse", "dedup", "auth", "extract", "generate", "persist", "send")
+
+class StageTimer:
+    """
+    Duração das execuções recentes de cada estágio (janela deslizante por estágio)
+
+    Cada execução pode cobrir vários itens (ex: um lote de mensagens), então além
+    da latência por execução é reportado o custo médio por item.
+    """
+
+    def __init__(self, window: int = 1024, channel: Optional[str] = None):
+        self.window = window
+        # Com o nome do canal cada execução também é exportada no /metrics
+        self.channel = channel
+        self._durations: Dict[str, deque] = {stage: deque(maxlen=window) for stage in STAGES}
+        self._runs: Dict[str, int] = dict.fromkeys(STAGES, 0)
+        self._items: Dict[str, int] = dict.fromkeys(STAGES, 0)
+        self._total: Dict[str, float] = dict.fromkeys(STAGES, 0.0)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str, items: int = 1) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start, items)
+
+    def record(self, name: str, seconds: float, items: int = 1):
+        with self._lock:
+            if name not in self._durations:
+                self._durations[name] = deque(maxlen=self.window)
+                self._runs[name] = 0
+                self._items[name] = 0
+                self._total[name] = 0.0
+            self._durations[name].append(seconds)
+            self._runs[name] += 1
+            self._items[name] += items
+            self._total[name] += seconds
+        if self.channel:
+            PIPELINE_STAGE_SECONDS.labels(self.channel, name).observe(seconds)
+
+    def stats(self) -> Dict[str, Dict]:
+        with self._lock:
+            snapshot = {name: (list(durations), self._runs[name], self._items[name], self._total[name])
+                        for name, durations in self._durations.items()}
+
+        result = {}
+        for name, (durations, runs, items, total) in snapshot.items():
+            if not durations:
+                result[name] = {"runs": 0, "items": 0}
+                continue
+            # Percentis da janela recente; a média cobre todas as execuções
+            window = latency_summary(durations, scale=1000, digits=3)
+            result[name] = {
+                "runs": runs,
+                "items": items,
+                "avg_ms": round(total / runs * 1000, 3),
+                "per_item_ms": round(total / items * 1000, 3) if items else 0.0,
+                "p50_ms": window["p50_ms"],
+                "p95_ms": window["p95_ms"],
+                "max_ms": window["max_ms"]
+            }
+        return result
@@ -0,0 +1,120 @@
+"""
+Cache de respostas por correspondência exata da mensagem normalizada, com TTL e remoção LRU
+"""
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_message(message: str) -> str:
+    """Normaliza a mensagem para a chave: NFKC, caixa, espaços e pontuação final"""
+    text = unicodedata.normalize("NFKC", message or "").casefold()
+    return _WHITESPACE.sub(" ", text).strip().rstrip("!?.… ")
+
+def history_digest(history: List[Dict[str, Any]]) -> str:
+    """Hash dos turnos de histórico lidos pelo motor (autor e texto de cada turno)"""
+    digest = hashlib.sha256()
+    for item in history:
+        digest.update(repr((str(item.get("owner", "")), item.get("message", ""))).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+class ReplyCache:
+    """
+    Respostas geradas indexadas por mensagem normalizada + hash do contexto relevante
+
+    O contexto vem do motor de resposta (nome, modelo, campos do usuário usados na resposta)
+    e, para motores que leem o histórico, inclui o hash dos turnos recentes: respostas
+    personalizadas ou que dependem da conversa não vazam entre usuários. Apenas mensagens curtas
+    (`max_message_length`) são cacheadas: são as que se repetem ("oi", "menu", "1").
+    Entradas expiram após `ttl_seconds`; acima de `max_entries` a menos usada é removida.
+    Usuários em `opted_out_users` nunca leem nem gravam no cache.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 300.0, max_message_length: int = 64,
+                 opted_out_users: Iterable[Any] = ()):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_message_length = max_message_length
+        self._opted_out = {str(user_id) for user_id in opted_out_users}
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def accepts(self, message: str) -> bool:
+        """A mensagem é curta o bastante para o cache (sem contar como desvio)"""
+        normalized = normalize_message(message)
+        return bool(normalized) and len(normalized) <= self.max_message_length
+
+    def key(self, message: str, context: Tuple) -> Optional[str]:
+        """Chave da mensagem no contexto; None quando a mensagem não é cacheável"""
+        normalized = normalize_message(message)
+        if not normalized or len(normalized) > self.max_message_length:
+            with self._lock:
+                self.bypassed += 1
+            return None
+        context_hash = hashlib.sha256(repr(context).encode("utf-8")).hexdigest()[:16]
+        return f"{context_hash}:{normalized}"
+
+    def is_opted_out(self, user_id: Any) -> bool:
+        return str(user_id) in self._opted_out
+
+    def opt_out(self, user_id: Any):
+        self._opted_out.add(str(user_id))
+
+    def opt_in(self, user_id: Any):
+        self._opted_out.discard(str(user_id))
+
+    def bypass(self):
+        """Conta uma geração que não passou pelo cache (ex: usuário fora do cache)"""
+        with self._lock:
+            self.bypassed += 1
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: str, reply: str):
+        with self._lock:
+            self._entries[key] = (reply, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "bypassed": self.bypassed,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "opted_out_users": len(self._opted_out)
+        }
@@ -0,0 +1,427 @@
+"""
+Motores de geração de resposta assíncronos, com limite de concorrência, prazo e streaming de tokens
+"""
+import asyncio
+import contextvars
+import hashlib
+import logging
+import queue
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+from channel.reply_cache import ReplyCache, history_digest
+from observability.metrics import RESPONSE_GENERATION_SECONDS, latency_summary
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+HistoryLoader = Callable[[], List[Dict[str, Any]]]
+
+class ResponseEngineError(Exception):
+    """Exceção base dos motores de resposta"""
+    pass
+
+class ResponseTimeoutError(ResponseEngineError):
+    """Exceção quando a geração não termina dentro do prazo"""
+    def __init__(self, engine: str, timeout_seconds: float):
+        self.engine = engine
+        self.timeout_seconds = timeout_seconds
+        super().__init__(f"Response engine {engine} did not finish within {timeout_seconds}s")
+
+class ResponseEngine(ABC):
+    """
+    Interface dos motores de resposta
+
+    `generate` e `stream` limitam as chamadas simultâneas do motor a `max_concurrency`
+    (semáforo por motor) e aplicam `timeout_seconds` a cada chamada, incluindo a espera
+    pelo semáforo. O histórico da conversa chega como awaitable: o motor começa a trabalhar
+    enquanto o histórico é carregado e só o aguarda quando precisa dele.
+    """
+
+    name = "engine"
+    # Motores que não usam histórico evitam a consulta ao banco
+    uses_history = False
+    # Respostas podem ser reaproveitadas pelo cache de respostas (ReplyCache)
+    cacheable = True
+
+    def __init__(self, max_concurrency: int = 8, timeout_seconds: float = 30.0):
+        self.max_concurrency = max_concurrency
+        self.timeout_seconds = timeout_seconds
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._latencies_ms = deque(maxlen=1000)
+        self.in_flight = 0
+        self.waiting = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+
+    @abstractmethod
+    async def _generate(self, message: str, user: Any, history: Awaitable[List[Dict[str, Any]]]) -> str:
+        pass
+
+    def cache_context(self, user: Any) -> Tuple:
+        """Tudo além da mensagem que altera a resposta; compõe a chave do cache de respostas"""
+        return (self.name, user.first_name)
+
+    async def _stream(self, message: str, user: Any, history: Awaitable[List[Dict[str, Any]]]) -> AsyncIterator[str]:
+        """Motores sem streaming nativo entregam a resposta inteira como um único trecho"""
+        yield await self._generate(message, user, history)
+
+    @staticmethod
+    def _resolve_history(history: Optional[Awaitable]) -> Awaitable[List[Dict[str, Any]]]:
+        # Future já resolvido (e não uma corrotina) para que motores que ignoram o histórico não gerem avisos
+        if history is not None:
+            return history
+        future = asyncio.get_running_loop().create_future()
+        future.set_result([])
+        return future
+
+    async def generate(self, message: str, user: Any, history: Awaitable[List[Dict[str, Any]]] = None) -> str:
+        """Gera a resposta completa; levanta ResponseTimeoutError ao estourar o prazo"""
+        start = time.monotonic()
+        try:
+            return await asyncio.wait_for(self._guarded_generate(message, user, history), self.timeout_seconds)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise ResponseTimeoutError(self.name, self.timeout_seconds)
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            elapsed = time.monotonic() - start
+            self._latencies_ms.append(elapsed * 1000)
+            RESPONSE_GENERATION_SECONDS.labels(self.name).observe(elapsed)
+
+    async def _guarded_generate(self, message: str, user: Any, history: Optional[Awaitable]) -> str:
+        # O prazo pode cancelar a chamada ainda na fila do semáforo
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        try:
+            result = await self._generate(message, user, self._resolve_history(history))
+            self.completed += 1
+            return result
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    async def stream(self, message: str, user: Any, history: Awaitable[List[Dict[str, Any]]] = None) -> AsyncIterator[str]:
+        """Entrega a resposta em trechos; o prazo vale para a geração inteira"""
+        deadline = time.monotonic() + self.timeout_seconds
+        start = time.monotonic()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout_seconds)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise ResponseTimeoutError(self.name, self.timeout_seconds)
+        finally:
+            # Também quando quem consome o stream o cancela durante a espera
+            self.waiting -= 1
+        self.in_flight += 1
+        chunks = self._stream(message, user, self._resolve_history(history))
+        try:
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), max(0.0, deadline - time.monotonic()))
+                except StopAsyncIteration:
+                    break
+                yield chunk
+            self.completed += 1
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise ResponseTimeoutError(self.name, self.timeout_seconds)
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            await chunks.aclose()
+            self.in_flight -= 1
+            self._semaphore.release()
+            elapsed = time.monotonic() - start
+            self._latencies_ms.append(elapsed * 1000)
+            RESPONSE_GENERATION_SECONDS.labels(self.name).observe(elapsed)
+
+    def stats(self) -> Dict[str, Any]:
+        latency = latency_summary(self._latencies_ms)
+        return {
+            "engine": self.name,
+            "max_concurrency": self.max_concurrency,
+            "timeout_seconds": self.timeout_seconds,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "completed": self.completed,
+            "failed": self.failed,
+            "timeouts": self.timeouts,
+            "latency": latency
+        }
+
+class TemplateResponseEngine(ResponseEngine):
+    """Respostas fixas escolhidas pelo tamanho da mensagem (comportamento original dos canais)"""
+
+    name = "template"
+    # Gerar é mais barato que consultar o cache
+    cacheable = False
+
+    RESPONSES = [
+        "Olá {first_name}! Recebi sua mensagem: '{message}'",
+        "Como posso ajudá-lo hoje?",
+        "Interessante! Me conte mais sobre isso.",
+        "Entendi. Há mais alguma coisa que gostaria de saber?",
+        "Obrigado pela mensagem. Vou processar isso para você."
+    ]
+
+    @classmethod
+    def render(cls, message: str, user: Any) -> str:
+        template = cls.RESPONSES[len(message) % len(cls.RESPONSES)]
+        return template.format(first_name=user.first_name, message=message)
+
+    async def _generate(self, message: str, user: Any, history: Awaitable[List[Dict[str, Any]]]) -> str:
+        return self.render(message, user)
+
+class StubResponseEngine(ResponseEngine):
+    """
+    Motor local determinístico para testes de carga: a mesma mensagem sempre gera a mesma
+    resposta, após `latency_ms` (tempo até o primeiro token) e `token_latency_ms` por token
+    """
+
+    name = "stub"
+    uses_history = True
+
+    def __init__(self, latency_ms: float = 300.0, token_latency_ms: float = 0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.latency_ms = latency_ms
+        self.token_latency_ms = token_latency_ms
+
+    def _answer(self, message: str, user: Any) -> str:
+        index = int(hashlib.sha256(message.encode("utf-8")).hexdigest(), 16) % len(TemplateResponseEngine.RESPONSES)
+        return TemplateResponseEngine.RESPONSES[index].format(first_name=user.first_name, message=message)
+
+    async def _stream(self, message: str, user: Any, history: Awaitable[List[Dict[str, Any]]]) -> AsyncIterator[str]:
+        # O histórico é aguardado em paralelo com o tempo até o primeiro token
+        await asyncio.gather(history, asyncio.sleep(self.latency_ms / 1000))
+        tokens = self._answer(message, user).split(" ")
+        for position, token in enumerate(tokens):
+            if self.token_latency_ms:
+                await asyncio.sleep(self.token_latency_ms / 1000)
+            yield token if position == len(tokens) - 1 else token + " "
+
+    async def _generate(self, message: str, user: Any, history: Awaitable[List[Dict[str, Any]]]) -> str:
+        return "".join([chunk async for chunk in self._stream(message, user, history)])
+
+class OpenAIResponseEngine(ResponseEngine):
+    """Chat Completions da OpenAI com o histórico recente da conversa como contexto"""
+
+    name = "openai"
+    uses_history = True
+
+    def __init__(self, client: Any, model: str, system_prompt: str = None, **kwargs):
+        super().__init__(**kwargs)
+        self.client = client
+        self.model = model
+        self.system_prompt = system_prompt
+
+    def cache_context(self, user: Any) -> Tuple:
+        # O usuário só chega ao modelo pelo histórico, que entra na chave pelo runner
+        return (self.name, self.model, self.system_prompt)
+
+    async def _messages(self, message: str, history: Awaitable[List[Dict[str, Any]]]) -> List[Dict[str, str]]:
+        messages = [{"role": "system", "content": self.system_prompt}] if self.system_prompt else []
+        for item in await history:
+            role = "assistant" if str(item.get("owner", "")).lower().endswith("agent") else "user"
+            messages.append({"role": role, "content": item.get("message", "")})
+        messages.append({"role": "user", "content": message})
+        return messages
+
+    async def _generate(self, message: str, user: Any, history: Awaitable[List[Dict[str, Any]]]) -> str:
+        completion = await self.client.chat.completions.create(model=self.model, messages=await self._messages(message, history))
+        return completion.choices[0].message.content or ""
+
+    async def _stream(self, message: str, user: Any, history: Awaitable[List[Dict[str, Any]]]) -> AsyncIterator[str]:
+        response = await self.client.chat.completions.create(
+            model=self.model, messages=await self._messages(message, history), stream=True
+        )
+        async for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+class ResponseEngineRunner:
+    """
+    Executa um motor de resposta a partir de código síncrono (workers da fila de entrada)
+
+    Um event loop dedicado roda em uma thread própria, então gerações de vários workers
+    rodam concorrentemente, limitadas pelo semáforo do motor. O histórico é carregado no
+    executor padrão do loop, em paralelo com a geração.
+
+    Com `reply_cache`, mensagens repetidas são respondidas sem chamar o motor, e pedidos
+    idênticos simultâneos compartilham uma única geração. Para motores que usam o histórico,
+    mensagens cacheáveis carregam o histórico antes da chave (que inclui o seu hash), e a
+    geração reaproveita o histórico já carregado.
+    """
+
+    def __init__(self, engine: ResponseEngine, reply_cache: ReplyCache = None):
+        self.engine = engine
+        self.reply_cache = reply_cache
+        self._pending: Dict[str, Future] = {}
+        self._pending_lock = threading.Lock()
+        self.coalesced = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        """Inicia o event loop do motor (chamado automaticamente na primeira geração)"""
+        with self._start_lock:
+            if self._thread:
+                return
+
+            ready = threading.Event()
+
+            def run():
+                self._loop = asyncio.new_event_loop()
+                asyncio.set_event_loop(self._loop)
+                ready.set()
+                self._loop.run_forever()
+
+            self._thread = threading.Thread(target=run, name=f"response-engine-{self.engine.name}", daemon=True)
+            self._thread.start()
+            ready.wait()
+            logger.info(f"Response engine {self.engine.name} started (max concurrency {self.engine.max_concurrency})")
+
+    def stop(self, timeout: float = 5.0):
+        if not self._thread:
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
+        self._thread = None
+        logger.info(f"Response engine {self.engine.name} stopped")
+
+    def _history(self, load_history: Optional[HistoryLoader], context: contextvars.Context) -> Optional[Awaitable]:
+        if load_history is None or not self.engine.uses_history:
+            return None
+        # O executor não propaga contextvars: a consulta roda no contexto de quem agendou a
+        # geração (ex: escopo de track_queries do job), capturado na thread do chamador
+        return self._loop.run_in_executor(None, context.run, load_history)
+
+    def _cache_key(self, message: str, user: Any,
+                   load_history: Optional[HistoryLoader]) -> Tuple[Optional[str], Optional[HistoryLoader]]:
+        """Chave do cache e o carregador de histórico a usar na geração"""
+        if self.reply_cache is None or not self.engine.cacheable:
+            return None, load_history
+        if self.reply_cache.is_opted_out(user.id):
+            self.reply_cache.bypass()
+            return None, load_history
+
+        context = self.engine.cache_context(user)
+        if self.engine.uses_history and load_history is not None and self.reply_cache.accepts(message):
+            # A resposta depende da conversa ("1", "sim" respondem à pergunta anterior)
+            history = load_history()
+            context += (history_digest(history),)
+            load_history = lambda: history
+        return self.reply_cache.key(message, context), load_history
+
+    def _store(self, key: str, future: Future):
+        if not future.cancelled() and future.exception() is None:
+            self.reply_cache.put(key, future.result())
+        with self._pending_lock:
+            self._pending.pop(key, None)
+
+    def submit(self, message: str, user: Any, load_history: HistoryLoader = None) -> Future:
+        """Agenda a geração e retorna um Future com a resposta (já resolvido em acertos do cache)"""
+        key, load_history = self._cache_key(message, user, load_history)
+        if key is None:
+            return self._submit(message, user, load_history)
+
+        cached = self.reply_cache.get(key)
+        if cached is not None:
+            future = Future()
+            future.set_result(cached)
+            return future
+
+        with self._pending_lock:
+            future = self._pending.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future
+            future = self._submit(message, user, load_history)
+            self._pending[key] = future
+        future.add_done_callback(lambda done: self._store(key, done))
+        return future
+
+    def _submit(self, message: str, user: Any, load_history: Optional[HistoryLoader]) -> Future:
+        self.start()
+        # A corrotina já herda o contexto do chamador (call_soon_threadsafe); a cópia é do histórico
+        context = contextvars.copy_context()
+
+        async def generate():
+            return await self.engine.generate(message, user, self._history(load_history, context))
+
+        return asyncio.run_coroutine_threadsafe(generate(), self._loop)
+
+    def generate(self, message: str, user: Any, load_history: HistoryLoader = None) -> str:
+        """Gera a resposta bloqueando até o resultado (ou ResponseTimeoutError)"""
+        return self.result(self.submit(message, user, load_history))
+
+    def result(self, future: Future) -> str:
+        # O prazo é aplicado dentro do loop; a margem cobre apenas um loop travado
+        return future.result(timeout=self.engine.timeout_seconds + 5)
+
+    def stream(self, message: str, user: Any, load_history: HistoryLoader = None) -> Iterator[str]:
+        """Itera sobre os trechos da resposta à medida que são gerados"""
+        key, load_history = self._cache_key(message, user, load_history)
+        cached = self.reply_cache.get(key) if key is not None else None
+        if cached is not None:
+            yield cached
+            return
+
+        self.start()
+        chunks: "queue.Queue" = queue.Queue()
+        done = object()
+        context = contextvars.copy_context()
+
+        async def produce():
+            try:
+                async for chunk in self.engine.stream(message, user, self._history(load_history, context)):
+                    chunks.put(chunk)
+            except Exception as e:
+                chunks.put(e)
+            finally:
+                chunks.put(done)
+
+        asyncio.run_coroutine_threadsafe(produce(), self._loop)
+        streamed = []
+        while True:
+            item = chunks.get(timeout=self.engine.timeout_seconds + 5)
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                raise item
+            streamed.append(item)
+            yield item
+        if key is not None:
+            self.reply_cache.put(key, "".join(streamed))
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.engine.stats()
+        if self.reply_cache is not None:
+            stats["reply_cache"] = {**self.reply_cache.stats(), "coalesced": self.coalesced}
+        return stats
+
+def create_response_engine(kind: str, max_concurrency: int = 8, timeout_seconds: float = 30.0,
+                           stub_latency_ms: float = 300.0, stub_token_latency_ms: float = 0.0,
+                           openai_model: str = "gpt-4o-mini", system_prompt: str = None) -> ResponseEngine:
+    """Cria o motor configurado: template (padrão), stub ou openai"""
+    limits = {"max_concurrency": max_concurrency, "timeout_seconds": timeout_seconds}
+    if kind == "stub":
+        return StubResponseEngine(latency_ms=stub_latency_ms, token_latency_ms=stub_token_latency_ms, **limits)
+    if kind == "openai":
+        from openai import AsyncOpenAI
+        return OpenAIResponseEngine(AsyncOpenAI(), openai_model, system_prompt=system_prompt, **limits)
+    return TemplateResponseEngine(**limits)
@@ -16,19 +16,129 @@ class Settings:
     WHATSAPP_API_TOKEN: str = os.getenv("WHATSAPP_API_TOKEN", "")
     MY_BUSINESS_TELEPHONE: str = os.getenv("MY_BUSINESS_TELEPHONE", "")
     
+    # Cliente HTTP da Graph API (pool de conexões, timeouts e retry)
+    GRAPH_API_BASE_URL: str = os.getenv("GRAPH_API_BASE_URL", "https://graph.facebook.com/v22.0")
+    GRAPH_API_CONNECT_TIMEOUT_SECONDS: float = float(os.getenv("GRAPH_API_CONNECT_TIMEOUT_SECONDS", "3"))
+    GRAPH_API_READ_TIMEOUT_SECONDS: float = float(os.getenv("GRAPH_API_READ_TIMEOUT_SECONDS", "10"))
+    GRAPH_API_MAX_RETRIES: int = int(os.getenv("GRAPH_API_MAX_RETRIES", "3"))
+    GRAPH_API_RETRY_BACKOFF_SECONDS: float = float(os.getenv("GRAPH_API_RETRY_BACKOFF_SECONDS", "0.5"))
+    GRAPH_API_POOL_SIZE: int = int(os.getenv("GRAPH_API_POOL_SIZE", "20"))
+    
+    # Download de mídia (buffer em memória; acima do limite, arquivo em diretório temporário privado)
+    MEDIA_SPOOL_MAX_MEMORY_BYTES: int = int(os.getenv("MEDIA_SPOOL_MAX_MEMORY_BYTES", str(2 * 1024 * 1024)))
+    MEDIA_MAX_DOWNLOAD_BYTES: int = int(os.getenv("MEDIA_MAX_DOWNLOAD_BYTES", str(25 * 1024 * 1024)))
+    MEDIA_TEMP_DIR: str = os.getenv("MEDIA_TEMP_DIR", "")
+    # Cache de mídias e transcrições por sha256 (LRU em disco)
+    MEDIA_CACHE_ENABLED: bool = os.getenv("MEDIA_CACHE_ENABLED", "True").lower() == "true"
+    MEDIA_CACHE_DIR: str = os.getenv("MEDIA_CACHE_DIR", ".media_cache")
+    MEDIA_CACHE_MAX_BYTES: int = int(os.getenv("MEDIA_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+    
+    # Envio das respostas (fila de saída com limite de taxa por número)
+    WHATSAPP_SEND_REPLIES: bool = os.getenv("WHATSAPP_SEND_REPLIES", "False").lower() == "true"
+    OUTBOUND_RATE_PER_SECOND: float = float(os.getenv("OUTBOUND_RATE_PER_SECOND", "80"))
+    OUTBOUND_BURST: int = int(os.getenv("OUTBOUND_BURST", "20"))
+    OUTBOUND_CONCURRENCY: int = int(os.getenv("OUTBOUND_CONCURRENCY", "10"))
+    OUTBOUND_QUEUE_SIZE: int = int(os.getenv("OUTBOUND_QUEUE_SIZE", "1000"))
+    OUTBOUND_MAX_ATTEMPTS: int = int(os.getenv("OUTBOUND_MAX_ATTEMPTS", "5"))
+    OUTBOUND_RETRY_BACKOFF_SECONDS: float = float(os.getenv("OUTBOUND_RETRY_BACKOFF_SECONDS", "1"))
+    OUTBOUND_ENQUEUE_TIMEOUT_SECONDS: float = float(os.getenv("OUTBOUND_ENQUEUE_TIMEOUT_SECONDS", "5"))
+    
     # Aplicação
     DEBUG: bool = os.getenv("DEBUG", "True").lower() == "true"
     IS_DEV_ENVIRONMENT: bool = os.getenv("IS_DEV_ENVIRONMENT", "True").lower() == "true"
     
     # Mensagens
     MESSAGE_EXPIRY_MINUTES: int = int(os.getenv("MESSAGE_EXPIRY_MINUTES", "5"))
+    # Quantidade de IDs recentes mantidos em memória para deduplicar reentregas do webhook
+    DEDUP_RECENT_IDS_SIZE: int = int(os.getenv("DEDUP_RECENT_IDS_SIZE", "10000"))
+    # IDs registrados em processed_messages são removidos após a janela de reentrega da Meta (até 7 dias)
+    DEDUP_RETENTION_HOURS: float = float(os.getenv("DEDUP_RETENTION_HOURS", "168"))
+    DEDUP_PRUNE_INTERVAL_SECONDS: float = float(os.getenv("DEDUP_PRUNE_INTERVAL_SECONDS", "3600"))
+    # Callbacks de status (sent/delivered/read/failed) gravados em lote
+    STATUS_BATCH_SIZE: int = int(os.getenv("STATUS_BATCH_SIZE", "500"))
+    STATUS_FLUSH_INTERVAL_SECONDS: float = float(os.getenv("STATUS_FLUSH_INTERVAL_SECONDS", "1"))
+    STATUS_BUFFER_SIZE: int = int(os.getenv("STATUS_BUFFER_SIZE", "50000"))
+    
+    # Controle de admissão do webhook (0 desativa o limite): acima dos limites responde 503 + Retry-After
+    ADMISSION_MAX_IN_FLIGHT: int = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "200"))
+    ADMISSION_MAX_QUEUED_TEXT: int = int(os.getenv("ADMISSION_MAX_QUEUED_TEXT", "5000"))
+    ADMISSION_MAX_QUEUED_MEDIA: int = int(os.getenv("ADMISSION_MAX_QUEUED_MEDIA", "500"))
+    ADMISSION_RETRY_AFTER_SECONDS: int = int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", "5"))
+    ADMISSION_DEPTH_REFRESH_SECONDS: float = float(os.getenv("ADMISSION_DEPTH_REFRESH_SECONDS", "1"))
+    
+    # Diretório de usuários autorizados ("json" = allowed_users.json em memória, "sqlite" = bases grandes)
+    USER_DIRECTORY_BACKEND: str = os.getenv("USER_DIRECTORY_BACKEND", "json")
+    ALLOWED_USERS_PATH: str = os.getenv("ALLOWED_USERS_PATH", "allowed_users.json")
+    USER_DIRECTORY_DB_PATH: str = os.getenv("USER_DIRECTORY_DB_PATH", "users.db")
+    USER_DIRECTORY_REFRESH_SECONDS: float = float(os.getenv("USER_DIRECTORY_REFRESH_SECONDS", "5"))
+    
+    # Fila de entrada (jobs duráveis processados em background)
+    JOB_WORKERS: int = int(os.getenv("JOB_WORKERS", "4"))
+    JOB_BATCH_SIZE: int = int(os.getenv("JOB_BATCH_SIZE", "20"))
+    JOB_POLL_INTERVAL_SECONDS: float = float(os.getenv("JOB_POLL_INTERVAL_SECONDS", "0.5"))
+    JOB_MAX_ATTEMPTS: int = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+    JOB_RETRY_BACKOFF_SECONDS: float = float(os.getenv("JOB_RETRY_BACKOFF_SECONDS", "2"))
+    JOB_PROCESSING_TIMEOUT_SECONDS: int = int(os.getenv("JOB_PROCESSING_TIMEOUT_SECONDS", "120"))
+    # Capacidade da fila de cada worker (ordem por remetente); cheia, o polling aguarda
+    JOB_WORKER_QUEUE_SIZE: int = int(os.getenv("JOB_WORKER_QUEUE_SIZE", "100"))
+    # Jobs de mídia (áudio/imagem) têm pool próprio para não atrasar mensagens de texto
+    MEDIA_JOB_WORKERS: int = int(os.getenv("MEDIA_JOB_WORKERS", "2"))
+    
+    # Transcrição de áudio ("whisper" ou "fake" para benchmarks/testes de carga)
+    TRANSCRIBER: str = os.getenv("TRANSCRIBER", "whisper")
+    FAKE_TRANSCRIBER_LATENCY_MS: float = float(os.getenv("FAKE_TRANSCRIBER_LATENCY_MS", "800"))
+    TRANSCRIPTION_WORKERS: int = int(os.getenv("TRANSCRIPTION_WORKERS", "2"))
+    TRANSCRIPTION_QUEUE_SIZE: int = int(os.getenv("TRANSCRIPTION_QUEUE_SIZE", "20"))
+    TRANSCRIPTION_DEADLINE_SECONDS: float = float(os.getenv("TRANSCRIPTION_DEADLINE_SECONDS", "60"))
+    
+    # Motor de resposta: template (padrão), stub (local, determinístico, para testes de carga) ou openai
+    RESPONSE_ENGINE: str = os.getenv("RESPONSE_ENGINE", "template")
+    RESPONSE_ENGINE_CONCURRENCY: int = int(os.getenv("RESPONSE_ENGINE_CONCURRENCY", "8"))
+    RESPONSE_ENGINE_TIMEOUT_SECONDS: float = float(os.getenv("RESPONSE_ENGINE_TIMEOUT_SECONDS", "30"))
+    RESPONSE_HISTORY_LIMIT: int = int(os.getenv("RESPONSE_HISTORY_LIMIT", "10"))
+    STUB_ENGINE_LATENCY_MS: float = float(os.getenv("STUB_ENGINE_LATENCY_MS", "300"))
+    STUB_ENGINE_TOKEN_LATENCY_MS: float = float(os.getenv("STUB_ENGINE_TOKEN_LATENCY_MS", "0"))
+    OPENAI_MODEL: str = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+    RESPONSE_SYSTEM_PROMPT: Optional[str] = os.getenv("RESPONSE_SYSTEM_PROMPT")
+    
+    # Cache de respostas por mensagem normalizada (REPLY_CACHE_OPT_OUT_USERS: ids separados por vírgula)
+    REPLY_CACHE_ENABLED: bool = os.getenv("REPLY_CACHE_ENABLED", "True").lower() == "true"
+    REPLY_CACHE_MAX_ENTRIES: int = int(os.getenv("REPLY_CACHE_MAX_ENTRIES", "10000"))
+    REPLY_CACHE_TTL_SECONDS: float = float(os.getenv("REPLY_CACHE_TTL_SECONDS", "300"))
+    REPLY_CACHE_MAX_MESSAGE_LENGTH: int = int(os.getenv("REPLY_CACHE_MAX_MESSAGE_LENGTH", "64"))
+    REPLY_CACHE_OPT_OUT_USERS: list = [user_id.strip() for user_id in os.getenv("REPLY_CACHE_OPT_OUT_USERS", "").split(",") if user_id.strip()]
+    
+    # Logging (LOG_OUTPUT=text|json; LOG_SAMPLING=evento=taxa,... ex: message.added=0.01)
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    LOG_OUTPUT: str = os.getenv("LOG_OUTPUT", "text")
+    LOG_SAMPLING: str = os.getenv("LOG_SAMPLING", "")
+    LOG_QUEUE_SIZE: int = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
     
     # Servidor
     HOST: str = os.getenv("HOST", "0.0.0.0")
     PORT: int = int(os.getenv("PORT", "5001"))
+    SERVER_WORKERS: int = int(os.getenv("SERVER_WORKERS", "1"))
+    SERVER_KEEP_ALIVE_SECONDS: int = int(os.getenv("SERVER_KEEP_ALIVE_SECONDS", "5"))
+    SERVER_ACCESS_LOG: bool = os.getenv("SERVER_ACCESS_LOG", "True").lower() == "true"
+    SHUTDOWN_DRAIN_SECONDS: float = float(os.getenv("SHUTDOWN_DRAIN_SECONDS", "20"))
+    WARMUP_DB_CONNECTIONS: int = int(os.getenv("WARMUP_DB_CONNECTIONS", "2"))
+    
+    # Servidor do canal local (HTTP/WebSocket): lotes por remetente e limite de respostas pendentes por conexão
+    WEBLOCAL_PORT: int = int(os.getenv("WEBLOCAL_PORT", "5002"))
+    WEBLOCAL_GATEWAY_WORKERS: int = int(os.getenv("WEBLOCAL_GATEWAY_WORKERS", "4"))
+    WEBLOCAL_GATEWAY_QUEUE_SIZE: int = int(os.getenv("WEBLOCAL_GATEWAY_QUEUE_SIZE", "1000"))
+    WEBLOCAL_GATEWAY_MAX_BATCH_SIZE: int = int(os.getenv("WEBLOCAL_GATEWAY_MAX_BATCH_SIZE", "64"))
+    WEBLOCAL_WS_MAX_PENDING: int = int(os.getenv("WEBLOCAL_WS_MAX_PENDING", "100"))
     
     # Banco de dados
     DATABASE_PATH: str = os.getenv("DATABASE_PATH", "conversations.db")
+    # Contabilidade de queries por requisição/job, slow log e alerta de N+1
+    DB_QUERY_ACCOUNTING: bool = os.getenv("DB_QUERY_ACCOUNTING", "True").lower() == "true"
+    DB_SLOW_QUERY_MS: float = float(os.getenv("DB_SLOW_QUERY_MS", "200"))
+    DB_N_PLUS_ONE_THRESHOLD: int = int(os.getenv("DB_N_PLUS_ONE_THRESHOLD", "10"))
+    # Modo estrito (testes): escopo acima do orçamento de queries levanta QueryBudgetExceededError
+    DB_QUERY_BUDGET_STRICT: bool = os.getenv("DB_QUERY_BUDGET_STRICT", "False").lower() == "true"
     
     # Configurações do módulo conversation
     CONVERSATION_IDLE_TIMEOUT_MINUTES: int = int(os.getenv("CONVERSATION_IDLE_TIMEOUT_MINUTES", "2"))
@@ -36,6 +36,12 @@ class ConversationConfig:
     MAX_CONVERSATION_HISTORY = getattr(settings, 'MAX_CONVERSATION_HISTORY', 1000)
     ENABLE_CLEANUP_ON_OPERATION = getattr(settings, 'ENABLE_CLEANUP_ON_OPERATION', False)
     
+    # Contabilidade de queries
+    QUERY_ACCOUNTING_ENABLED = getattr(settings, 'DB_QUERY_ACCOUNTING', True)
+    SLOW_QUERY_MS = getattr(settings, 'DB_SLOW_QUERY_MS', 200)
+    N_PLUS_ONE_THRESHOLD = getattr(settings, 'DB_N_PLUS_ONE_THRESHOLD', 10)
+    QUERY_BUDGET_STRICT = getattr(settings, 'DB_QUERY_BUDGET_STRICT', False)
+    
     @classmethod
     def is_closing_message(cls, message: str, owner: str) -> bool:
         """Verifica se a mensagem deve encerrar a conversa"""
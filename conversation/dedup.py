@@ -0,0 +1,115 @@
+"""
+Deduplicação de mensagens recebidas por webhook (reentregas da Meta)
+"""
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import List, Optional, Set, Tuple
+
+from conversation.service import ConversationService
+from observability import log_event
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+class MessageDeduplicator:
+    """
+    Filtra IDs de mensagens já recebidas
+
+    Um LRU em memória com os IDs recentes reconhece reentregas sem acessar o banco;
+    os demais IDs são registrados em processed_messages, cuja chave primária
+    (canal, ID) é a verificação autoritativa (vale entre workers e após reinícios).
+    Uma thread própria remove a cada `prune_interval_seconds` os registros mais antigos
+    que `retention_seconds` (a janela de reentrega).
+    """
+
+    def __init__(self, conversation_service: ConversationService, max_recent_ids: int = 10000,
+                 retention_seconds: float = 7 * 24 * 3600, prune_interval_seconds: float = 3600.0):
+        self.conversation_service = conversation_service
+        self.max_recent_ids = max_recent_ids
+        self.retention_seconds = retention_seconds
+        self.prune_interval_seconds = prune_interval_seconds
+        self._recent_ids: "OrderedDict[Tuple[str, str], None]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.duplicates_in_memory = 0
+        self.duplicates_in_database = 0
+        self.pruned = 0
+
+    def start(self):
+        if self._thread:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="dedup-prune", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(5)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.prune()
+            except Exception as e:
+                logger.error(f"Dedup prune error: {e}", exc_info=True)
+            self._stop_event.wait(self.prune_interval_seconds)
+
+    def prune(self) -> int:
+        """Remove do banco os IDs recebidos antes da janela de reentrega"""
+        deleted = self.conversation_service.prune_message_ids(datetime.now() - timedelta(seconds=self.retention_seconds))
+        self.pruned += deleted
+        return deleted
+
+    def _remember(self, keys: List[Tuple[str, str]]):
+        """Adiciona IDs ao LRU, descartando os mais antigos"""
+        for key in keys:
+            self._recent_ids[key] = None
+            self._recent_ids.move_to_end(key)
+        while len(self._recent_ids) > self.max_recent_ids:
+            self._recent_ids.popitem(last=False)
+
+    def filter_new(self, message_ids: List[str], channel: str = "whatsapp") -> Set[str]:
+        """Retorna o subconjunto de IDs que ainda não foi recebido no canal"""
+        with self._lock:
+            candidates = []
+            for message_id in dict.fromkeys(message_ids):
+                key = (channel, message_id)
+                if key in self._recent_ids:
+                    self._recent_ids.move_to_end(key)
+                    self.duplicates_in_memory += 1
+                else:
+                    candidates.append(message_id)
+
+        if not candidates:
+            return set()
+
+        new_ids = self.conversation_service.claim_message_ids(candidates, channel=channel)
+
+        with self._lock:
+            self.duplicates_in_database += len(candidates) - len(new_ids)
+            self._remember([(channel, message_id) for message_id in candidates])
+
+        if len(new_ids) < len(candidates):
+            log_event(logger, "messages.redelivered", count=len(candidates) - len(new_ids), source="database")
+        return new_ids
+
+    def release(self, message_ids: List[str], channel: str = "whatsapp"):
+        """Esquece IDs reivindicados cujo processamento não pôde ser garantido"""
+        with self._lock:
+            for message_id in message_ids:
+                self._recent_ids.pop((channel, message_id), None)
+        self.conversation_service.release_message_ids(message_ids, channel=channel)
+
+    def stats(self) -> dict:
+        """Retorna contadores de deduplicação"""
+        return {
+            "recent_ids": len(self._recent_ids),
+            "duplicates_in_memory": self.duplicates_in_memory,
+            "duplicates_in_database": self.duplicates_in_database,
+            "pruned": self.pruned
+        }
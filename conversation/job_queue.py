@@ -0,0 +1,456 @@
+"""
+Fila durável de jobs (inbox) e pool de workers para processamento em background
+"""
+import random
+import threading
+import uuid
+import logging
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import and_, func, not_, or_, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import aliased
+
+from channel.dispatcher import KeyedDispatcher
+from conversation.models import InboxJob, JobStatus
+from conversation.repository import ConversationRepository
+from conversation.exceptions import DatabaseConnectionError
+from observability import latency_summary, log_event
+from observability.query_stats import track_queries
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Resultado do handler para jobs não processados porque um job anterior do mesmo remetente falhou
+JOB_DEFERRED = "deferred"
+
+class JobQueue:
+    """
+    Fila de entrada persistida no mesmo banco das conversas
+
+    Jobs são reivindicados em lote com um claim_token (UPDATE condicionado ao status),
+    o que funciona em SQLite e PostgreSQL; no PostgreSQL a seleção usa SKIP LOCKED.
+    Um job só é reivindicado quando nenhum job anterior da mesma ordering_key está em
+    processamento ou aguardando (backoff ou outro pool): a ordem por remetente é estrita.
+    """
+
+    def __init__(self, repository: ConversationRepository, max_attempts: int = 5,
+                 retry_backoff_seconds: float = 2.0, processing_timeout_seconds: int = 120):
+        self.repository = repository
+        self.max_attempts = max_attempts
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.processing_timeout_seconds = processing_timeout_seconds
+        self._latencies_ms = deque(maxlen=1000)
+
+    @property
+    def _database_type(self) -> str:
+        return self.repository.database.database_type
+
+    @staticmethod
+    def _job_to_dict(job: InboxJob) -> Dict[str, Any]:
+        """Serializa um job reivindicado"""
+        return {
+            "id": job.id,
+            "channel": job.channel,
+            "kind": job.kind,
+            "ordering_key": job.ordering_key,
+            "payload": job.payload,
+            "attempts": job.attempts,
+            "claim_token": job.claim_token,
+            "created_at": job.created_at
+        }
+
+    @staticmethod
+    def _owned(jobs: List[Dict[str, Any]]):
+        """Condição dos jobs ainda reivindicados pelo claim que os entregou ao worker"""
+        return or_(*(
+            and_(InboxJob.id == job["id"], InboxJob.claim_token == job["claim_token"])
+            for job in jobs
+        ))
+
+    def enqueue(self, jobs: List[Dict[str, Any]]) -> List[int]:
+        """
+        Insere jobs na fila em uma única transação
+
+        Cada job é um dict com payload e, opcionalmente, channel, kind e ordering_key
+        """
+        if not jobs:
+            return []
+
+        try:
+            with self.repository.get_session() as session:
+                now = datetime.now()
+                rows = [
+                    InboxJob(
+                        channel=job.get("channel", "whatsapp"),
+                        kind=job.get("kind", "text"),
+                        ordering_key=job.get("ordering_key"),
+                        payload=job["payload"],
+                        status=JobStatus.PENDING,
+                        attempts=0,
+                        available_at=now,
+                        created_at=now
+                    )
+                    for job in jobs
+                ]
+                session.add_all(rows)
+                session.flush()
+                job_ids = [row.id for row in rows]
+                session.commit()
+                log_event(logger, "jobs.enqueued", logging.DEBUG, count=len(job_ids))
+                return job_ids
+
+        except SQLAlchemyError as e:
+            logger.error(f"Database error in enqueue: {e}")
+            raise DatabaseConnectionError(self._database_type, str(e))
+
+    def claim_batch(self, limit: int, kinds: Optional[List[str]] = None,
+                    exclude_kinds: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Reivindica até `limit` jobs pendentes, em ordem de chegada, opcionalmente filtrando pelo tipo"""
+        try:
+            with self.repository.get_session() as session:
+                now = datetime.now()
+                query = session.query(InboxJob.id).filter(
+                    self._claimable(InboxJob, now, kinds, exclude_kinds),
+                    not_(self._blocked_by_earlier_job(session, now, kinds, exclude_kinds))
+                ).order_by(InboxJob.id).limit(limit)
+
+                if self._database_type == "postgresql":
+                    query = query.with_for_update(skip_locked=True)
+
+                job_ids = [row[0] for row in query]
+                if not job_ids:
+                    session.rollback()
+                    return []
+
+                claim_token = str(uuid.uuid4())
+                session.query(InboxJob).filter(
+                    InboxJob.id.in_(job_ids),
+                    InboxJob.status == JobStatus.PENDING
+                ).update({
+                    InboxJob.status: JobStatus.PROCESSING,
+                    InboxJob.claim_token: claim_token,
+                    InboxJob.started_at: now,
+                    InboxJob.attempts: InboxJob.attempts + 1
+                }, synchronize_session=False)
+                session.commit()
+
+                # Apenas os jobs efetivamente atualizados por este claim pertencem ao worker
+                claimed = session.query(InboxJob).filter(
+                    InboxJob.claim_token == claim_token
+                ).order_by(InboxJob.id).all()
+                return [self._job_to_dict(job) for job in claimed]
+
+        except SQLAlchemyError as e:
+            logger.error(f"Database error in claim_batch: {e}")
+            raise DatabaseConnectionError(self._database_type, str(e))
+
+    @staticmethod
+    def _claimable(job, now: datetime, kinds: Optional[List[str]], exclude_kinds: Optional[List[str]]):
+        """Condição de um job que este claim pode reivindicar agora"""
+        conditions = [job.status == JobStatus.PENDING, job.available_at <= now]
+        if kinds:
+            conditions.append(job.kind.in_(kinds))
+        if exclude_kinds:
+            conditions.append(job.kind.notin_(exclude_kinds))
+        return and_(*conditions)
+
+    def _blocked_by_earlier_job(self, session, now: datetime, kinds: Optional[List[str]],
+                                exclude_kinds: Optional[List[str]]):
+        """
+        Existe job anterior do mesmo remetente que ainda não terminou e não entra neste claim
+        (em processamento, em backoff ou de um tipo consumido por outro pool)
+        """
+        earlier = aliased(InboxJob)
+        return session.query(earlier.id).filter(
+            earlier.ordering_key == InboxJob.ordering_key,
+            earlier.id < InboxJob.id,
+            or_(
+                earlier.status == JobStatus.PROCESSING,
+                and_(earlier.status == JobStatus.PENDING,
+                     not_(self._claimable(earlier, now, kinds, exclude_kinds)))
+            )
+        ).exists()
+
+    def start(self, jobs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Marca o início do processamento (started_at) e retorna apenas os jobs ainda
+        reivindicados por este worker
+
+        Jobs que esperaram demais na fila do dispatcher podem ter sido devolvidos por
+        requeue_stale_jobs e reivindicados de novo: essa cópia não deve ser processada.
+        """
+        if not jobs:
+            return []
+
+        try:
+            with self.repository.get_session() as session:
+                owned_ids = set(session.execute(
+                    update(InboxJob)
+                    .where(self._owned(jobs), InboxJob.status == JobStatus.PROCESSING)
+                    .values(started_at=datetime.now())
+                    .returning(InboxJob.id)
+                ).scalars())
+                session.commit()
+
+        except SQLAlchemyError as e:
+            logger.error(f"Database error in start: {e}")
+            raise DatabaseConnectionError(self._database_type, str(e))
+
+        if len(owned_ids) < len(jobs):
+            log_event(logger, "jobs.claim_lost", logging.WARNING, count=len(jobs) - len(owned_ids))
+        return [job for job in jobs if job["id"] in owned_ids]
+
+    def complete(self, jobs: List[Dict[str, Any]]):
+        """Marca jobs como concluídos e registra a latência (enfileiramento → conclusão)"""
+        if not jobs:
+            return
+
+        try:
+            with self.repository.get_session() as session:
+                now = datetime.now()
+                session.query(InboxJob).filter(self._owned(jobs)).update({
+                    InboxJob.status: JobStatus.DONE,
+                    InboxJob.finished_at: now,
+                    InboxJob.last_error: None
+                }, synchronize_session=False)
+                session.commit()
+
+            for job in jobs:
+                if job.get("created_at"):
+                    self._latencies_ms.append((now - job["created_at"]).total_seconds() * 1000)
+
+        except SQLAlchemyError as e:
+            logger.error(f"Database error in complete: {e}")
+            raise DatabaseConnectionError(self._database_type, str(e))
+
+    def fail(self, job: Dict[str, Any], error: str) -> bool:
+        """
+        Registra falha de um job, reagendando com backoff exponencial (com jitter)
+
+        Returns:
+            bool: True se o job será tentado novamente, False se falhou definitivamente
+        """
+        retry = job["attempts"] < self.max_attempts
+
+        try:
+            with self.repository.get_session() as session:
+                now = datetime.now()
+                values = {InboxJob.last_error: error[:1000], InboxJob.claim_token: None}
+                if retry:
+                    delay = self.retry_backoff_seconds * (2 ** (job["attempts"] - 1))
+                    delay += random.uniform(0, delay / 2)
+                    values.update({
+                        InboxJob.status: JobStatus.PENDING,
+                        InboxJob.available_at: now + timedelta(seconds=delay)
+                    })
+                else:
+                    values.update({
+                        InboxJob.status: JobStatus.FAILED,
+                        InboxJob.finished_at: now
+                    })
+
+                session.query(InboxJob).filter(self._owned([job])).update(values, synchronize_session=False)
+                session.commit()
+
+        except SQLAlchemyError as e:
+            logger.error(f"Database error in fail: {e}")
+            raise DatabaseConnectionError(self._database_type, str(e))
+
+        if retry:
+            logger.warning(f"Job {job['id']} failed (attempt {job['attempts']}), retry scheduled: {error}")
+        else:
+            logger.error(f"Job {job['id']} failed permanently after {job['attempts']} attempts: {error}")
+        return retry
+
+    def defer(self, jobs: List[Dict[str, Any]]):
+        """
+        Devolve à fila, sem contar tentativa, jobs que aguardam um job anterior do mesmo
+        remetente (o claim só os libera quando o anterior terminar)
+        """
+        if not jobs:
+            return
+
+        try:
+            with self.repository.get_session() as session:
+                session.query(InboxJob).filter(self._owned(jobs)).update({
+                    InboxJob.status: JobStatus.PENDING,
+                    InboxJob.claim_token: None,
+                    InboxJob.attempts: InboxJob.attempts - 1,
+                    InboxJob.available_at: datetime.now()
+                }, synchronize_session=False)
+                session.commit()
+
+        except SQLAlchemyError as e:
+            logger.error(f"Database error in defer: {e}")
+            raise DatabaseConnectionError(self._database_type, str(e))
+
+    def requeue_stale_jobs(self) -> int:
+        """
+        Devolve à fila jobs em processamento há mais tempo que o timeout (worker interrompido)
+
+        started_at é renovado quando o worker começa o lote (start), então o prazo vale
+        para o processamento; uma cópia devolvida enquanto esperava no dispatcher é
+        descartada pelo worker ao verificar o claim_token.
+        """
+        try:
+            with self.repository.get_session() as session:
+                cutoff = datetime.now() - timedelta(seconds=self.processing_timeout_seconds)
+                count = session.query(InboxJob).filter(
+                    InboxJob.status == JobStatus.PROCESSING,
+                    InboxJob.started_at < cutoff
+                ).update({
+                    InboxJob.status: JobStatus.PENDING,
+                    InboxJob.claim_token: None,
+                    InboxJob.available_at: datetime.now()
+                }, synchronize_session=False)
+                session.commit()
+
+            if count:
+                logger.warning(f"Requeued {count} stale jobs")
+            return count
+
+        except SQLAlchemyError as e:
+            logger.error(f"Database error in requeue_stale_jobs: {e}")
+            raise DatabaseConnectionError(self._database_type, str(e))
+
+    def depth(self) -> Dict[str, int]:
+        """Retorna a quantidade de jobs por status (exceto concluídos)"""
+        with self.repository.get_session() as session:
+            rows = session.query(InboxJob.status, func.count(InboxJob.id)).filter(
+                InboxJob.status != JobStatus.DONE
+            ).group_by(InboxJob.status).all()
+
+        depth = {status.value: 0 for status in JobStatus if status != JobStatus.DONE}
+        for status, count in rows:
+            depth[status.value] = count
+        return depth
+
+    def depth_by_kind(self) -> Dict[str, int]:
+        """Retorna a quantidade de jobs pendentes ou em processamento por tipo (kind)"""
+        try:
+            with self.repository.get_session() as session:
+                rows = session.query(InboxJob.kind, func.count(InboxJob.id)).filter(
+                    InboxJob.status.in_([JobStatus.PENDING, JobStatus.PROCESSING])
+                ).group_by(InboxJob.kind).all()
+            return {kind: count for kind, count in rows}
+
+        except SQLAlchemyError as e:
+            logger.error(f"Database error in depth_by_kind: {e}")
+            raise DatabaseConnectionError(self._database_type, str(e))
+
+    def stats(self) -> Dict[str, Any]:
+        """Retorna profundidade da fila e latência dos jobs concluídos recentemente"""
+        latency = latency_summary(self._latencies_ms)
+        return {"depth": self.depth(), "latency": latency}
+
+
+class JobWorkerPool:
+    """
+    Consome a JobQueue preservando a ordem por remetente
+
+    Uma thread de polling reivindica lotes de jobs e os distribui em um KeyedDispatcher
+    pela ordering_key: jobs do mesmo remetente são processados em ordem por um único
+    worker, enquanto remetentes diferentes rodam em paralelo. As filas do dispatcher
+    são limitadas, então o polling para de reivindicar jobs quando os workers estão saturados.
+
+    O handler recebe uma lista de jobs e retorna, para cada job, None em caso de
+    sucesso, a mensagem de erro para nova tentativa ou JOB_DEFERRED para jobs que
+    esperam um job anterior do mesmo remetente que falhou no lote.
+
+    `kinds`/`exclude_kinds` restringem os tipos de job consumidos, permitindo pools
+    separados (ex: texto em uma faixa rápida e mídia em um pool próprio).
+    """
+
+    def __init__(self, queue: JobQueue, handler: Callable[[List[Dict[str, Any]]], List[Optional[str]]],
+                 num_workers: int = 4, batch_size: int = 20, poll_interval_seconds: float = 0.5,
+                 max_queue_size: int = 100, kinds: Optional[List[str]] = None,
+                 exclude_kinds: Optional[List[str]] = None, name: str = "job-worker",
+                 query_budget_per_job: Optional[int] = None):
+        self.queue = queue
+        self.handler = handler
+        self.batch_size = batch_size
+        self.poll_interval_seconds = poll_interval_seconds
+        self.kinds = kinds
+        self.exclude_kinds = exclude_kinds
+        self.name = name
+        # Orçamento de queries por job do lote (handler + conclusão na fila); None desativa
+        self.query_budget_per_job = query_budget_per_job
+        self.dispatcher = KeyedDispatcher(
+            self.process,
+            num_workers=num_workers,
+            max_queue_size=max_queue_size,
+            max_batch_size=batch_size,
+            name=name
+        )
+        self._stop_event = threading.Event()
+        self._poller: Optional[threading.Thread] = None
+
+    def start(self):
+        """Recupera jobs interrompidos e inicia o polling e os workers"""
+        if self._poller:
+            return
+
+        self.queue.requeue_stale_jobs()
+        self._stop_event.clear()
+        self.dispatcher.start()
+        self._poller = threading.Thread(target=self._run, name=f"{self.name}-poller", daemon=True)
+        self._poller.start()
+        logger.info(f"Job worker pool {self.name} started with {self.dispatcher.num_workers} workers")
+
+    def stop(self, timeout: float = 10.0):
+        """Para de reivindicar jobs e aguarda os workers esvaziarem as filas"""
+        self._stop_event.set()
+        if self._poller:
+            self._poller.join(timeout)
+            self._poller = None
+        self.dispatcher.stop(drain=True, timeout=timeout)
+        logger.info(f"Job worker pool {self.name} stopped")
+
+    def _run(self):
+        polls = 0
+        while not self._stop_event.is_set():
+            try:
+                polls += 1
+                if polls % 120 == 0:
+                    self.queue.requeue_stale_jobs()
+
+                jobs = self.queue.claim_batch(self.batch_size, kinds=self.kinds, exclude_kinds=self.exclude_kinds)
+                if not jobs:
+                    self._stop_event.wait(self.poll_interval_seconds)
+                    continue
+
+                for job in jobs:
+                    # Bloqueia enquanto a fila do remetente estiver cheia (backpressure)
+                    self.dispatcher.submit(job["ordering_key"] or str(job["id"]), job)
+
+            except Exception as e:
+                logger.error(f"Job poller error: {e}", exc_info=True)
+                self._stop_event.wait(self.poll_interval_seconds)
+
+    def process(self, jobs: List[Dict[str, Any]]):
+        """Executa o handler para um lote e registra o resultado de cada job"""
+        # Início do lote e conclusão na fila, mais o orçamento por job
+        budget = 2 + self.query_budget_per_job * len(jobs) if self.query_budget_per_job else None
+        with track_queries(self.name, budget=budget):
+            jobs = self.queue.start(jobs)
+            if not jobs:
+                return
+            try:
+                errors = self.handler(jobs)
+            except Exception as e:
+                logger.error(f"Job handler error: {e}", exc_info=True)
+                errors = [str(e) or e.__class__.__name__] * len(jobs)
+
+            succeeded = [job for job, error in zip(jobs, errors) if error is None]
+            self.queue.complete(succeeded)
+            self.queue.defer([job for job, error in zip(jobs, errors) if error == JOB_DEFERRED])
+            for job, error in zip(jobs, errors):
+                if error is not None and error != JOB_DEFERRED:
+                    self.queue.fail(job, error)
+
+    def stats(self) -> Dict[str, Any]:
+        """Métricas da fila durável e das filas por worker"""
+        return {**self.queue.stats(), "workers": self.dispatcher.stats()}
@@ -3,7 +3,7 @@ from datetime import datetime, timedelta
 from enum import Enum
 from typing import Optional, Dict, Any
 from dataclasses import dataclass, field
-from sqlalchemy import Boolean, Column, Integer, String, DateTime, Text, ForeignKey, Enum as SQLEnum
+from sqlalchemy import Boolean, Column, Integer, SmallInteger, String, DateTime, Text, ForeignKey, Enum as SQLEnum
 from sqlalchemy.dialects.postgresql import UUID, JSON
 from sqlalchemy.orm import relationship
 
@@ -25,6 +25,20 @@ class MessageType(Enum):
     DOCUMENT = "document"
     TEMPLATE = "template"
 
+class JobStatus(Enum):
+    """Status de um job da fila de entrada"""
+    PENDING = "pending"
+    PROCESSING = "processing"
+    DONE = "done"
+    FAILED = "failed"
+
+class DeliveryStatus(Enum):
+    """Status de entrega de uma mensagem enviada (callbacks do WhatsApp); o valor é a ordem de progressão"""
+    SENT = 1
+    DELIVERED = 2
+    READ = 3
+    FAILED = 4
+
 class ConversationStatus(Enum):
     """Status da conversa"""
     ACTIVE = "active"
@@ -113,3 +127,58 @@ class Message(Base):
     
     def __repr__(self):
         return f"<Message(id={self.id}, type={self.type.value}, owner={self.owner.value}, channel={self.channel})>"
+
+
+class ProcessedMessage(Base):
+    """Registro dos IDs externos de mensagens já recebidas (deduplicação de webhooks)"""
+    __tablename__ = 'processed_messages'
+    
+    # Chave primária (canal, ID) garante unicidade por canal e índice para a verificação autoritativa
+    channel = Column(String(50), primary_key=True, default="whatsapp")
+    external_message_id = Column(String(128), primary_key=True)
+    received_at = Column(DateTime, default=datetime.now, index=True)  # Retenção (prune_processed_messages)
+    
+    def __repr__(self):
+        return f"<ProcessedMessage(id={self.external_message_id}, channel={self.channel})>"
+
+
+class InboxJob(Base):
+    """Job durável da fila de entrada (mensagens aguardando processamento)"""
+    __tablename__ = 'inbox_jobs'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    channel = Column(String(50), nullable=False, default="whatsapp")
+    kind = Column(String(20), nullable=False, default="text")  # Tipo da mensagem (text, audio, image...)
+    ordering_key = Column(String(128), nullable=True, index=True)  # Remetente, para processamento ordenado
+    payload = Column(JSON, nullable=False)
+    status = Column(SQLEnum(JobStatus), nullable=False, default=JobStatus.PENDING, index=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    available_at = Column(DateTime, default=datetime.now, index=True)  # Próxima tentativa (backoff)
+    claim_token = Column(String(36), nullable=True, index=True)
+    created_at = Column(DateTime, default=datetime.now)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    
+    def __repr__(self):
+        return f"<InboxJob(id={self.id}, kind={self.kind}, status={self.status.value}, attempts={self.attempts})>"
+
+
+class MessageStatus(Base):
+    """
+    Eventos de status de mensagens enviadas (append-only)
+    
+    Linhas compactas: status como inteiro (DeliveryStatus) e horário como epoch;
+    o status atual de uma mensagem é o evento mais recente/avançado do seu external_message_id.
+    """
+    __tablename__ = 'message_statuses'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    external_message_id = Column(String(128), nullable=False, index=True)
+    status = Column(SmallInteger, nullable=False)
+    status_at = Column(Integer, nullable=False)  # Epoch (segundos) informado pelo WhatsApp
+    recipient_id = Column(String(32), nullable=True)
+    error_code = Column(Integer, nullable=True)
+    
+    def __repr__(self):
+        return f"<MessageStatus(message_id={self.external_message_id}, status={DeliveryStatus(self.status).name})>"
@@ -1,15 +1,18 @@
 import uuid
 import logging
 from datetime import datetime, timedelta
-from typing import List, Optional, Dict, Any, Tuple
+from typing import List, Optional, Dict, Any, Set, Tuple
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, insert, text
 from sqlalchemy.orm import sessionmaker, Session
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 
 from conversation.db import DatabaseConfig, Base
-from conversation.models import Conversation, ConversationStatus, Message, MessageData, MessageType
+from conversation.models import Conversation, ConversationStatus, DeliveryStatus, Message, MessageData, MessageStatus, MessageType, ProcessedMessage
 from conversation.config import ConversationConfig
+from observability import log_event
+from observability.metrics import DB_OPERATION_SECONDS
+from observability.query_stats import configure_query_accounting, install_query_hooks
 from conversation.exceptions import (
     ConversationNotFoundError, 
     ConversationExpiredError, 
@@ -33,6 +36,9 @@ class ConversationRepository:
                 echo=False,  # Mude para True para ver as queries SQL
                 pool_pre_ping=True if database.database_type == "postgresql" else False
             )
+            if self.config.QUERY_ACCOUNTING_ENABLED:
+                configure_query_accounting(self.config.N_PLUS_ONE_THRESHOLD, self.config.QUERY_BUDGET_STRICT)
+                install_query_hooks(self.engine, self.config.SLOW_QUERY_MS)
             self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
             self._create_tables()
             logger.info(f"Database connection established: {database.database_type}")
@@ -49,10 +55,35 @@ class ConversationRepository:
             logger.error(f"Failed to create tables: {e}")
             raise DatabaseConnectionError(self.database.database_type, f"Table creation failed: {e}")
 
+    def pool_stats(self) -> Dict[str, int]:
+        """Uso do pool de conexões (SQLite usa um pool sem tamanho fixo: só as conexões em uso)"""
+        pool = self.engine.pool
+        stats = {}
+        for key in ("size", "checkedout", "checkedin", "overflow"):
+            method = getattr(pool, key, None)
+            if method is not None:
+                stats[key] = method()
+        return stats
+
     def get_session(self) -> Session:
         """Retorna uma sessão do banco de dados"""
         return self.SessionLocal()
 
+    def warm_up(self, connections: int = 1):
+        """Abre `connections` conexões simultâneas para preencher o pool antes do primeiro request"""
+        opened = []
+        try:
+            for _ in range(max(1, connections)):
+                connection = self.engine.connect()
+                opened.append(connection)
+                connection.execute(text("SELECT 1"))
+        except SQLAlchemyError as e:
+            logger.error(f"Database error in warm_up: {e}")
+            raise DatabaseConnectionError(self.database.database_type, str(e))
+        finally:
+            for connection in opened:
+                connection.close()
+
     def _cleanup_expired_conversations(self, client_hub: str = None):
         """Limpa conversas que expiraram por timeout"""
         if not ConversationConfig.ENABLE_CLEANUP_ON_OPERATION:
@@ -77,12 +108,13 @@ class ConversationRepository:
                 
                 if expired_count > 0:
                     session.commit()
-                    logger.info(f"Closed {expired_count} expired conversations")
+                    log_event(logger, "conversations.expired_closed", count=expired_count)
                     
         except SQLAlchemyError as e:
             logger.error(f"Error during cleanup: {e}")
             # Não re-raise para não interromper operações principais
 
+    @DB_OPERATION_SECONDS.labels("get_or_create_conversation_uuid").time()
     def get_or_create_conversation_uuid(self, client_hub: str, channel: str = "whatsapp", timeout_minutes: int = None) -> Tuple[str, bool]:
         """
         Obtém uma conversa ativa ou cria uma nova
@@ -100,12 +132,12 @@ class ConversationRepository:
                 ).first()
                 
                 if active_conversation and not active_conversation.is_expired():
-                    logger.debug(f"Found active conversation for client {client_hub}")
+                    log_event(logger, "conversation.active_found", logging.DEBUG, client_hub=client_hub)
                     return str(active_conversation.conversation_uuid), False
                 
                 # Se a conversa ativa expirou, encerra ela
                 if active_conversation and active_conversation.is_expired():
-                    logger.info(f"Closing expired conversation for client {client_hub}")
+                    log_event(logger, "conversation.expired_closing", client_hub=client_hub)
                     active_conversation.close_conversation(ConversationStatus.IDLE_TIMEOUT)
                     session.commit()
                 
@@ -121,13 +153,14 @@ class ConversationRepository:
                 session.commit()
                 session.refresh(new_conversation)
                 
-                logger.info(f"Created new conversation for client {client_hub}")
+                log_event(logger, "conversation.created", client_hub=client_hub)
                 return str(new_conversation.conversation_uuid), True
                 
         except SQLAlchemyError as e:
             logger.error(f"Database error in get_or_create_conversation_uuid: {e}")
             raise DatabaseConnectionError(self.database.database_type, str(e))
     
+    @DB_OPERATION_SECONDS.labels("add_message").time()
     def add_message(self, conversation_uuid: str, message_data: MessageData) -> Tuple[dict, bool]:
         """
         Adiciona uma nova mensagem à conversa
@@ -183,25 +216,15 @@ class ConversationRepository:
                         message_data.message
                     )
                     conversation_closed = True
-                    logger.info(f"Conversation {conversation_uuid} closed by message")
+                    log_event(logger, "conversation.closed_by_message", conversation_uuid=conversation_uuid)
                 
                 session.commit()
                 session.refresh(message)
                 
-                logger.debug(f"Message added to conversation {conversation_uuid}")
+                log_event(logger, "message.stored", logging.DEBUG, conversation_uuid=conversation_uuid)
                 
                 # Retornar dados serializados como no KanbanRepository
-                message_dict = {
-                    "id": str(message.id),
-                    "conversation_uuid": str(message.conversation_uuid),
-                    "type": message.type.value,
-                    "message": message.message,
-                    "timestamp": message.timestamp,
-                    "owner": message.owner.value,
-                    "channel": message.channel,
-                    "meta": message.meta,
-                    "closes_conversation": message.closes_conversation
-                }
+                message_dict = self._message_to_dict(message)
                 
                 return message_dict, conversation_closed
                 
@@ -212,6 +235,251 @@ class ConversationRepository:
             logger.error(f"Database error in add_message: {e}")
             raise DatabaseConnectionError(self.database.database_type, str(e))
     
+    def _get_or_create_active_conversation(self, session: Session, client_hub: str, channel: str, timeout_minutes: int = None) -> Conversation:
+        """Obtém a conversa ativa do cliente dentro da sessão informada ou cria uma nova"""
+        # Garante que alterações pendentes (ex: conversa encerrada no mesmo lote) sejam vistas pela query
+        session.flush()
+        
+        active_conversation = session.query(Conversation).filter(
+            Conversation.client_hub == client_hub,
+            Conversation.status == ConversationStatus.ACTIVE
+        ).first()
+        
+        if active_conversation and not active_conversation.is_expired():
+            return active_conversation
+        
+        if active_conversation:
+            log_event(logger, "conversation.expired_closing", client_hub=client_hub)
+            active_conversation.close_conversation(ConversationStatus.IDLE_TIMEOUT)
+        
+        now = datetime.now()
+        new_conversation = Conversation(
+            conversation_uuid=uuid.uuid4(),
+            client_hub=client_hub,
+            channel=channel,
+            status=ConversationStatus.ACTIVE,
+            idle_timeout_minutes=timeout_minutes or self.config.DEFAULT_IDLE_TIMEOUT_MINUTES,
+            created_at=now,
+            updated_at=now,
+            last_activity_at=now
+        )
+        session.add(new_conversation)
+        log_event(logger, "conversation.created", client_hub=client_hub)
+        return new_conversation
+    
+    @DB_OPERATION_SECONDS.labels("add_messages_batch").time()
+    def add_messages_batch(self, items: List[Tuple[str, str, MessageData]]) -> List[Tuple[str, dict, bool]]:
+        """
+        Adiciona várias mensagens em uma única transação, preservando a ordem recebida
+        Cada item é (client_hub, channel, message_data); retorna (conversation_uuid, message_dict, conversation_was_closed) por item
+        """
+        if not items:
+            return []
+        
+        try:
+            with self.get_session() as session:
+                active_conversations: Dict[str, Conversation] = {}
+                added = []
+                
+                for client_hub, channel, message_data in items:
+                    conversation = active_conversations.get(client_hub)
+                    if conversation is None or conversation.status != ConversationStatus.ACTIVE:
+                        conversation = self._get_or_create_active_conversation(session, client_hub, channel)
+                        active_conversations[client_hub] = conversation
+                    
+                    should_close = (message_data.closes_conversation or
+                                    self.config.is_closing_message(message_data.message, message_data.owner.value))
+                    
+                    message = Message(
+                        id=uuid.uuid4(),
+                        conversation_uuid=conversation.conversation_uuid,
+                        type=MessageType(message_data.type),
+                        message=message_data.message,
+                        timestamp=message_data.timestamp,
+                        owner=message_data.owner,
+                        meta=message_data.meta,
+                        closes_conversation=should_close,
+                        channel=message_data.channel or "whatsapp"
+                    )
+                    session.add(message)
+                    
+                    now = datetime.now()
+                    conversation.updated_at = now
+                    conversation.last_activity_at = now
+                    
+                    if should_close:
+                        conversation.close_conversation(ConversationStatus.AGENT_CLOSED, message_data.message)
+                        log_event(logger, "conversation.closed_by_message", conversation_uuid=conversation.conversation_uuid)
+                    
+                    added.append((str(conversation.conversation_uuid), message, should_close))
+                
+                # Serializar antes do commit evita um refresh por mensagem
+                session.flush()
+                results = [
+                    (conversation_uuid, self._message_to_dict(message), closed)
+                    for conversation_uuid, message, closed in added
+                ]
+                session.commit()
+                
+                log_event(logger, "messages.batch_stored", logging.DEBUG, count=len(results))
+                return results
+                
+        except SQLAlchemyError as e:
+            logger.error(f"Database error in add_messages_batch: {e}")
+            raise DatabaseConnectionError(self.database.database_type, str(e))
+    
+    @staticmethod
+    def _message_to_dict(message: Message) -> dict:
+        """Serializa uma mensagem no formato retornado pelo repositório"""
+        return {
+            "id": str(message.id),
+            "conversation_uuid": str(message.conversation_uuid),
+            "type": message.type.value,
+            "message": message.message,
+            "timestamp": message.timestamp,
+            "owner": message.owner.value,
+            "channel": message.channel,
+            "meta": message.meta,
+            "closes_conversation": message.closes_conversation
+        }
+    
+    def claim_message_ids(self, message_ids: List[str], channel: str = "whatsapp") -> Set[str]:
+        """
+        Registra IDs externos de mensagens e retorna apenas os que ainda não existiam
+        A chave primária de processed_messages é a verificação autoritativa contra duplicatas
+        """
+        unique_ids = list(dict.fromkeys(message_ids))
+        if not unique_ids:
+            return set()
+        
+        try:
+            with self.get_session() as session:
+                existing = {
+                    row[0] for row in session.query(ProcessedMessage.external_message_id).filter(
+                        ProcessedMessage.channel == channel,
+                        ProcessedMessage.external_message_id.in_(unique_ids)
+                    )
+                }
+                new_ids = [message_id for message_id in unique_ids if message_id not in existing]
+                if not new_ids:
+                    return set()
+                
+                session.add_all([
+                    ProcessedMessage(external_message_id=message_id, channel=channel)
+                    for message_id in new_ids
+                ])
+                try:
+                    session.commit()
+                    return set(new_ids)
+                except IntegrityError:
+                    # Outro worker registrou algum ID entre a consulta e o insert
+                    session.rollback()
+            
+            return {
+                message_id for message_id in new_ids
+                if self._claim_message_id(message_id, channel)
+            }
+            
+        except SQLAlchemyError as e:
+            logger.error(f"Database error in claim_message_ids: {e}")
+            raise DatabaseConnectionError(self.database.database_type, str(e))
+    
+    def release_message_ids(self, message_ids: List[str], channel: str = "whatsapp"):
+        """Remove registros de IDs externos (ex: quando o enfileiramento falhou após o claim)"""
+        if not message_ids:
+            return
+        
+        try:
+            with self.get_session() as session:
+                session.query(ProcessedMessage).filter(
+                    ProcessedMessage.channel == channel,
+                    ProcessedMessage.external_message_id.in_(message_ids)
+                ).delete(synchronize_session=False)
+                session.commit()
+                
+        except SQLAlchemyError as e:
+            logger.error(f"Database error in release_message_ids: {e}")
+            raise DatabaseConnectionError(self.database.database_type, str(e))
+    
+    def prune_processed_messages(self, older_than: datetime) -> int:
+        """Remove IDs externos recebidos antes de `older_than` (fora da janela de reentrega)"""
+        try:
+            with self.get_session() as session:
+                deleted = session.query(ProcessedMessage).filter(
+                    ProcessedMessage.received_at < older_than
+                ).delete(synchronize_session=False)
+                session.commit()
+                return deleted
+                
+        except SQLAlchemyError as e:
+            logger.error(f"Database error in prune_processed_messages: {e}")
+            raise DatabaseConnectionError(self.database.database_type, str(e))
+    
+    def add_message_statuses(self, statuses: List[Dict[str, Any]]) -> int:
+        """
+        Grava eventos de status em lote (um único INSERT com múltiplas linhas)
+        
+        Cada item: external_message_id, status (DeliveryStatus), status_at (epoch), recipient_id, error_code
+        """
+        if not statuses:
+            return 0
+        
+        try:
+            with self.get_session() as session:
+                session.execute(insert(MessageStatus), [
+                    {**status, "status": status["status"].value} for status in statuses
+                ])
+                session.commit()
+                return len(statuses)
+                
+        except SQLAlchemyError as e:
+            logger.error(f"Database error in add_message_statuses: {e}")
+            raise DatabaseConnectionError(self.database.database_type, str(e))
+    
+    def get_latest_statuses(self, message_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Retorna o status mais recente de cada mensagem (as não encontradas ficam de fora)"""
+        if not message_ids:
+            return {}
+        
+        try:
+            with self.get_session() as session:
+                rows = session.query(
+                    MessageStatus.external_message_id,
+                    MessageStatus.status,
+                    MessageStatus.status_at,
+                    MessageStatus.recipient_id,
+                    MessageStatus.error_code
+                ).filter(MessageStatus.external_message_id.in_(message_ids)).all()
+                
+            latest: Dict[str, Dict[str, Any]] = {}
+            for message_id, status, status_at, recipient_id, error_code in rows:
+                current = latest.get(message_id)
+                if current is None or (status_at, status) > (current["status_at"], current["status"].value):
+                    latest[message_id] = {
+                        "external_message_id": message_id,
+                        "status": DeliveryStatus(status),
+                        "status_at": status_at,
+                        "recipient_id": recipient_id,
+                        "error_code": error_code
+                    }
+            return latest
+                
+        except SQLAlchemyError as e:
+            logger.error(f"Database error in get_latest_statuses: {e}")
+            raise DatabaseConnectionError(self.database.database_type, str(e))
+    
+    def _claim_message_id(self, message_id: str, channel: str) -> bool:
+        """Registra um único ID externo; retorna False se já existia"""
+        with self.get_session() as session:
+            session.add(ProcessedMessage(external_message_id=message_id, channel=channel))
+            try:
+                session.commit()
+                return True
+            except IntegrityError:
+                session.rollback()
+                return False
+    
+    @DB_OPERATION_SECONDS.labels("get_conversation_history").time()
     def get_conversation_history(self, client_hub: str, limit: int = 50, include_closed: bool = False) -> List[dict]:
         """Obtém o histórico de mensagens, retornando dados serializados"""
         with self.get_session() as session:
@@ -231,18 +499,7 @@ class ConversationRepository:
                 ).order_by(Message.timestamp.desc()).limit(limit).all()
                 
                 for message in messages:
-                    message_dict = {
-                        "id": str(message.id),
-                        "conversation_uuid": str(message.conversation_uuid),
-                        "type": message.type.value,
-                        "message": message.message,
-                        "timestamp": message.timestamp,
-                        "owner": message.owner.value,
-                        "channel": message.channel,
-                        "meta": message.meta,
-                        "closes_conversation": message.closes_conversation
-                    }
-                    all_messages.append(message_dict)
+                    all_messages.append(self._message_to_dict(message))
             
             # Ordenar por timestamp e limitar
             all_messages.sort(key=lambda x: x['timestamp'])
@@ -1,9 +1,11 @@
 import logging
-from typing import Any, Dict, List, Optional, Tuple
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
 from conversation.models import MessageData
 from conversation.repository import ConversationRepository
 from conversation.exceptions import ConversationError
 from conversation.config import ConversationConfig
+from observability import log_event
 
 # Configurar logging
 logger = logging.getLogger(__name__)
@@ -26,7 +28,7 @@ class ConversationService():
             if not channel or not channel.strip():
                 raise ValueError("channel cannot be empty")
             
-            logger.debug(f"Getting or creating conversation for client {client_hub} on channel {channel}")
+            log_event(logger, "conversation.resolve", logging.DEBUG, client_hub=client_hub, channel=channel)
             result = self.repository.get_or_create_conversation_uuid(
                 client_hub=client_hub, 
                 channel=channel, 
@@ -34,7 +36,7 @@ class ConversationService():
             )
             
             conversation_uuid, is_new = result
-            logger.info(f"Conversation {'created' if is_new else 'retrieved'} for client {client_hub}: {conversation_uuid}")
+            log_event(logger, "conversation.resolved", client_hub=client_hub, conversation_uuid=conversation_uuid, created=is_new)
             return result
             
         except Exception as e:
@@ -50,17 +52,92 @@ class ConversationService():
             if not message_data:
                 raise ValueError("message_data cannot be None")
             
-            logger.debug(f"Adding message to conversation {conversation_uuid}")
+            log_event(logger, "message.add", logging.DEBUG, conversation_uuid=conversation_uuid)
             result = self.repository.add_message(conversation_uuid=conversation_uuid, message_data=message_data)
             
             message_dict, conversation_closed = result
-            logger.info(f"Message added to conversation {conversation_uuid}. Conversation closed: {conversation_closed}")
+            log_event(logger, "message.added", conversation_uuid=conversation_uuid, conversation_closed=conversation_closed)
             return result
             
         except Exception as e:
             logger.error(f"Error in add_message: {e}")
             raise ConversationError(f"Failed to add message: {e}")
     
+    def add_messages_batch(self, items: List[Tuple[str, str, MessageData]]) -> List[Tuple[str, dict, bool]]:
+        """Adiciona um lote de mensagens (client_hub, channel, message_data) em uma única transação"""
+        try:
+            for client_hub, channel, message_data in items:
+                if not client_hub or not client_hub.strip():
+                    raise ValueError("client_hub cannot be empty")
+                if not channel or not channel.strip():
+                    raise ValueError("channel cannot be empty")
+                if not message_data:
+                    raise ValueError("message_data cannot be None")
+
+            log_event(logger, "messages.batch_add", logging.DEBUG, count=len(items))
+            result = self.repository.add_messages_batch(items)
+            log_event(logger, "messages.batch_added", count=len(result))
+            return result
+
+        except Exception as e:
+            logger.error(f"Error in add_messages_batch: {e}")
+            raise ConversationError(f"Failed to add messages batch: {e}")
+
+    def claim_message_ids(self, message_ids: List[str], channel: str = "whatsapp") -> Set[str]:
+        """Registra IDs externos de mensagens e retorna os que ainda não haviam sido recebidos"""
+        try:
+            if not channel or not channel.strip():
+                raise ValueError("channel cannot be empty")
+
+            result = self.repository.claim_message_ids(message_ids, channel=channel)
+            log_event(logger, "message_ids.claimed", logging.DEBUG, claimed=len(result), received=len(message_ids))
+            return result
+
+        except Exception as e:
+            logger.error(f"Error in claim_message_ids: {e}")
+            raise ConversationError(f"Failed to claim message ids: {e}")
+
+    def release_message_ids(self, message_ids: List[str], channel: str = "whatsapp"):
+        """Libera IDs externos registrados para que uma reentrega seja aceita novamente"""
+        try:
+            self.repository.release_message_ids(message_ids, channel=channel)
+            log_event(logger, "message_ids.released", logging.DEBUG, count=len(message_ids))
+
+        except Exception as e:
+            logger.error(f"Error in release_message_ids: {e}")
+            raise ConversationError(f"Failed to release message ids: {e}")
+
+    def prune_message_ids(self, older_than: datetime) -> int:
+        """Remove os IDs externos registrados antes de `older_than`"""
+        try:
+            deleted = self.repository.prune_processed_messages(older_than)
+            log_event(logger, "message_ids.pruned", count=deleted)
+            return deleted
+
+        except Exception as e:
+            logger.error(f"Error in prune_message_ids: {e}")
+            raise ConversationError(f"Failed to prune message ids: {e}")
+
+    def add_message_statuses(self, statuses: List[Dict[str, Any]]) -> int:
+        """Persiste em lote eventos de status de mensagens enviadas"""
+        try:
+            count = self.repository.add_message_statuses(statuses)
+            log_event(logger, "statuses.stored", logging.DEBUG, count=count)
+            return count
+
+        except Exception as e:
+            logger.error(f"Error in add_message_statuses: {e}")
+            raise ConversationError(f"Failed to store message statuses: {e}")
+
+    def get_latest_statuses(self, message_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Retorna o status mais recente de cada mensagem enviada"""
+        try:
+            return self.repository.get_latest_statuses(message_ids)
+
+        except Exception as e:
+            logger.error(f"Error in get_latest_statuses: {e}")
+            raise ConversationError(f"Failed to get message statuses: {e}")
+
     def get_conversation_history(self, client_hub: str, limit: int = 50, include_closed: bool = False) -> List[dict]:
         """Retorna histórico com dados serializados"""
         try:
@@ -72,9 +149,9 @@ class ConversationService():
                 limit = ConversationConfig.MAX_CONVERSATION_HISTORY
                 logger.warning(f"Limit capped to {ConversationConfig.MAX_CONVERSATION_HISTORY}")
             
-            logger.debug(f"Getting conversation history for client {client_hub}, limit: {limit}")
+            log_event(logger, "history.get", logging.DEBUG, client_hub=client_hub, limit=limit)
             result = self.repository.get_conversation_history(client_hub=client_hub, limit=limit, include_closed=include_closed)
-            logger.info(f"Retrieved {len(result)} messages for client {client_hub}")
+            log_event(logger, "history.retrieved", client_hub=client_hub, count=len(result))
             return result
             
         except Exception as e:
@@ -87,13 +164,10 @@ class ConversationService():
             if not client_hub or not client_hub.strip():
                 raise ValueError("client_hub cannot be empty")
             
-            logger.debug(f"Getting active conversation data for client {client_hub}")
+            log_event(logger, "conversation.active_get", logging.DEBUG, client_hub=client_hub)
             result = self.repository.get_active_conversation_data(client_hub=client_hub)
             
-            if result:
-                logger.info(f"Found active conversation for client {client_hub}")
-            else:
-                logger.info(f"No active conversation found for client {client_hub}")
+            log_event(logger, "conversation.active_found", client_hub=client_hub, found=bool(result))
             
             return result
             
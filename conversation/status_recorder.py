@@ -0,0 +1,161 @@
+"""
+Gravação em lote de eventos de status (sent/delivered/read/failed) das mensagens enviadas
+"""
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+from conversation.models import DeliveryStatus
+from conversation.service import ConversationService
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+class StatusRecorder:
+    """
+    Acumula eventos de status em memória e os grava em lote
+
+    O buffer é descarregado quando atinge `batch_size` ou a cada `flush_interval_seconds`
+    (thread própria), então o webhook apenas anexa eventos ao buffer. Eventos ainda não
+    gravados (no buffer ou em gravação) são considerados nas consultas de status e
+    descarregados no `stop`.
+    Em caso de falha de gravação os eventos voltam ao buffer; acima de `max_buffer_size`
+    os mais antigos são descartados.
+    """
+
+    def __init__(self, conversation_service: ConversationService, batch_size: int = 500,
+                 flush_interval_seconds: float = 1.0, max_buffer_size: int = 50000):
+        self.conversation_service = conversation_service
+        self.batch_size = batch_size
+        self.flush_interval_seconds = flush_interval_seconds
+        self.max_buffer_size = max_buffer_size
+        self._buffer: List[Dict[str, Any]] = []
+        # Eventos retirados do buffer cuja gravação ainda não foi confirmada
+        self._writing: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+        self.flushes = 0
+
+    def start(self):
+        if self._thread:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="status-recorder", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Para a thread e grava o que restou no buffer"""
+        self._stop_event.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(5)
+            self._thread = None
+        self.flush()
+
+    def record(self, statuses: List[Dict[str, Any]]) -> int:
+        """Anexa eventos ao buffer; eventos acima da capacidade são descartados"""
+        with self._lock:
+            room = self.max_buffer_size - len(self._buffer)
+            accepted = statuses[:max(0, room)]
+            self._buffer.extend(accepted)
+            self.recorded += len(accepted)
+            self.dropped += len(statuses) - len(accepted)
+            should_flush = len(self._buffer) >= self.batch_size
+
+        if len(accepted) < len(statuses):
+            logger.warning(f"Status buffer full, dropped {len(statuses) - len(accepted)} events")
+        if should_flush:
+            self._wakeup.set()
+        return len(accepted)
+
+    def flush(self) -> int:
+        """Grava o buffer atual em lotes de `batch_size`"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._buffer = self._buffer, []
+                self._writing = pending
+
+            written = 0
+            for start in range(0, len(pending), self.batch_size):
+                batch = pending[start:start + self.batch_size]
+                try:
+                    written += self.conversation_service.add_message_statuses(batch)
+                except Exception as e:
+                    logger.error(f"Failed to write {len(pending) - start} statuses, keeping them buffered: {e}")
+                    with self._lock:
+                        # Eventos recebidos durante a gravação também ocupam o buffer
+                        buffered = pending[start:] + self._buffer
+                        overflow = max(0, len(buffered) - self.max_buffer_size)
+                        self._buffer = buffered[overflow:]
+                        self._writing = []
+                        self.dropped += overflow
+                    if overflow:
+                        logger.warning(f"Status buffer full, dropped {overflow} oldest events")
+                    break
+                with self._lock:
+                    self._writing = pending[start + len(batch):]
+
+            self.written += written
+            if pending:
+                self.flushes += 1
+            return written
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self._wakeup.wait(self.flush_interval_seconds)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Status recorder error: {e}", exc_info=True)
+
+    def get_latest_statuses(self, message_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Status mais recente de cada mensagem, combinando o banco e os eventos ainda em buffer"""
+        wanted = set(message_ids)
+        # Eventos em memória lidos antes do banco: um lote confirmado entre as duas leituras
+        # aparece no banco, e um ainda não confirmado continua em `_writing`
+        with self._lock:
+            buffered = [status for status in self._writing + self._buffer if status["external_message_id"] in wanted]
+        latest = self.conversation_service.get_latest_statuses(list(wanted))
+
+        for status in buffered:
+            current = latest.get(status["external_message_id"])
+            if current is None or (status["status_at"], status["status"].value) > (current["status_at"], current["status"].value):
+                latest[status["external_message_id"]] = dict(status)
+        return latest
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "buffered": len(self._buffer),
+            "writing": len(self._writing),
+            "recorded": self.recorded,
+            "written": self.written,
+            "dropped": self.dropped,
+            "flushes": self.flushes
+        }
+
+def status_event(message_id: str, status: str, timestamp: str, recipient_id: str = None,
+                 error_code: int = None) -> Optional[Dict[str, Any]]:
+    """Converte um callback de status no formato gravado; None para status desconhecidos ou horário inválido"""
+    try:
+        delivery_status = DeliveryStatus[status.upper()]
+    except KeyError:
+        return None
+    try:
+        status_at = int(timestamp)
+    except (TypeError, ValueError):
+        logger.warning(f"Skipping status {status} for {message_id}: invalid timestamp {timestamp!r}")
+        return None
+    return {
+        "external_message_id": message_id,
+        "status": delivery_status,
+        "status_at": status_at,
+        "recipient_id": recipient_id,
+        "error_code": error_code
+    }
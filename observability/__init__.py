@@ -0,0 +1,2 @@
+from .metrics import latency_summary, percentile
+from .structured_logging import configure_logging, log_event, parse_sampling, stop_logging
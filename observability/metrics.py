@@ -0,0 +1,327 @@
+"""
+Registro de métricas no formato texto do Prometheus, sem dependências externas
+
+Contadores e histogramas são gravados em células por thread: cada thread só escreve na
+sua própria célula (sem lock no caminho quente) e a leitura soma as células no /metrics.
+Gauges são lidos por callback no momento da coleta.
+"""
+import bisect
+import math
+import re
+import threading
+import time
+from contextlib import ContextDecorator
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Buckets padrão em segundos (de 1ms a 30s)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_INVALID_NAME_CHARS = re.compile(r"[^a-zA-Z0-9_]")
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(names: Sequence[str], values: Sequence[Any], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class _ThreadCells:
+    """Uma lista de valores por thread; a soma das listas é o valor da métrica"""
+
+    def __init__(self, size: int):
+        self._size = size
+        self._local = threading.local()
+        self._cells: List[List[float]] = []
+        self._lock = threading.Lock()
+
+    def cell(self) -> List[float]:
+        cell = getattr(self._local, "cell", None)
+        if cell is None:
+            # Lock apenas no primeiro uso da métrica por cada thread
+            cell = [0] * self._size
+            with self._lock:
+                self._cells.append(cell)
+            self._local.cell = cell
+        return cell
+
+    def totals(self) -> List[float]:
+        with self._lock:
+            cells = list(self._cells)
+        return [sum(column) for column in zip(*cells)] if cells else [0] * self._size
+
+class _Timer(ContextDecorator):
+    """Mede a duração do bloco (ou da função decorada) em segundos"""
+
+    def __init__(self, observe: Callable[[float], None]):
+        self._observe = observe
+        self._start = 0.0
+
+    def _recreate_cm(self):
+        # Cada chamada da função decorada usa um timer próprio (chamadas concorrentes)
+        return _Timer(self._observe)
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._observe(time.perf_counter() - self._start)
+        return False
+
+class CounterChild:
+    def __init__(self):
+        self._cells = _ThreadCells(1)
+
+    def inc(self, amount: float = 1):
+        self._cells.cell()[0] += amount
+
+    def value(self) -> float:
+        return self._cells.totals()[0]
+
+class HistogramChild:
+    def __init__(self, buckets: Sequence[float]):
+        self._buckets = buckets
+        # Layout da célula: uma contagem por bucket, +Inf e a soma das observações
+        self._cells = _ThreadCells(len(buckets) + 2)
+
+    def observe(self, value: float):
+        cell = self._cells.cell()
+        cell[bisect.bisect_left(self._buckets, value)] += 1
+        cell[-1] += value
+
+    def time(self) -> _Timer:
+        return _Timer(self.observe)
+
+    def snapshot(self) -> Tuple[List[float], float, float]:
+        """(contagens cumulativas por bucket incluindo +Inf, soma, total)"""
+        totals = self._cells.totals()
+        cumulative = []
+        running = 0
+        for count in totals[:-1]:
+            running += count
+            cumulative.append(running)
+        return cumulative, totals[-1], running
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = _INVALID_NAME_CHARS.sub("_", name)
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple, Any] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self._child(())
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _child(self, key: Tuple):
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def labels(self, *values: Any, **labels: Any):
+        if labels:
+            values = tuple(labels[name] for name in self.labelnames)
+        return self._child(tuple(str(value) for value in values))
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return CounterChild()
+
+    def inc(self, amount: float = 1):
+        self._default.inc(amount)
+
+    def collect(self) -> List[str]:
+        lines = self.header()
+        for key, child in list(self._children.items()):
+            lines.append(f"{self.name}_total{_format_labels(self.labelnames, key)} {_format_value(child.value())}")
+        return lines
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def time(self) -> _Timer:
+        return self._default.time()
+
+    def collect(self) -> List[str]:
+        lines = self.header()
+        bounds = self.buckets + (math.inf,)
+        for key, child in list(self._children.items()):
+            cumulative, total_sum, count = child.snapshot()
+            for bound, value in zip(bounds, cumulative):
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {_format_value(value)}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total_sum)}")
+            lines.append(f"{self.name}_count{labels} {_format_value(count)}")
+        return lines
+
+class Gauge(_Metric):
+    """
+    Gauge lido por callback na coleta; o callback retorna um número ou,
+    com labels, um dict {tupla de valores dos labels: número}
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, callback: Callable[[], Any], labelnames: Sequence[str] = ()):
+        self.callback = callback
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return None
+
+    def collect(self) -> List[str]:
+        try:
+            value = self.callback()
+        except Exception:
+            # Componente indisponível (ex: ainda não inicializado): a coleta segue sem o gauge
+            return []
+        if value is None:
+            return []
+        samples = value.items() if self.labelnames else [((), value)]
+        lines = self.header()
+        for key, sample in samples:
+            key = key if isinstance(key, tuple) else (key,)
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(float(sample))}")
+        return lines
+
+def percentile(sorted_values: Sequence[float], q: float) -> float:
+    """Percentil por posição mais próxima (valores já ordenados); 0.0 sem valores"""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+def latency_summary(values: Iterable[float], scale: float = 1.0, digits: int = 2) -> Dict[str, Any]:
+    """Contagem, média, p50, p95 e máximo (em ms, após multiplicar por `scale`) de uma janela de latências"""
+    values = sorted(values)
+    summary: Dict[str, Any] = {"count": len(values)}
+    if values:
+        summary.update({
+            "avg_ms": round(sum(values) / len(values) * scale, digits),
+            "p50_ms": round(percentile(values, 0.5) * scale, digits),
+            "p95_ms": round(percentile(values, 0.95) * scale, digits),
+            "max_ms": round(values[-1] * scale, digits)
+        })
+    return summary
+
+def flatten_stats(stats: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    """Achata um dict de stats() em {nome: valor} com os valores numéricos (listas são ignoradas)"""
+    flat = {}
+    for key, value in stats.items():
+        name = f"{prefix}_{key}" if prefix else str(key)
+        if isinstance(value, bool):
+            flat[name] = float(value)
+        elif isinstance(value, (int, float)):
+            flat[name] = float(value)
+        elif isinstance(value, dict):
+            flat.update(flatten_stats(value, name))
+    return flat
+
+class MetricsRegistry:
+    """Registro das métricas expostas no /metrics"""
+
+    def __init__(self, namespace: str = ""):
+        self.namespace = namespace
+        self._metrics: Dict[str, _Metric] = {}
+        self._stats_providers: Dict[str, Callable[[], Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                # Registro idempotente (ex: servidor recarregado no mesmo processo)
+                return self._metrics[metric.name]
+            self._metrics[metric.name] = metric
+        return metric
+
+    def _name(self, name: str) -> str:
+        return f"{self.namespace}_{name}" if self.namespace else name
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(self._name(name), documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(self._name(name), documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, callback: Callable[[], Any], labelnames: Sequence[str] = ()) -> Gauge:
+        gauge = self._register(Gauge(self._name(name), documentation, callback, labelnames))
+        gauge.callback = callback
+        return gauge
+
+    def register_stats(self, component: str, provider: Callable[[], Dict[str, Any]]):
+        """Expõe os valores numéricos do stats() de um componente como gauges `<component>_<chave>`"""
+        with self._lock:
+            self._stats_providers[component] = provider
+
+    def render(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+            providers = list(self._stats_providers.items())
+        for metric in metrics:
+            lines.extend(metric.collect())
+        for component, provider in providers:
+            try:
+                stats = flatten_stats(provider())
+            except Exception as e:
+                lines.append(f"# {component} stats unavailable: {type(e).__name__}")
+                continue
+            for key, value in stats.items():
+                name = _INVALID_NAME_CHARS.sub("_", self._name(f"{component}_{key}"))
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = MetricsRegistry("conversation")
+
+# Métricas do caminho quente (usadas pelos módulos de canal, conversa e WhatsApp)
+WEBHOOK_SECONDS = REGISTRY.histogram("webhook_request_seconds", "Tempo de tratamento do POST /webhook")
+PIPELINE_STAGE_SECONDS = REGISTRY.histogram(
+    "pipeline_stage_seconds", "Duração de cada execução de estágio do pipeline", ("channel", "stage")
+)
+DB_OPERATION_SECONDS = REGISTRY.histogram("db_operation_seconds", "Duração das operações do repositório", ("operation",))
+RESPONSE_GENERATION_SECONDS = REGISTRY.histogram(
+    "response_generation_seconds", "Duração das gerações do motor de resposta", ("engine",)
+)
+TRANSCRIPTION_SECONDS = REGISTRY.histogram(
+    "transcription_seconds", "Duração das transcrições no pool dedicado",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+)
+OUTBOUND_SEND_SECONDS = REGISTRY.histogram("outbound_send_seconds", "Tempo da resposta na fila de envio até o envio")
+MESSAGES_TOTAL = REGISTRY.counter("messages", "Mensagens por status de processamento", ("channel", "status"))
+WEBHOOK_MESSAGES_TOTAL = REGISTRY.counter("webhook_messages", "Mensagens do webhook por resultado da admissão", ("status",))
+DELIVERY_STATUSES_TOTAL = REGISTRY.counter("delivery_statuses", "Callbacks de status de entrega recebidos", ("status",))
+ERRORS_TOTAL = REGISTRY.counter("errors", "Erros por componente", ("component",))
@@ -0,0 +1,197 @@
+"""
+Contabilidade de queries SQL por requisição ou job
+
+Hooks de evento do engine do SQLAlchemy somam, em cada escopo aberto com `track_queries`
+(propagado por contextvars, inclusive para o threadpool do FastAPI), o número de queries,
+o tempo total no banco e os statements mais lentos. Queries acima do limite vão para o
+slow log e o mesmo SELECT repetido muitas vezes em um escopo é sinalizado como possível N+1.
+No modo estrito (testes) um escopo que excede o orçamento declarado levanta QueryBudgetExceededError.
+"""
+import contextvars
+import heapq
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .structured_logging import log_event
+
+logger = logging.getLogger(__name__)
+
+STATEMENT_PREVIEW_CHARS = 300
+
+# Escopos ativos no contexto atual (o mais interno por último); escopos aninhados também somam no externo
+_scopes: contextvars.ContextVar[Tuple["QueryStats", ...]] = contextvars.ContextVar("query_scopes", default=())
+
+_config = {"n_plus_one_threshold": 10, "strict": False}
+_aggregates: Dict[str, Dict[str, Any]] = {}
+_slow_queries = 0
+_lock = threading.Lock()
+
+class QueryBudgetExceededError(AssertionError):
+    """Exceção do modo estrito quando um escopo executa mais queries que o orçamento"""
+    def __init__(self, scope: str, queries: int, budget: int, statements: List[Tuple[str, int]]):
+        self.scope = scope
+        self.queries = queries
+        self.budget = budget
+        self.statements = statements
+        repeated = "; ".join(f"{count}x {statement[:120]}" for statement, count in statements[:3])
+        super().__init__(f"Scope '{scope}' ran {queries} queries (budget {budget}): {repeated}")
+
+def _preview(statement: str) -> str:
+    statement = " ".join(statement.split())
+    return statement if len(statement) <= STATEMENT_PREVIEW_CHARS else statement[:STATEMENT_PREVIEW_CHARS] + "..."
+
+class QueryStats:
+    """Queries executadas dentro de um escopo"""
+
+    def __init__(self, name: str, budget: Optional[int] = None, keep_slowest: int = 5):
+        self.name = name
+        self.budget = budget
+        self.queries = 0
+        self.total_seconds = 0.0
+        self.statements: Dict[str, int] = {}
+        self._slowest: List[Tuple[float, str]] = []
+        self._keep_slowest = keep_slowest
+
+    def record(self, statement: str, seconds: float):
+        self.queries += 1
+        self.total_seconds += seconds
+        self.statements[statement] = self.statements.get(statement, 0) + 1
+        if len(self._slowest) < self._keep_slowest:
+            heapq.heappush(self._slowest, (seconds, statement))
+        elif seconds > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, (seconds, statement))
+
+    def slowest(self) -> List[Dict[str, Any]]:
+        return [
+            {"ms": round(seconds * 1000, 3), "statement": _preview(statement)}
+            for seconds, statement in sorted(self._slowest, reverse=True)
+        ]
+
+    def repeated(self, threshold: int) -> List[Tuple[str, int]]:
+        """SELECTs executados `threshold` vezes ou mais (candidatos a N+1), do mais repetido ao menos"""
+        return sorted(
+            (
+                (statement, count) for statement, count in self.statements.items()
+                if count >= threshold and statement.lstrip()[:6].upper() == "SELECT"
+            ),
+            key=lambda item: item[1], reverse=True
+        )
+
+    @property
+    def over_budget(self) -> bool:
+        return self.budget is not None and self.queries > self.budget
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "scope": self.name,
+            "queries": self.queries,
+            "db_ms": round(self.total_seconds * 1000, 3),
+            "budget": self.budget,
+            "slowest": self.slowest()
+        }
+
+def configure_query_accounting(n_plus_one_threshold: int = 10, strict: bool = False):
+    """Define o limite de repetições para o alerta de N+1 e o modo estrito dos orçamentos"""
+    _config["n_plus_one_threshold"] = n_plus_one_threshold
+    _config["strict"] = strict
+
+def install_query_hooks(engine: Engine, slow_query_ms: float = 200.0):
+    """Registra os hooks de contagem e o slow log no engine (uma vez por engine)"""
+    if getattr(engine, "_query_hooks_installed", False):
+        return
+    engine._query_hooks_installed = True
+    slow_seconds = slow_query_ms / 1000
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        global _slow_queries
+        started = conn.info.get("query_started_at")
+        if not started:
+            return
+        elapsed = time.perf_counter() - started.pop()
+        scopes = _scopes.get()
+        for scope in scopes:
+            scope.record(statement, elapsed)
+        if elapsed >= slow_seconds:
+            with _lock:
+                _slow_queries += 1
+            log_event(
+                logger, "db.slow_query", logging.WARNING,
+                ms=round(elapsed * 1000, 2), scope=scopes[-1].name if scopes else None,
+                executemany=executemany, statement=_preview(statement)
+            )
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        # A query que falhou não passa pelo after_cursor_execute
+        connection = context.connection
+        if connection is not None and connection.info.get("query_started_at"):
+            connection.info["query_started_at"].pop()
+
+def current_scope() -> Optional[QueryStats]:
+    scopes = _scopes.get()
+    return scopes[-1] if scopes else None
+
+@contextmanager
+def track_queries(name: str, budget: Optional[int] = None) -> Iterator[QueryStats]:
+    """
+    Abre um escopo de contabilidade (requisição, job ou trecho de código); também pode ser
+    usado como decorador. `budget` é o máximo de queries esperado para o escopo.
+    """
+    stats = QueryStats(name, budget)
+    token = _scopes.set(_scopes.get() + (stats,))
+    failed = False
+    try:
+        yield stats
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        _scopes.reset(token)
+        _finish(stats, raise_on_budget=not failed)
+
+def _finish(stats: QueryStats, raise_on_budget: bool):
+    repeated = stats.repeated(_config["n_plus_one_threshold"])
+    with _lock:
+        aggregate = _aggregates.setdefault(stats.name, {
+            "scopes": 0, "queries": 0, "max_queries": 0, "db_ms": 0.0, "over_budget": 0, "n_plus_one": 0
+        })
+        aggregate["scopes"] += 1
+        aggregate["queries"] += stats.queries
+        aggregate["max_queries"] = max(aggregate["max_queries"], stats.queries)
+        aggregate["db_ms"] += stats.total_seconds * 1000
+        aggregate["over_budget"] += stats.over_budget
+        aggregate["n_plus_one"] += bool(repeated)
+
+    log_event(logger, "db.queries", logging.DEBUG, scope=stats.name, queries=stats.queries,
+              db_ms=round(stats.total_seconds * 1000, 2))
+    for statement, count in repeated[:3]:
+        log_event(logger, "db.n_plus_one", logging.WARNING, scope=stats.name, count=count, statement=_preview(statement))
+    if stats.over_budget:
+        log_event(logger, "db.query_budget_exceeded", logging.WARNING, scope=stats.name, queries=stats.queries,
+                  budget=stats.budget, db_ms=round(stats.total_seconds * 1000, 2), slowest=stats.slowest()[:3])
+        if _config["strict"] and raise_on_budget:
+            raise QueryBudgetExceededError(stats.name, stats.queries, stats.budget,
+                                           sorted(stats.statements.items(), key=lambda item: item[1], reverse=True))
+
+def query_stats() -> Dict[str, Any]:
+    """Totais por escopo desde o início do processo (média de queries e de tempo no banco por escopo)"""
+    with _lock:
+        scopes = {name: dict(aggregate) for name, aggregate in _aggregates.items()}
+        slow_queries = _slow_queries
+    for aggregate in scopes.values():
+        count = aggregate["scopes"]
+        aggregate["avg_queries"] = round(aggregate["queries"] / count, 2) if count else 0.0
+        aggregate["avg_db_ms"] = round(aggregate["db_ms"] / count, 3) if count else 0.0
+        aggregate["db_ms"] = round(aggregate["db_ms"], 3)
+    return {"slow_queries": slow_queries, "scopes": scopes}
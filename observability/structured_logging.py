@@ -0,0 +1,138 @@
+"""
+Logging não bloqueante: QueueHandler + listener em thread própria, eventos estruturados
+(chave=valor ou JSON) com formatação preguiçosa e amostragem por evento
+"""
+import atexit
+import json
+import logging
+import queue
+import random
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional, TextIO
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# Taxa de amostragem por evento (1.0 = todos); WARNING ou acima nunca é amostrado
+_sampling: Dict[str, float] = {}
+_listener: Optional[QueueListener] = None
+
+def parse_sampling(spec: str) -> Dict[str, float]:
+    """Converte "message.added=0.01,batch.processed=0.1" em {evento: taxa}"""
+    rates = {}
+    for item in (spec or "").split(","):
+        if "=" not in item:
+            continue
+        event, rate = item.split("=", 1)
+        rates[event.strip()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+def set_sampling(rates: Dict[str, float]):
+    global _sampling
+    _sampling = dict(rates)
+
+def log_event(logger: logging.Logger, event: str, level: int = logging.INFO, **fields: Any):
+    """
+    Registra um evento estruturado
+
+    Nada é formatado aqui: o nível e a amostragem são verificados antes de criar o record e
+    os campos só viram texto na thread do listener. O record é montado a partir do frame
+    do chamador, sem o `findCaller` do logging (a parte mais cara de `logger.log`).
+    """
+    if not logger.isEnabledFor(level):
+        return
+    rate = _sampling.get(event, 1.0) if level < logging.WARNING else 1.0
+    if rate < 1.0 and random.random() >= rate:
+        return
+    caller = sys._getframe(1)
+    record = logger.makeRecord(
+        logger.name, level, caller.f_code.co_filename, caller.f_lineno, event, None, None,
+        func=caller.f_code.co_name, extra={"event": event, "fields": fields, "sample_rate": rate}
+    )
+    logger.handle(record)
+
+def _render_fields(fields: Dict[str, Any]) -> str:
+    return " ".join(f"{key}={value}" for key, value in fields.items())
+
+class KeyValueFormatter(logging.Formatter):
+    """Formato texto do projeto; eventos estruturados viram `evento chave=valor ...`"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = getattr(record, "fields", None)
+        if fields is not None:
+            record.msg = f"{record.event} {_render_fields(fields)}".rstrip()
+            record.args = None
+        return super().format(record)
+
+class JsonFormatter(logging.Formatter):
+    """Uma linha JSON por record"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": getattr(record, "event", None),
+            "message": record.getMessage() if not hasattr(record, "event") else None
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if getattr(record, "sample_rate", 1.0) < 1.0:
+            entry["sample_rate"] = record.sample_rate
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps({key: value for key, value in entry.items() if value is not None}, default=str, ensure_ascii=False)
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Enfileira o record sem formatá-lo (a formatação fica para o listener) e descarta
+    records quando a fila está cheia, em vez de bloquear quem registra
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+def configure_logging(level: str = "INFO", output: str = "text", fmt: str = TEXT_FORMAT,
+                      sampling: Optional[Dict[str, float]] = None, queue_size: int = 10000,
+                      stream: Optional[TextIO] = None) -> QueueListener:
+    """
+    Substitui os handlers do logger raiz por um DeferredQueueHandler; um QueueListener
+    escreve em `stream` (stderr por padrão) em thread própria. Chamadas repetidas
+    reconfiguram o listener.
+    """
+    global _listener
+    if _listener:
+        _listener.stop()
+
+    stream_handler = logging.StreamHandler(stream)
+    stream_handler.setFormatter(JsonFormatter() if output == "json" else KeyValueFormatter(fmt))
+    log_queue = queue.Queue(maxsize=queue_size)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(DeferredQueueHandler(log_queue))
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+    set_sampling(sampling or {})
+
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+def stop_logging():
+    """Descarrega a fila e para o listener"""
+    global _listener
+    if _listener:
+        _listener.stop()
+        _listener = None
+
+atexit.register(stop_logging)
@@ -3,17 +3,24 @@
 CLI robusto para o sistema Weblocal
 """
 import argparse
+import json
 import logging
 import sys
+import threading
+import time
+from collections import Counter
 from pathlib import Path
+from typing import Dict, Iterable, Iterator, List
 
 # Adicionar o diretório raiz ao path
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
+from observability import percentile
 from weblocal.dependencies import WeblocalServiceFactory
 from weblocal.builders import PayloadBuilder
-from weblocal.models import User
+from weblocal.gateway import LocalGateway
+from weblocal.models import Message, Payload, User
 
 # Configurar logging
 logging.basicConfig(
@@ -39,17 +46,21 @@ class WeblocalCLI:
             logger.error(f"Erro ao configurar serviços: {e}")
             sys.exit(1)
     
+    @staticmethod
+    def build_payload(user_id: str, message: str, message_type: str = "text") -> Payload:
+        """Monta o payload local de uma mensagem de texto, áudio ou imagem"""
+        if message_type == "text":
+            return PayloadBuilder.create_text_payload(user_id, message)
+        elif message_type == "audio":
+            return PayloadBuilder.create_audio_payload(user_id, f"audio_{user_id}", "audio/ogg")
+        elif message_type == "image":
+            return PayloadBuilder.create_image_payload(user_id, f"image_{user_id}", "image/jpeg")
+        raise ValueError(f"Tipo de mensagem inválido: {message_type}")
+    
     def send_message(self, user_id: str, message: str, message_type: str = "text"):
         """Envia uma mensagem"""
         try:
-            if message_type == "text":
-                payload = PayloadBuilder.create_text_payload(user_id, message)
-            elif message_type == "audio":
-                payload = PayloadBuilder.create_audio_payload(user_id, f"audio_{user_id}", "audio/ogg")
-            elif message_type == "image":
-                payload = PayloadBuilder.create_image_payload(user_id, f"image_{user_id}", "image/jpeg")
-            else:
-                raise ValueError(f"Tipo de mensagem inválido: {message_type}")
+            payload = self.build_payload(user_id, message, message_type)
             
             result = self.weblocal.respond_and_send_message(payload)
             
@@ -140,6 +151,93 @@ class WeblocalCLI:
                 logger.error(f"Erro no modo interativo: {e}")
                 print(f"❌ Erro: {e}")
     
+    def _replay_messages(self, lines: Iterable[str], invalid: Counter) -> Iterator[Message]:
+        """
+        Lê as mensagens do replay: cada linha é um Payload completo ou
+        {"user": ..., "message": ..., "type": "text|audio|image"}
+        """
+        for line_number, line in enumerate(lines, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                data = json.loads(line)
+                if "entry" in data:
+                    payload = Payload.model_validate(data)
+                else:
+                    payload = self.build_payload(data.get("user", "user_cli"), data.get("message", ""), data.get("type", "text"))
+            except ValueError as e:
+                logger.warning(f"Linha {line_number} ignorada: {e}")
+                invalid["invalid_line"] += 1
+                continue
+            for message in self.weblocal.parse_messages(payload):
+                # O replay reenvia as mensagens como novas (senão seriam descartadas como expiradas)
+                message.timestamp = str(int(time.time()))
+                yield message
+    
+    def replay(self, lines: Iterable[str], parallelism: int = 4, batch_size: int = 64, queue_size: int = 1000) -> Dict:
+        """
+        Reproduz um arquivo JSONL pelo pipeline do WeblocalService em lotes
+        
+        As mensagens são distribuídas por usuário em `parallelism` workers (ordem preservada
+        por usuário); cada worker responde até `batch_size` mensagens por lote.
+        Retorna vazão e latência (do envio à resposta) p50/p95/p99.
+        """
+        gateway = LocalGateway(self.weblocal, num_workers=parallelism, max_queue_size=queue_size, max_batch_size=batch_size)
+        latencies: List[float] = []
+        statuses: Counter = Counter()
+        lock = threading.Lock()
+        
+        def record(future, submitted_at: float):
+            latency_ms = (time.perf_counter() - submitted_at) * 1000
+            status = "error" if future.exception() else future.result().get("status", "error")
+            with lock:
+                latencies.append(latency_ms)
+                statuses[status] += 1
+        
+        gateway.start()
+        start = time.perf_counter()
+        try:
+            for message in self._replay_messages(lines, statuses):
+                submitted_at = time.perf_counter()
+                # Bloqueia com a fila do usuário cheia: a leitura acompanha o ritmo do pipeline
+                future = gateway.submit(message, timeout=None)
+                future.add_done_callback(lambda f, submitted_at=submitted_at: record(f, submitted_at))
+            gateway.join()
+        finally:
+            elapsed = time.perf_counter() - start
+            gateway.stop()
+        
+        latencies.sort()
+        return {
+            "messages": len(latencies),
+            "statuses": dict(statuses),
+            "elapsed_s": round(elapsed, 3),
+            "throughput_per_s": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+            "latency_ms": {
+                "p50": round(percentile(latencies, 0.50), 2),
+                "p95": round(percentile(latencies, 0.95), 2),
+                "p99": round(percentile(latencies, 0.99), 2),
+                "max": round(latencies[-1], 2) if latencies else 0.0
+            },
+            "batches": gateway.batches,
+            "stages": self.weblocal.stage_stats()
+        }
+    
+    def show_replay_report(self, report: Dict):
+        """Mostra o resultado do replay"""
+        latency = report["latency_ms"]
+        print("\n⏱️  Replay:")
+        print("=" * 40)
+        print(f"Mensagens: {report['messages']} em {report['elapsed_s']}s ({report['batches']} lotes)")
+        print(f"Vazão: {report['throughput_per_s']} msg/s")
+        print(f"Latência: p50={latency['p50']}ms p95={latency['p95']}ms p99={latency['p99']}ms max={latency['max']}ms")
+        print(f"Status: {report['statuses']}")
+        print("Estágios:")
+        for stage, stats in report["stages"].items():
+            if stats["runs"]:
+                print(f"  {stage:<9} runs={stats['runs']} avg={stats['avg_ms']}ms p95={stats['p95_ms']}ms por item={stats['per_item_ms']}ms")
+    
     def _show_help(self):
         """Mostra ajuda"""
         print("\n📋 Comandos disponíveis:")
@@ -159,6 +257,10 @@ def main():
     parser.add_argument("--history", action="store_true", help="Mostrar histórico")
     parser.add_argument("--interactive", action="store_true", help="Modo interativo")
     parser.add_argument("--limit", type=int, default=10, help="Limite de mensagens no histórico")
+    parser.add_argument("--replay", metavar="ARQUIVO", help="Reproduz mensagens de um arquivo JSONL ('-' para stdin)")
+    parser.add_argument("--parallelism", type=int, default=4, help="Workers do replay (ordem preservada por usuário)")
+    parser.add_argument("--batch-size", type=int, default=64, help="Mensagens por lote no replay")
+    parser.add_argument("--json", action="store_true", help="Relatório do replay em JSON")
     
     args = parser.parse_args()
     
@@ -175,6 +277,19 @@ def main():
             cli.interactive_mode(args.user)
         elif args.message:
             cli.send_message(args.user, args.message, args.type)
+        elif args.replay:
+            # Logs por mensagem desligados: o replay mede o pipeline, não o terminal
+            logging.getLogger().setLevel(logging.WARNING)
+            if args.replay == "-":
+                report = cli.replay(sys.stdin, args.parallelism, args.batch_size)
+            else:
+                with open(args.replay, encoding="utf-8") as file:
+                    report = cli.replay(file, args.parallelism, args.batch_size)
+            WeblocalServiceFactory.get_response_engine().stop()
+            if args.json:
+                print(json.dumps(report, indent=2))
+            else:
+                cli.show_replay_report(report)
         else:
             # Modo padrão - mostrar menu
             print("🚀 Weblocal CLI")
@@ -185,6 +300,7 @@ def main():
             print("  python cli.py --interactive --user user_123")
             print("  python cli.py --stats")
             print("  python cli.py --history --user user_123")
+            print("  python cli.py --replay mensagens.jsonl --parallelism 8")
             
     except Exception as e:
         logger.error(f"Erro na execução: {e}", exc_info=True)
@@ -2,9 +2,13 @@
 Factory pattern para gerenciar dependências do Weblocal service
 """
 import os
+from typing import Optional
+from channel.reply_cache import ReplyCache
+from channel.response_engine import ResponseEngineRunner, create_response_engine
 from conversation.db import DatabaseConfig
 from conversation.repository import ConversationRepository
 from conversation.service import ConversationService
+from weblocal.gateway import LocalGateway
 from weblocal.weblocal_service import WeblocalService
 from config.settings import settings
 
@@ -16,6 +20,9 @@ class WeblocalServiceFactory:
     _repository = None
     _conversation_service = None
     _weblocal_service = None
+    _response_engine = None
+    _reply_cache = None
+    _gateway = None
     
     def __new__(cls):
         if cls._instance is None:
@@ -30,9 +37,48 @@ class WeblocalServiceFactory:
             cls._db = DatabaseConfig("sqlite", db_path=db_path)
             cls._repository = ConversationRepository(cls._db)
             cls._conversation_service = ConversationService(cls._repository)
-            cls._weblocal_service = WeblocalService(cls._conversation_service)
+            cls._weblocal_service = WeblocalService(cls._conversation_service, response_engine=cls.get_response_engine())
         return cls._weblocal_service
     
+    @classmethod
+    def get_gateway(cls) -> LocalGateway:
+        """Retorna instância singleton da entrada concorrente (servidor HTTP/WebSocket)"""
+        if cls._gateway is None:
+            cls._gateway = LocalGateway(
+                cls.get_weblocal_service(),
+                num_workers=settings.WEBLOCAL_GATEWAY_WORKERS,
+                max_queue_size=settings.WEBLOCAL_GATEWAY_QUEUE_SIZE,
+                max_batch_size=settings.WEBLOCAL_GATEWAY_MAX_BATCH_SIZE
+            )
+        return cls._gateway
+    
+    @classmethod
+    def get_response_engine(cls) -> ResponseEngineRunner:
+        """Retorna instância singleton do motor de resposta"""
+        if cls._response_engine is None:
+            cls._response_engine = ResponseEngineRunner(create_response_engine(
+                settings.RESPONSE_ENGINE,
+                max_concurrency=settings.RESPONSE_ENGINE_CONCURRENCY,
+                timeout_seconds=settings.RESPONSE_ENGINE_TIMEOUT_SECONDS,
+                stub_latency_ms=settings.STUB_ENGINE_LATENCY_MS,
+                stub_token_latency_ms=settings.STUB_ENGINE_TOKEN_LATENCY_MS,
+                openai_model=settings.OPENAI_MODEL,
+                system_prompt=settings.RESPONSE_SYSTEM_PROMPT
+            ), reply_cache=cls.get_reply_cache())
+        return cls._response_engine
+    
+    @classmethod
+    def get_reply_cache(cls) -> Optional[ReplyCache]:
+        """Retorna instância singleton do cache de respostas (None se desativado)"""
+        if cls._reply_cache is None and settings.REPLY_CACHE_ENABLED:
+            cls._reply_cache = ReplyCache(
+                max_entries=settings.REPLY_CACHE_MAX_ENTRIES,
+                ttl_seconds=settings.REPLY_CACHE_TTL_SECONDS,
+                max_message_length=settings.REPLY_CACHE_MAX_MESSAGE_LENGTH,
+                opted_out_users=settings.REPLY_CACHE_OPT_OUT_USERS
+            )
+        return cls._reply_cache
+    
     @classmethod
     def get_conversation_service(cls, db_path: str = None) -> ConversationService:
         """Retorna instância singleton do ConversationService"""
@@ -51,3 +97,6 @@ class WeblocalServiceFactory:
         cls._repository = None
         cls._conversation_service = None
         cls._weblocal_service = None
+        cls._response_engine = None
+        cls._reply_cache = None
+        cls._gateway = None
@@ -0,0 +1,100 @@
+"""
+Entrada concorrente do canal local: mensagens de várias conexões agrupadas em lotes por remetente
+"""
+import logging
+from concurrent.futures import Future, InvalidStateError
+from typing import Any, Dict, List, Optional, Tuple
+
+from channel.dispatcher import DispatcherFullError, KeyedDispatcher
+from observability.query_stats import track_queries
+from weblocal.models import Message
+from weblocal.weblocal_service import WeblocalService
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Orçamento de queries por mensagem do lote: conversa do remetente (select + update) e insert das mensagens
+QUERY_BUDGET_PER_MESSAGE = 3
+
+class LocalGatewayFullError(Exception):
+    """Exceção quando a fila do remetente está cheia (backpressure para o cliente)"""
+
+class LocalGateway:
+    """
+    Encaminha mensagens avulsas ao pipeline do WeblocalService em lotes
+
+    As mensagens são distribuídas pelo remetente em um KeyedDispatcher: mensagens do
+    mesmo usuário são respondidas em ordem e as de usuários diferentes em paralelo.
+    Cada worker processa o que já estiver na sua fila como um único lote
+    (gerações concorrentes e uma única escrita no banco), então milhares de conexões
+    abertas não precisam de uma thread cada.
+    """
+
+    def __init__(self, service: WeblocalService, num_workers: int = 4, max_queue_size: int = 1000,
+                 max_batch_size: int = 64):
+        self.service = service
+        self.dispatcher = KeyedDispatcher(
+            self._handle_batch,
+            num_workers=num_workers,
+            max_queue_size=max_queue_size,
+            max_batch_size=max_batch_size,
+            name="weblocal-gateway"
+        )
+        self.batches = 0
+        self.rejected = 0
+
+    def start(self):
+        self.dispatcher.start()
+
+    def stop(self, timeout: float = 10.0):
+        self.dispatcher.stop(drain=True, timeout=timeout)
+
+    def join(self):
+        """Aguarda até que todas as mensagens submetidas tenham sido respondidas"""
+        self.dispatcher.join()
+
+    def submit(self, message: Message, timeout: Optional[float] = 0) -> Future:
+        """
+        Agenda a resposta de uma mensagem; o Future recebe o resultado individual do pipeline
+
+        Por padrão não bloqueia: com a fila do remetente cheia levanta LocalGatewayFullError.
+        Com timeout=None aguarda espaço na fila (backpressure para produtores síncronos).
+        """
+        future = Future()
+        try:
+            self.dispatcher.submit(message.from_, (message, future), timeout=timeout)
+        except DispatcherFullError as e:
+            self.rejected += 1
+            raise LocalGatewayFullError(str(e)) from e
+        return future
+
+    def _handle_batch(self, items: List[Tuple[Message, Future]]):
+        self.batches += 1
+        try:
+            with track_queries("weblocal-gateway", budget=1 + QUERY_BUDGET_PER_MESSAGE * len(items)):
+                batch_result = self.service.respond_to_messages([message for message, _ in items])
+        except Exception as e:
+            logger.error(f"Local batch failed: {e}", exc_info=True)
+            for _, future in items:
+                self._resolve(future, error=e)
+            return
+        for (_, future), result in zip(items, batch_result["results"]):
+            self._resolve(future, result=result)
+
+    @staticmethod
+    def _resolve(future: Future, result: Dict = None, error: Exception = None):
+        # Futures cancelados pertencem a conexões já encerradas
+        try:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        except InvalidStateError:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "rejected": self.rejected,
+            **self.dispatcher.stats()
+        }
@@ -49,4 +49,12 @@ class Entry(BaseModel):
 
 class Payload(BaseModel):
     object: str
-    entry: List[Entry]
\ No newline at end of file
+    entry: List[Entry]
+
+class MessageContext(BaseModel):
+    """Mensagem validada pelos estágios dedup e auth do pipeline do canal"""
+    message: Message
+    user: User
+    content: Optional[str] = None  # None para mídia ainda não processada
+    message_timestamp: float
+    received_at: float
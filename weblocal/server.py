@@ -0,0 +1,212 @@
+"""
+Servidor HTTP/WebSocket do canal local: exercita a pilha de conversação sem a Meta
+"""
+import asyncio
+import importlib.util
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List
+
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter, ValidationError
+
+from observability import configure_logging, parse_sampling
+from observability.query_stats import query_stats
+from weblocal.dependencies import WeblocalServiceFactory
+from weblocal.gateway import LocalGatewayFullError
+from weblocal.models import Payload
+from config.settings import settings
+
+# Configurar logging (QueueHandler + listener em thread própria)
+configure_logging(
+    settings.LOG_LEVEL,
+    output=settings.LOG_OUTPUT,
+    fmt=settings.LOG_FORMAT,
+    sampling=parse_sampling(settings.LOG_SAMPLING),
+    queue_size=settings.LOG_QUEUE_SIZE
+)
+logger = logging.getLogger(__name__)
+
+# Validador criado uma única vez (o schema do Payload é compilado na importação)
+PAYLOAD_ADAPTER = TypeAdapter(Payload)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Cria o serviço e inicia os workers da entrada em lotes; no shutdown drena as filas"""
+    app.state.lifecycle = "starting"
+    WeblocalServiceFactory.get_weblocal_service()
+    gateway = WeblocalServiceFactory.get_gateway()
+    gateway.start()
+    app.state.lifecycle = "ready"
+    yield
+    app.state.lifecycle = "draining"
+    gateway.stop(timeout=settings.SHUTDOWN_DRAIN_SECONDS)
+    WeblocalServiceFactory.get_response_engine().stop()
+    logger.info("Shutdown drain finished")
+
+# Configurar FastAPI
+app = FastAPI(
+    title="Weblocal Channel",
+    version="0.1.0",
+    lifespan=lifespan,
+    openapi_url=f"/openapi.json" if settings.IS_DEV_ENVIRONMENT else None,
+    docs_url=f"/docs" if settings.IS_DEV_ENVIRONMENT else None,
+    redoc_url=f"/redoc" if settings.IS_DEV_ENVIRONMENT else None,
+)
+
+async def respond(payload: Payload) -> List[Dict[str, Any]]:
+    """Agenda todas as mensagens do payload no gateway e aguarda os resultados (na ordem do payload)"""
+    gateway = WeblocalServiceFactory.get_gateway()
+    service = WeblocalServiceFactory.get_weblocal_service()
+    futures = [asyncio.wrap_future(gateway.submit(message)) for message in service.parse_messages(payload)]
+    return list(await asyncio.gather(*futures))
+
+def summary(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    processed = sum(1 for result in results if result.get("status") == "processed")
+    return {
+        "status": "processed" if processed else ("no_message" if not results else "not_processed"),
+        "total": len(results),
+        "processed": processed,
+        "results": results
+    }
+
+@app.exception_handler(LocalGatewayFullError)
+async def gateway_full(request: Request, exc: LocalGatewayFullError):
+    return JSONResponse(status_code=503, content={"status": "rejected", "reason": str(exc)}, headers={"Retry-After": "1"})
+
+@app.get("/health")
+def health():
+    return {"status": "healthy"}
+
+@app.get("/readiness")
+def readiness(request: Request):
+    lifecycle = getattr(request.app.state, "lifecycle", "starting")
+    if lifecycle != "ready":
+        return JSONResponse(status_code=503, content={"status": lifecycle})
+    return {"status": "ready"}
+
+@app.get("/pipeline/stats")
+def pipeline_stats():
+    """Latência de cada estágio do pipeline do canal local"""
+    return WeblocalServiceFactory.get_weblocal_service().stage_stats()
+
+@app.get("/gateway/stats")
+def gateway_stats():
+    """Lotes processados, rejeições por fila cheia e lag das filas por worker"""
+    return WeblocalServiceFactory.get_gateway().stats()
+
+@app.get("/db/queries/stats")
+def db_query_stats():
+    """Queries por lote do gateway: média e máximo, tempo no banco, orçamentos excedidos e N+1"""
+    return query_stats()
+
+@app.get("/engine/stats")
+def engine_stats():
+    return WeblocalServiceFactory.get_response_engine().stats()
+
+@app.post("/messages")
+async def post_messages(request: Request):
+    """Processa um Payload (uma ou mais mensagens) e retorna a resposta de cada mensagem"""
+    try:
+        payload = PAYLOAD_ADAPTER.validate_json(await request.body())
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid payload: {e.error_count()} errors")
+    return summary(await respond(payload))
+
+@app.post("/messages/batch")
+async def post_messages_batch(request: Request):
+    """
+    Processa um lote NDJSON (um Payload por linha); as mensagens de todas as linhas
+    entram no gateway de uma vez e os resultados voltam na ordem das linhas
+    """
+    body = await request.body()
+    payloads = []
+    invalid_lines = []
+    for line_number, line in enumerate(body.splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            payloads.append(PAYLOAD_ADAPTER.validate_json(line))
+        except ValidationError:
+            invalid_lines.append(line_number)
+
+    results = await asyncio.gather(*(respond(payload) for payload in payloads))
+    return {
+        **summary([result for payload_results in results for result in payload_results]),
+        "invalid_lines": invalid_lines
+    }
+
+@app.websocket("/ws")
+async def websocket_messages(websocket: WebSocket):
+    """
+    Cada frame de texto é um Payload; a resposta de cada mensagem é enviada assim que fica
+    pronta (fora de ordem entre remetentes, em ordem para o mesmo remetente).
+    Acima de WEBLOCAL_WS_MAX_PENDING respostas pendentes a leitura da conexão é pausada.
+    """
+    await websocket.accept()
+    gateway = WeblocalServiceFactory.get_gateway()
+    service = WeblocalServiceFactory.get_weblocal_service()
+    pending = asyncio.Semaphore(settings.WEBLOCAL_WS_MAX_PENDING)
+    tasks = set()
+
+    async def push(message_id: str, future):
+        try:
+            try:
+                response = {"type": "response", **(await asyncio.wrap_future(future))}
+            except Exception as e:
+                response = {"type": "error", "message_id": message_id, "error": str(e)}
+            await websocket.send_json(jsonable_encoder(response))
+        except (WebSocketDisconnect, RuntimeError):
+            # Conexão encerrada antes da resposta ficar pronta (a conversa já foi persistida)
+            pass
+        finally:
+            pending.release()
+
+    try:
+        while True:
+            frame = await websocket.receive_text()
+            try:
+                payload = PAYLOAD_ADAPTER.validate_json(frame)
+            except ValidationError as e:
+                await websocket.send_json({"type": "error", "error": f"Invalid payload: {e.error_count()} errors"})
+                continue
+
+            for message in service.parse_messages(payload):
+                await pending.acquire()
+                try:
+                    future = gateway.submit(message)
+                except LocalGatewayFullError as e:
+                    pending.release()
+                    await websocket.send_json({"type": "rejected", "message_id": message.id, "reason": str(e)})
+                    continue
+                task = asyncio.create_task(push(message.id, future))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        for task in tasks:
+            task.cancel()
+
+def run():
+    """Inicia o servidor do canal local (um processo; o gateway agrupa as mensagens em lotes)"""
+    loop = "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+    http = "httptools" if importlib.util.find_spec("httptools") else "h11"
+    logger.info(f"Starting Weblocal Channel on {settings.HOST}:{settings.WEBLOCAL_PORT} (loop={loop}, http={http})")
+    uvicorn.run(
+        "weblocal.server:app",
+        host=settings.HOST,
+        port=settings.WEBLOCAL_PORT,
+        loop=loop,
+        http=http,
+        backlog=4096,
+        access_log=settings.SERVER_ACCESS_LOG,
+        timeout_keep_alive=settings.SERVER_KEEP_ALIVE_SECONDS,
+        timeout_graceful_shutdown=int(settings.SHUTDOWN_DRAIN_SECONDS)
+    )
+
+if __name__ == "__main__":
+    run()
@@ -1,12 +1,11 @@
 import time
 import logging
-from typing import Callable, Dict, Optional
+from typing import Dict, List, Optional
 from channel.channel import Channel
-from weblocal.helpers import Helpers
-from weblocal.models import Payload, Message, Audio, Image, User
+from channel.response_engine import ResponseEngineRunner
+from weblocal.models import Payload, Message, MessageContext, Audio, Image, User
 from conversation.service import ConversationService
-from conversation.models import MessageData, MessageOwner
-from config.settings import settings
+from observability import log_event
 
 # Configurar logging
 logger = logging.getLogger(__name__)
@@ -14,40 +13,20 @@ logger = logging.getLogger(__name__)
 class WeblocalService(Channel):
     """Serviço para processar mensagens locais similar ao WhatsApp webhook"""
     
-    def __init__(self, conversation_service: ConversationService):
-        self.conversation_service = conversation_service
-        self.MESSAGE_EXPIRY_MINUTES = settings.MESSAGE_EXPIRY_MINUTES
-        
-    def is_message_too_old(self, message_timestamp: str, max_age_minutes: int = None) -> bool:
-        """
-        Verifica se uma mensagem é muito antiga para ser processada.
-        
-        Args:
-            message_timestamp: Timestamp da mensagem (string ou int/float)
-            max_age_minutes: Idade máxima em minutos antes de considerar muito antiga
-        
-        Returns:
-            bool: True se a mensagem for muito antiga, False caso contrário
-        """
-        if max_age_minutes is None:
-            max_age_minutes = self.MESSAGE_EXPIRY_MINUTES
-            
-        current_time = time.time()
-        
-        # Converter message_timestamp para float se for string
-        try:
-            if isinstance(message_timestamp, str):
-                message_time = float(message_timestamp)
-            else:
-                message_time = float(message_timestamp)
-        except (ValueError, TypeError):
-            # Se não conseguir fazer parse do timestamp, considerar muito antigo por segurança
-            return True
-        
-        # Calcular idade em minutos
-        age_minutes = (current_time - message_time) / 60
-        
-        return age_minutes > max_age_minutes
+    name = "local"
+    context_model = MessageContext
+    
+    def __init__(self, conversation_service: ConversationService, response_engine: ResponseEngineRunner = None):
+        super().__init__(conversation_service, response_engine=response_engine)
+    
+    def parse_messages(self, payload: Payload) -> List[Message]:
+        """Extrai todas as mensagens do payload"""
+        return [
+            message
+            for entry in payload.entry
+            for change in entry.changes
+            for message in (change.value.messages or [])
+        ]
 
     def parse_message(self, payload: Payload) -> Optional[Message]:
         """Extrai a mensagem do payload"""
@@ -83,6 +62,9 @@ class WeblocalService(Channel):
                 role="basic"
             )
 
+    def get_users(self, senders: List[str]) -> Dict[str, User]:
+        return {sender: self.get_user_by_id(sender) for sender in senders}
+
     def transcribe_audio(self, audio: Audio) -> str:
         """
         Mock para transcrição de áudio local
@@ -126,151 +108,21 @@ class WeblocalService(Channel):
         
         return "\n".join(context_lines)
 
-#=========================================================================================
-
-    def save_request(self, user: User, owner: MessageOwner, channel: str, client_hub: str, message: str, message_type: str, meta: Dict = None):
-        """Salva a mensagem do usuário no sistema de conversação"""
-        client_hub = f"user_{user.id}"
-        
-        # Criar dados da mensagem
-        message_data = MessageData(
-            message=message,
-            type=message_type,
-            owner=owner,
-            meta=meta or {},
-            channel=channel
-        )
-        
-        # Obter ou criar conversa
-        conversation_uuid, is_new = self.conversation_service.get_or_create_conversation_uuid(
-            client_hub=client_hub,
-            channel=channel
-        )
-        
-        # Adicionar mensagem
-        message_dict, conversation_closed = self.conversation_service.add_message(
-            conversation_uuid=conversation_uuid,
-            message_data=message_data
-        )
-        
-        if is_new:
-            logger.info(f"Nova conversa criada para usuário {user.first_name} {user.last_name}")
-        
-        logger.debug(f"Mensagem salva: {message[:50]}...")
-        return conversation_uuid, message_dict
-    
-    def save_response(self, user: User, owner: MessageOwner, channel: str, client_hub: str, response: str, message_type: str, agent_type: str = "local_agent" , meta: Dict = None):
-        """Salva a resposta do agente no sistema de conversação"""
-        client_hub = f"user_{user.id}"
-        
-        # Criar dados da resposta
-        message_data = MessageData(
-            message=response,
-            type=message_type,
-            owner=owner,
-            meta={
-                "agent_type": agent_type,
-                **(meta or {})
-            },
-            channel=channel
-        )
-        
-        # Obter conversa existente
-        conversation_uuid, _ = self.conversation_service.get_or_create_conversation_uuid(
-            client_hub=client_hub,
-            channel=channel
-        )
-        
-        # Adicionar resposta
-        message_dict, conversation_closed = self.conversation_service.add_message(
-            conversation_uuid=conversation_uuid,
-            message_data=message_data
-        )
-        
-        logger.debug(f"Resposta do agente salva: {response[:50]}...")
-        return message_dict
+    def deliver(self, message: Message, user: User, response: str) -> Optional[str]:
+        """A resposta local é devolvida no próprio resultado (não há envio)"""
+        return None
     
     def respond_and_send_message(self, payload: Payload, channel: str = "local") -> Dict:
         """
-        Processa uma mensagem local
+        Processa uma mensagem local (todos os estágios do pipeline na mesma chamada)
         """
         start_time = time.time()
-        
-        try:
-            # Parse da mensagem
-            message = self.parse_message(payload)
-            if not message:
-                logger.warning("No message found in payload")
-                return {"status": "no_message", "error": "No message found in payload"}
-            
-            # Verificar se a mensagem não é muito antiga
-            if self.is_message_too_old(message.timestamp):
-                logger.warning(f"Message too old: {message.timestamp}")
-                return {
-                    "status": "expired", 
-                    "error": "Message is too old to be processed",
-                    "max_age_minutes": self.MESSAGE_EXPIRY_MINUTES
-                }
-            
-            # Obter usuário
-            user = self.get_user_by_id(message.from_)
-            if not user:
-                logger.warning(f"User not found for ID: {message.from_}")
-                return {"status": "user_not_found", "error": "User not found"}
-            
-            # Extrair conteúdo da mensagem
-            message_content = self.extract_message_content(message)
-            if not message_content:
-                logger.warning("No message content found")
-                return {"status": "no_content", "error": "No message content found"}
-            
-            logger.info(f"Mensagem recebida de {user.first_name} {user.last_name}: {message_content}")
-            
-            # Salvar mensagem do usuário
-            conversation_uuid, user_message_dict = self.save_request(
-                user=user,
-                owner=MessageOwner.USER,
-                channel=channel,
-                client_hub="todo",
-                message=message_content,
-                message_type=message.type,
-                meta={"original_message_id": message.id}
-            )
-            
-            # Gerar resposta
-            response = Helpers.generate_response(message_content, user)
-            
-            # Salvar resposta do agente
-            agent_message_dict = self.save_response(
-                user=user,
-                owner=MessageOwner.AGENT,
-                channel=channel,
-                client_hub="todo",
-                message_type=message.type,
-                response=response,
-                meta={"response_to": message.id}
-            )
-            
-            processing_time = round((time.time() - start_time) * 1000, 2)
-            
-            logger.info(f"Processed message for user {user.first_name} {user.last_name} in {processing_time}ms")
-            
-            return {
-                "status": "processed",
-                "user": {
-                    "id": user.id,
-                    "name": f"{user.first_name} {user.last_name}"
-                },
-                "conversation_uuid": conversation_uuid,
-                "user_message": user_message_dict,
-                "agent_response": agent_message_dict,
-                "response_text": response,
-                "processing_time_ms": processing_time
-            }
-            
-        except ValueError as e:
-            logger.error(f"Validation error: {e}")
-            return {"status": "error", "message": str(e)}
-        except Exception as e:
-            logger.error(f"Unexpected error processing message: {e}", exc_info=True)
-            return {"status": "error", "message": "Internal server error"}
+        result = super().respond_and_send_message(payload, channel=channel)
+        if result.get("total") != 1:
+            return result
+        
+        processing_time = round((time.time() - start_time) * 1000, 2)
+        message_result = result["results"][0]
+        if message_result.get("status") == "processed":
+            log_event(logger, "message.processed", user_id=message_result["user"]["id"], ms=processing_time)
+        return {**message_result, "processing_time_ms": processing_time}
@@ -0,0 +1,136 @@
+"""
+Controle de admissão do /webhook: limita requisições simultâneas e jobs enfileirados
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Optional
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+class AdmissionRejectedError(Exception):
+    """Exceção quando o servidor está saturado; a Meta reentrega após Retry-After"""
+    def __init__(self, reason: str, retry_after_seconds: int):
+        self.reason = reason
+        self.retry_after_seconds = retry_after_seconds
+        super().__init__(f"Webhook rejected: {reason}")
+
+class AdmissionController:
+    """
+    Rejeita rapidamente (503 + Retry-After) quando o servidor está saturado
+
+    - `max_in_flight`: requisições /webhook em processamento simultâneo
+    - `max_queued_text` / `max_queued_media`: jobs pendentes ou em processamento na fila de
+      entrada por classe; a profundidade vem de `depth_provider` e é atualizada no máximo a
+      cada `depth_refresh_seconds` (evita uma consulta ao banco por requisição)
+
+    Limites iguais a 0 desativam a verificação correspondente.
+    """
+
+    def __init__(self, depth_provider: Callable[[], Dict[str, int]], max_in_flight: int = 200,
+                 max_queued_text: int = 5000, max_queued_media: int = 500,
+                 media_kinds: Iterable[str] = ("audio", "image"), retry_after_seconds: int = 5,
+                 depth_refresh_seconds: float = 1.0):
+        self.depth_provider = depth_provider
+        self.max_in_flight = max_in_flight
+        self.max_queued_text = max_queued_text
+        self.max_queued_media = max_queued_media
+        self.media_kinds = set(media_kinds)
+        self.retry_after_seconds = retry_after_seconds
+        self.depth_refresh_seconds = depth_refresh_seconds
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._depth = {"text": 0, "media": 0}
+        self._depth_checked_at = 0.0
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {"in_flight": 0, "text_queue": 0, "media_queue": 0}
+
+    def _reject(self, reason: str):
+        with self._lock:
+            self.rejected[reason] += 1
+        logger.warning(f"Webhook rejected ({reason}), retry after {self.retry_after_seconds}s")
+        raise AdmissionRejectedError(reason, self.retry_after_seconds)
+
+    @contextmanager
+    def track_request(self):
+        """Conta a requisição como em processamento; rejeita se o limite já foi atingido"""
+        with self._lock:
+            saturated = self.max_in_flight and self._in_flight >= self.max_in_flight
+            if not saturated:
+                self._in_flight += 1
+        if saturated:
+            self._reject("in_flight")
+
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def _queue_depth(self) -> Dict[str, int]:
+        now = time.monotonic()
+        if now - self._depth_checked_at >= self.depth_refresh_seconds:
+            self._depth_checked_at = now
+            try:
+                by_kind = self.depth_provider()
+            except Exception as e:
+                # Sem a profundidade atual a admissão usa o último valor conhecido
+                logger.error(f"Failed to refresh queue depth for admission control: {e}")
+            else:
+                media = sum(count for kind, count in by_kind.items() if kind in self.media_kinds)
+                self._depth = {"text": sum(by_kind.values()) - media, "media": media}
+        return self._depth
+
+    def note_enqueued(self, kinds: Iterable[str]):
+        """Atualiza a profundidade em cache com os jobs recém-enfileirados (até a próxima leitura)"""
+        with self._lock:
+            for kind in kinds:
+                self._depth["media" if kind in self.media_kinds else "text"] += 1
+
+    def admit_jobs(self, kinds: Iterable[str]):
+        """Verifica se há espaço na fila para os tipos de job do webhook; levanta AdmissionRejectedError"""
+        kinds = set(kinds)
+        if not kinds:
+            return
+
+        depth = self._queue_depth()
+        has_media = bool(kinds & self.media_kinds)
+        has_text = bool(kinds - self.media_kinds)
+        if has_media and self.max_queued_media and depth["media"] >= self.max_queued_media:
+            self._reject("media_queue")
+        if has_text and self.max_queued_text and depth["text"] >= self.max_queued_text:
+            self._reject("text_queue")
+        with self._lock:
+            self.admitted += 1
+
+    def saturation(self) -> Dict[str, Optional[float]]:
+        """Ocupação de cada limite (0.0 a 1.0; None quando o limite está desativado)"""
+        depth = self._queue_depth()
+
+        def ratio(value: int, limit: int) -> Optional[float]:
+            return round(value / limit, 4) if limit else None
+
+        return {
+            "in_flight": ratio(self._in_flight, self.max_in_flight),
+            "text_queue": ratio(depth["text"], self.max_queued_text),
+            "media_queue": ratio(depth["media"], self.max_queued_media)
+        }
+
+    def is_saturated(self) -> bool:
+        return any(value is not None and value >= 1.0 for value in self.saturation().values())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self._in_flight,
+            "queued": dict(self._depth),
+            "limits": {
+                "in_flight": self.max_in_flight,
+                "text_queue": self.max_queued_text,
+                "media_queue": self.max_queued_media
+            },
+            "saturation": self.saturation(),
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected)
+        }
@@ -2,15 +2,37 @@
 Factory pattern para gerenciar dependências do WhatsApp service
 """
 import os
+import time
+from typing import Dict, Optional
+
+from channel.reply_cache import ReplyCache
+from channel.response_engine import ResponseEngineRunner, create_response_engine
 from conversation.db import DatabaseConfig
+from conversation.dedup import MessageDeduplicator
+from conversation.job_queue import JobQueue, JobWorkerPool
 from conversation.repository import ConversationRepository
 from conversation.service import ConversationService
+from conversation.status_recorder import StatusRecorder
 from whatsapp.whatsapp_service import WhatsappService
+from whatsapp.admission import AdmissionController
+from whatsapp.graph_client import AsyncGraphClient, GraphClient
+from whatsapp.media_cache import MediaCache
+from whatsapp.outbound import OutboundDispatcher
+from whatsapp.transcription import FakeTranscriber, TranscriptionPool
+from whatsapp.user_directory import JsonUserDirectory, SqliteUserDirectory, UserDirectory
+from config.settings import settings
 from dotenv import load_dotenv
 
 # Carregar variáveis de ambiente
 load_dotenv()
 
+# Tipos de job consumidos pelo pool de mídia
+MEDIA_JOB_KINDS = ["audio", "image"]
+
+# Orçamento de queries por job de um lote: conversa do remetente (select + update), insert das
+# mensagens e o registro de falha do job
+JOB_QUERY_BUDGET_PER_JOB = 4
+
 class ServiceFactory:
     """Factory singleton para criar e gerenciar instâncias de serviços"""
     
@@ -19,6 +41,19 @@ class ServiceFactory:
     _repository = None
     _conversation_service = None
     _whatsapp_service = None
+    _message_deduplicator = None
+    _status_recorder = None
+    _admission_controller = None
+    _job_queue = None
+    _job_worker_pool = None
+    _media_job_worker_pool = None
+    _transcription_pool = None
+    _user_directory = None
+    _graph_client = None
+    _outbound_dispatcher = None
+    _media_cache = None
+    _response_engine = None
+    _reply_cache = None
     
     def __new__(cls):
         if cls._instance is None:
@@ -29,21 +64,214 @@ class ServiceFactory:
     def get_whatsapp_service(cls) -> WhatsappService:
         """Retorna instância singleton do WhatsappService"""
         if cls._whatsapp_service is None:
-            cls._db = DatabaseConfig("sqlite", db_path="conversations.db")
-            cls._repository = ConversationRepository(cls._db)
-            cls._conversation_service = ConversationService(cls._repository)
-            cls._whatsapp_service = WhatsappService(cls._conversation_service)
+            cls._whatsapp_service = WhatsappService(
+                cls.get_conversation_service(),
+                user_directory=cls.get_user_directory(),
+                graph_client=cls.get_graph_client(),
+                outbound=cls.get_outbound_dispatcher() if settings.WHATSAPP_SEND_REPLIES else None,
+                media_cache=cls.get_media_cache() if settings.MEDIA_CACHE_ENABLED else None,
+                transcriber=FakeTranscriber(settings.FAKE_TRANSCRIBER_LATENCY_MS) if settings.TRANSCRIBER == "fake" else None,
+                transcription_pool=cls.get_transcription_pool(),
+                response_engine=cls.get_response_engine(),
+                deduplicator=cls.get_message_deduplicator()
+            )
         return cls._whatsapp_service
     
+    @classmethod
+    def get_response_engine(cls) -> ResponseEngineRunner:
+        """Retorna instância singleton do motor de resposta (event loop próprio)"""
+        if cls._response_engine is None:
+            cls._response_engine = ResponseEngineRunner(create_response_engine(
+                settings.RESPONSE_ENGINE,
+                max_concurrency=settings.RESPONSE_ENGINE_CONCURRENCY,
+                timeout_seconds=settings.RESPONSE_ENGINE_TIMEOUT_SECONDS,
+                stub_latency_ms=settings.STUB_ENGINE_LATENCY_MS,
+                stub_token_latency_ms=settings.STUB_ENGINE_TOKEN_LATENCY_MS,
+                openai_model=settings.OPENAI_MODEL,
+                system_prompt=settings.RESPONSE_SYSTEM_PROMPT
+            ), reply_cache=cls.get_reply_cache())
+        return cls._response_engine
+    
+    @classmethod
+    def get_reply_cache(cls) -> Optional[ReplyCache]:
+        """Retorna instância singleton do cache de respostas (None se desativado)"""
+        if cls._reply_cache is None and settings.REPLY_CACHE_ENABLED:
+            cls._reply_cache = ReplyCache(
+                max_entries=settings.REPLY_CACHE_MAX_ENTRIES,
+                ttl_seconds=settings.REPLY_CACHE_TTL_SECONDS,
+                max_message_length=settings.REPLY_CACHE_MAX_MESSAGE_LENGTH,
+                opted_out_users=settings.REPLY_CACHE_OPT_OUT_USERS
+            )
+        return cls._reply_cache
+    
+    @classmethod
+    def get_transcription_pool(cls) -> TranscriptionPool:
+        """Retorna instância singleton do pool de transcrição"""
+        if cls._transcription_pool is None:
+            cls._transcription_pool = TranscriptionPool(
+                max_workers=settings.TRANSCRIPTION_WORKERS,
+                max_pending=settings.TRANSCRIPTION_QUEUE_SIZE,
+                deadline_seconds=settings.TRANSCRIPTION_DEADLINE_SECONDS
+            )
+        return cls._transcription_pool
+    
+    @classmethod
+    def get_media_cache(cls) -> MediaCache:
+        """Retorna instância singleton do cache de mídias e transcrições"""
+        if cls._media_cache is None:
+            cls._media_cache = MediaCache(settings.MEDIA_CACHE_DIR, max_bytes=settings.MEDIA_CACHE_MAX_BYTES)
+        return cls._media_cache
+    
+    @classmethod
+    def get_outbound_dispatcher(cls) -> OutboundDispatcher:
+        """Retorna instância singleton da fila de envio (retry feito pelo dispatcher, não pelo cliente)"""
+        if cls._outbound_dispatcher is None:
+            cls._outbound_dispatcher = OutboundDispatcher(
+                client_factory=lambda: AsyncGraphClient(max_retries=0),
+                rate_per_second=settings.OUTBOUND_RATE_PER_SECOND,
+                burst=settings.OUTBOUND_BURST,
+                concurrency=settings.OUTBOUND_CONCURRENCY,
+                max_queue_size=settings.OUTBOUND_QUEUE_SIZE,
+                max_attempts=settings.OUTBOUND_MAX_ATTEMPTS,
+                retry_backoff_seconds=settings.OUTBOUND_RETRY_BACKOFF_SECONDS
+            )
+        return cls._outbound_dispatcher
+    
+    @classmethod
+    def get_graph_client(cls) -> GraphClient:
+        """Retorna instância singleton do cliente da Graph API (pool de conexões compartilhado)"""
+        if cls._graph_client is None:
+            cls._graph_client = GraphClient()
+        return cls._graph_client
+    
+    @classmethod
+    def get_user_directory(cls) -> UserDirectory:
+        """Retorna instância singleton do diretório de usuários autorizados"""
+        if cls._user_directory is None:
+            if settings.USER_DIRECTORY_BACKEND == "sqlite":
+                cls._user_directory = SqliteUserDirectory(settings.USER_DIRECTORY_DB_PATH)
+            else:
+                cls._user_directory = JsonUserDirectory(
+                    settings.ALLOWED_USERS_PATH,
+                    refresh_interval_seconds=settings.USER_DIRECTORY_REFRESH_SECONDS
+                )
+        return cls._user_directory
+    
     @classmethod
     def get_conversation_service(cls) -> ConversationService:
         """Retorna instância singleton do ConversationService"""
         if cls._conversation_service is None:
-            cls._db = DatabaseConfig("sqlite", db_path="conversations.db")
+            cls._db = DatabaseConfig("sqlite", db_path=settings.DATABASE_PATH)
             cls._repository = ConversationRepository(cls._db)
             cls._conversation_service = ConversationService(cls._repository)
         return cls._conversation_service
     
+    @classmethod
+    def get_message_deduplicator(cls) -> MessageDeduplicator:
+        """Retorna instância singleton do MessageDeduplicator"""
+        if cls._message_deduplicator is None:
+            cls._message_deduplicator = MessageDeduplicator(
+                cls.get_conversation_service(),
+                max_recent_ids=settings.DEDUP_RECENT_IDS_SIZE,
+                retention_seconds=settings.DEDUP_RETENTION_HOURS * 3600,
+                prune_interval_seconds=settings.DEDUP_PRUNE_INTERVAL_SECONDS
+            )
+        return cls._message_deduplicator
+    
+    @classmethod
+    def get_status_recorder(cls) -> StatusRecorder:
+        """Retorna instância singleton do gravador em lote de status de mensagens"""
+        if cls._status_recorder is None:
+            cls._status_recorder = StatusRecorder(
+                cls.get_conversation_service(),
+                batch_size=settings.STATUS_BATCH_SIZE,
+                flush_interval_seconds=settings.STATUS_FLUSH_INTERVAL_SECONDS,
+                max_buffer_size=settings.STATUS_BUFFER_SIZE
+            )
+        return cls._status_recorder
+    
+    @classmethod
+    def get_admission_controller(cls) -> AdmissionController:
+        """Retorna instância singleton do controle de admissão do webhook"""
+        if cls._admission_controller is None:
+            cls._admission_controller = AdmissionController(
+                cls.get_job_queue().depth_by_kind,
+                max_in_flight=settings.ADMISSION_MAX_IN_FLIGHT,
+                max_queued_text=settings.ADMISSION_MAX_QUEUED_TEXT,
+                max_queued_media=settings.ADMISSION_MAX_QUEUED_MEDIA,
+                media_kinds=MEDIA_JOB_KINDS,
+                retry_after_seconds=settings.ADMISSION_RETRY_AFTER_SECONDS,
+                depth_refresh_seconds=settings.ADMISSION_DEPTH_REFRESH_SECONDS
+            )
+        return cls._admission_controller
+    
+    @classmethod
+    def get_job_queue(cls) -> JobQueue:
+        """Retorna instância singleton da fila de entrada"""
+        if cls._job_queue is None:
+            cls.get_conversation_service()
+            cls._job_queue = JobQueue(
+                cls._repository,
+                max_attempts=settings.JOB_MAX_ATTEMPTS,
+                retry_backoff_seconds=settings.JOB_RETRY_BACKOFF_SECONDS,
+                processing_timeout_seconds=settings.JOB_PROCESSING_TIMEOUT_SECONDS
+            )
+        return cls._job_queue
+    
+    @classmethod
+    def get_job_worker_pool(cls) -> JobWorkerPool:
+        """Retorna instância singleton do pool de workers da fila de entrada (faixa rápida: jobs que não são mídia)"""
+        if cls._job_worker_pool is None:
+            cls._job_worker_pool = JobWorkerPool(
+                cls.get_job_queue(),
+                handler=cls.get_whatsapp_service().process_jobs,
+                num_workers=settings.JOB_WORKERS,
+                batch_size=settings.JOB_BATCH_SIZE,
+                poll_interval_seconds=settings.JOB_POLL_INTERVAL_SECONDS,
+                max_queue_size=settings.JOB_WORKER_QUEUE_SIZE,
+                exclude_kinds=MEDIA_JOB_KINDS,
+                query_budget_per_job=JOB_QUERY_BUDGET_PER_JOB
+            )
+        return cls._job_worker_pool
+    
+    @classmethod
+    def get_media_job_worker_pool(cls) -> JobWorkerPool:
+        """Retorna instância singleton do pool de workers dos jobs de mídia (áudio/imagem)"""
+        if cls._media_job_worker_pool is None:
+            cls._media_job_worker_pool = JobWorkerPool(
+                cls.get_job_queue(),
+                handler=cls.get_whatsapp_service().process_jobs,
+                num_workers=settings.MEDIA_JOB_WORKERS,
+                batch_size=settings.JOB_BATCH_SIZE,
+                poll_interval_seconds=settings.JOB_POLL_INTERVAL_SECONDS,
+                max_queue_size=settings.JOB_WORKER_QUEUE_SIZE,
+                kinds=MEDIA_JOB_KINDS,
+                name="media-job-worker",
+                query_budget_per_job=JOB_QUERY_BUDGET_PER_JOB
+            )
+        return cls._media_job_worker_pool
+    
+    @classmethod
+    def warm_up(cls) -> Dict[str, float]:
+        """
+        Cria os serviços usados pelo webhook e pelos workers antes do primeiro request:
+        pool de conexões do banco, diretório de usuários, cache de mídia e clientes HTTP.
+        Retorna a duração de cada etapa em ms.
+        """
+        steps = {
+            "database": lambda: cls.get_conversation_service().repository.warm_up(settings.WARMUP_DB_CONNECTIONS),
+            "user_directory": lambda: cls.get_user_directory().reload(),
+            "media_cache": lambda: cls.get_media_cache() if settings.MEDIA_CACHE_ENABLED else None,
+            "services": lambda: (cls.get_whatsapp_service(), cls.get_message_deduplicator(),
+                                 cls.get_admission_controller().saturation())
+        }
+        timings = {}
+        for name, step in steps.items():
+            start = time.perf_counter()
+            step()
+            timings[name] = round((time.perf_counter() - start) * 1000, 2)
+        return timings
+    
     @classmethod
     def reset(cls):
         """Reset das instâncias (útil para testes)"""
@@ -52,3 +280,16 @@ class ServiceFactory:
         cls._repository = None
         cls._conversation_service = None
         cls._whatsapp_service = None
+        cls._message_deduplicator = None
+        cls._status_recorder = None
+        cls._admission_controller = None
+        cls._job_queue = None
+        cls._job_worker_pool = None
+        cls._media_job_worker_pool = None
+        cls._transcription_pool = None
+        cls._user_directory = None
+        cls._graph_client = None
+        cls._outbound_dispatcher = None
+        cls._media_cache = None
+        cls._response_engine = None
+        cls._reply_cache = None
@@ -0,0 +1,274 @@
+"""
+Clientes HTTP da Graph API (WhatsApp Cloud API) com pool de conexões, timeouts e retry
+"""
+import asyncio
+import logging
+import random
+import time
+from typing import Any, BinaryIO, Dict, Optional
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from config.settings import settings
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Status que indicam falha transitória do lado da Graph API
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+# Métodos que podem ser repetidos após timeout de leitura sem risco de duplicar efeitos
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "DELETE"}
+
+class GraphAPIError(Exception):
+    """
+    Exceção para respostas de erro ou falhas de rede da Graph API
+
+    `connect_error` indica que a requisição não chegou ao servidor (seguro repetir qualquer método).
+    """
+    def __init__(self, message: str, status_code: Optional[int] = None, retry_after: Optional[float] = None,
+                 connect_error: bool = False):
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.connect_error = connect_error
+        super().__init__(message)
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Converte o header Retry-After (em segundos) para float"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+def _failed_to_connect(error: requests.exceptions.ConnectionError) -> bool:
+    """
+    A conexão nem chegou a ser aberta (timeout de conexão ou falha de DNS/TCP)
+
+    Outros ConnectionError ("Connection aborted", RemoteDisconnected) podem ocorrer depois
+    do corpo enviado, então não são tratados como falha de conexão.
+    """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = error.args[0] if error.args else None
+    return isinstance(getattr(reason, "reason", reason), NewConnectionError)
+
+class _RetryPolicy:
+    """Backoff exponencial com jitter, respeitando Retry-After quando informado"""
+
+    def __init__(self, max_retries: int, backoff_seconds: float, max_backoff_seconds: float = 30.0):
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff_seconds)
+        delay = min(self.backoff_seconds * (2 ** attempt), self.max_backoff_seconds)
+        return random.uniform(delay / 2, delay)
+
+    def should_retry(self, attempt: int, method: str, status_code: Optional[int] = None,
+                     connect_error: bool = False) -> bool:
+        if attempt >= self.max_retries:
+            return False
+        if connect_error:
+            # A requisição não chegou ao servidor: sempre seguro repetir
+            return True
+        if status_code is None:
+            # Timeout de leitura: só repete métodos idempotentes (um POST pode ter sido aceito)
+            return method in IDEMPOTENT_METHODS
+        return status_code in RETRYABLE_STATUS_CODES
+
+class GraphClient:
+    """
+    Cliente síncrono baseado em requests.Session
+
+    A sessão mantém conexões keep-alive por host (pool limitado a `pool_size`),
+    então as chamadas repetidas não pagam TCP+TLS a cada mensagem.
+    """
+
+    def __init__(self, api_token: str = None, base_url: str = None,
+                 connect_timeout: float = None, read_timeout: float = None,
+                 max_retries: int = None, retry_backoff_seconds: float = None,
+                 pool_size: int = None):
+        self.api_token = api_token if api_token is not None else settings.WHATSAPP_API_TOKEN
+        self.base_url = (base_url or settings.GRAPH_API_BASE_URL).rstrip("/")
+        self.timeout = (
+            connect_timeout if connect_timeout is not None else settings.GRAPH_API_CONNECT_TIMEOUT_SECONDS,
+            read_timeout if read_timeout is not None else settings.GRAPH_API_READ_TIMEOUT_SECONDS
+        )
+        self.retry = _RetryPolicy(
+            max_retries if max_retries is not None else settings.GRAPH_API_MAX_RETRIES,
+            retry_backoff_seconds if retry_backoff_seconds is not None else settings.GRAPH_API_RETRY_BACKOFF_SECONDS
+        )
+        pool_size = pool_size or settings.GRAPH_API_POOL_SIZE
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Authorization": f"Bearer {self.api_token}"})
+
+    def _url(self, path: str) -> str:
+        if path.startswith("http://") or path.startswith("https://"):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        """Executa a requisição com timeout e retry; levanta GraphAPIError em erro definitivo"""
+        method = method.upper()
+        url = self._url(path)
+        kwargs.setdefault("timeout", self.timeout)
+        attempt = 0
+
+        while True:
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.exceptions.ConnectionError as e:
+                connect_error = _failed_to_connect(e)
+                if not self.retry.should_retry(attempt, method, connect_error=connect_error):
+                    raise GraphAPIError(f"Connection error calling {method} {url}: {e}", connect_error=connect_error) from e
+                retry_after = None
+            except requests.exceptions.Timeout as e:
+                if not self.retry.should_retry(attempt, method):
+                    raise GraphAPIError(f"Timeout calling {method} {url}: {e}") from e
+                retry_after = None
+            else:
+                if response.status_code < 400:
+                    return response
+
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                if not self.retry.should_retry(attempt, method, status_code=response.status_code):
+                    raise GraphAPIError(
+                        f"Graph API returned {response.status_code} for {method} {url}: {response.text[:500]}",
+                        status_code=response.status_code,
+                        retry_after=retry_after
+                    )
+
+            delay = self.retry.delay(attempt, retry_after)
+            attempt += 1
+            logger.warning(f"Retrying {method} {url} in {delay:.2f}s (attempt {attempt})")
+            time.sleep(delay)
+
+    def get_media_url(self, media_id: str) -> str:
+        """Obtém a URL temporária de download de uma mídia"""
+        return self.request("GET", media_id).json()["url"]
+
+    def download_media(self, media_id: str) -> bytes:
+        """Baixa o conteúdo de uma mídia (duas chamadas na mesma conexão)"""
+        return self.request("GET", self.get_media_url(media_id)).content
+
+    def stream_media(self, media_id: str, sink: BinaryIO, max_bytes: int = None, chunk_size: int = 64 * 1024) -> int:
+        """
+        Baixa uma mídia em blocos direto para `sink`, sem manter o corpo inteiro em memória
+
+        Levanta GraphAPIError se o tamanho ultrapassar `max_bytes`. Retorna o total de bytes escritos.
+        """
+        response = self.request("GET", self.get_media_url(media_id), stream=True)
+        with response:
+            declared = int(response.headers.get("Content-Length") or 0)
+            if max_bytes and declared > max_bytes:
+                raise GraphAPIError(f"Media {media_id} too large: {declared} bytes (max {max_bytes})")
+
+            written = 0
+            try:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    written += len(chunk)
+                    if max_bytes and written > max_bytes:
+                        raise GraphAPIError(f"Media {media_id} exceeded {max_bytes} bytes")
+                    sink.write(chunk)
+            except requests.exceptions.RequestException as e:
+                raise GraphAPIError(f"Error streaming media {media_id}: {e}") from e
+        return written
+
+    def send_message(self, phone_number_id: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Envia uma mensagem pelo endpoint /{phone_number_id}/messages"""
+        return self.request("POST", f"{phone_number_id}/messages", json=payload).json()
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncGraphClient:
+    """
+    Cliente assíncrono baseado em httpx.AsyncClient, com a mesma política de timeout e retry
+
+    Deve ser criado e usado dentro de um event loop; feche com `await client.aclose()`.
+    """
+
+    def __init__(self, api_token: str = None, base_url: str = None,
+                 connect_timeout: float = None, read_timeout: float = None,
+                 max_retries: int = None, retry_backoff_seconds: float = None,
+                 pool_size: int = None):
+        self.api_token = api_token if api_token is not None else settings.WHATSAPP_API_TOKEN
+        self.base_url = (base_url or settings.GRAPH_API_BASE_URL).rstrip("/")
+        connect_timeout = connect_timeout if connect_timeout is not None else settings.GRAPH_API_CONNECT_TIMEOUT_SECONDS
+        read_timeout = read_timeout if read_timeout is not None else settings.GRAPH_API_READ_TIMEOUT_SECONDS
+        self.retry = _RetryPolicy(
+            max_retries if max_retries is not None else settings.GRAPH_API_MAX_RETRIES,
+            retry_backoff_seconds if retry_backoff_seconds is not None else settings.GRAPH_API_RETRY_BACKOFF_SECONDS
+        )
+        pool_size = pool_size or settings.GRAPH_API_POOL_SIZE
+
+        self.client = httpx.AsyncClient(
+            headers={"Authorization": f"Bearer {self.api_token}"},
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        )
+
+    def _url(self, path: str) -> str:
+        if path.startswith("http://") or path.startswith("https://"):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    async def request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        """Executa a requisição com timeout e retry; levanta GraphAPIError em erro definitivo"""
+        method = method.upper()
+        url = self._url(path)
+        attempt = 0
+
+        while True:
+            try:
+                response = await self.client.request(method, url, **kwargs)
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+                if not self.retry.should_retry(attempt, method, connect_error=True):
+                    raise GraphAPIError(f"Connection error calling {method} {url}: {e!r}", connect_error=True) from e
+                retry_after = None
+            except httpx.TransportError as e:
+                if not self.retry.should_retry(attempt, method):
+                    raise GraphAPIError(f"Transport error calling {method} {url}: {e!r}") from e
+                retry_after = None
+            else:
+                if response.status_code < 400:
+                    return response
+
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                if not self.retry.should_retry(attempt, method, status_code=response.status_code):
+                    raise GraphAPIError(
+                        f"Graph API returned {response.status_code} for {method} {url}: {response.text[:500]}",
+                        status_code=response.status_code,
+                        retry_after=retry_after
+                    )
+
+            delay = self.retry.delay(attempt, retry_after)
+            attempt += 1
+            logger.warning(f"Retrying {method} {url} in {delay:.2f}s (attempt {attempt})")
+            await asyncio.sleep(delay)
+
+    async def get_media_url(self, media_id: str) -> str:
+        """Obtém a URL temporária de download de uma mídia"""
+        return (await self.request("GET", media_id)).json()["url"]
+
+    async def download_media(self, media_id: str) -> bytes:
+        """Baixa o conteúdo de uma mídia"""
+        return (await self.request("GET", await self.get_media_url(media_id))).content
+
+    async def send_message(self, phone_number_id: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Envia uma mensagem pelo endpoint /{phone_number_id}/messages"""
+        return (await self.request("POST", f"{phone_number_id}/messages", json=payload)).json()
+
+    async def aclose(self):
+        await self.client.aclose()
@@ -0,0 +1,128 @@
+"""
+Servidor local que imita os endpoints da Graph API usados pelo bot (testes e benchmarks)
+
+Uso:
+    python -m whatsapp.graph_stub --port 5055 --latency-ms 30 --error-rate 0.05
+    GRAPH_API_BASE_URL=http://127.0.0.1:5055/v22.0 python -m whatsapp.server
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import threading
+import time
+from typing import Optional
+
+import uvicorn
+from fastapi import FastAPI, Request, Response
+
+def create_stub_app(latency_ms: float = 0.0, error_rate: float = 0.0, media_size_bytes: int = 64 * 1024) -> FastAPI:
+    """
+    Cria o app do stub
+
+    `error_rate` responde 503 com Retry-After (ou 429, metade das vezes) para exercitar o retry.
+    """
+    app = FastAPI(title="Graph API Stub")
+    app.state.counters = {"messages": 0, "media_lookups": 0, "media_downloads": 0, "errors": 0}
+    message_ids = itertools.count(1)
+    media_payload = os.urandom(media_size_bytes)
+
+    async def simulate(request: Request) -> Optional[Response]:
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000)
+        if error_rate and random.random() < error_rate:
+            app.state.counters["errors"] += 1
+            status_code = 429 if random.random() < 0.5 else 503
+            return Response(status_code=status_code, headers={"Retry-After": "0"})
+        return None
+
+    @app.get("/stats")
+    async def stats():
+        return app.state.counters
+
+    @app.get("/media/{media_id}")
+    async def download_media(media_id: str, request: Request):
+        error = await simulate(request)
+        if error:
+            return error
+        app.state.counters["media_downloads"] += 1
+        return Response(content=media_payload, media_type="application/octet-stream")
+
+    @app.post("/{version}/{phone_number_id}/messages")
+    async def send_message(version: str, phone_number_id: str, request: Request):
+        error = await simulate(request)
+        if error:
+            return error
+        body = await request.json()
+        app.state.counters["messages"] += 1
+        return {
+            "messaging_product": "whatsapp",
+            "contacts": [{"input": body.get("to"), "wa_id": body.get("to")}],
+            "messages": [{"id": f"wamid.stub.{next(message_ids)}"}]
+        }
+
+    @app.get("/{version}/{media_id}")
+    async def get_media_url(version: str, media_id: str, request: Request):
+        error = await simulate(request)
+        if error:
+            return error
+        app.state.counters["media_lookups"] += 1
+        return {
+            "url": f"{str(request.base_url).rstrip('/')}/media/{media_id}",
+            "mime_type": "application/octet-stream",
+            "file_size": len(media_payload),
+            "id": media_id
+        }
+
+    return app
+
+class StubServer:
+    """Executa o stub em uma thread (para uso em benchmarks e scripts de teste)"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 5055, **app_options):
+        self.host = host
+        self.port = port
+        self.app = create_stub_app(**app_options)
+        self._server = uvicorn.Server(uvicorn.Config(self.app, host=host, port=port, log_level="warning"))
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v22.0"
+
+    def start(self, timeout: float = 10.0) -> "StubServer":
+        self._thread = threading.Thread(target=self._server.run, name="graph-stub", daemon=True)
+        self._thread.start()
+        deadline = time.monotonic() + timeout
+        while not self._server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError("Graph API stub did not start")
+            time.sleep(0.05)
+        return self
+
+    def stop(self):
+        self._server.should_exit = True
+        if self._thread:
+            self._thread.join(5)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub local da Graph API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--media-kb", type=int, default=64)
+    args = parser.parse_args()
+
+    app = create_stub_app(args.latency_ms, args.error_rate, args.media_kb * 1024)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
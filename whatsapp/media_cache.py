@@ -0,0 +1,229 @@
+"""
+Cache em disco de mídias e resultados de processamento (transcrição), endereçado pelo sha256 da mídia
+"""
+import base64
+import binascii
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, BinaryIO, Dict, List, Optional
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+def normalize_sha256(value: str) -> Optional[str]:
+    """Converte o sha256 do payload (hex ou base64) para hex minúsculo; None se inválido"""
+    if not value:
+        return None
+    value = value.strip()
+    if len(value) == 64:
+        try:
+            bytes.fromhex(value)
+            return value.lower()
+        except ValueError:
+            pass
+    try:
+        digest = base64.b64decode(value, validate=True)
+    except (binascii.Error, ValueError):
+        return None
+    return digest.hex() if len(digest) == 32 else None
+
+class MediaCache:
+    """
+    LRU em disco limitado a `max_bytes`
+
+    Cada mídia ocupa `<dir>/<aa>/<sha256>.bin` e os resultados `<dir>/<aa>/<sha256>.<tipo>.json`.
+    O conteúdo só é gravado se o sha256 calculado conferir com o informado no payload.
+    A ordem de uso é mantida em memória e reconstruída pelo mtime dos arquivos ao iniciar;
+    quando o total passa de `max_bytes`, as entradas menos usadas são removidas.
+    """
+
+    def __init__(self, directory: str = ".media_cache", max_bytes: int = 512 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def _path(self, digest: str, suffix: str) -> str:
+        return os.path.join(self.directory, digest[:2], f"{digest}.{suffix}")
+
+    def _load_index(self):
+        """Reconstrói o índice LRU a partir dos arquivos existentes (menos recentes primeiro)"""
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.startswith("."):
+                    continue
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                files.append((stat.st_mtime, name.split(".")[0], stat.st_size))
+
+        for _, digest, size in sorted(files):
+            self._entries[digest] = self._entries.get(digest, 0) + size
+            self._entries.move_to_end(digest)
+            self._total_bytes += size
+        logger.info(f"Media cache loaded: {len(self._entries)} entries, {self._total_bytes} bytes")
+
+    def _record(self, kind: str, hit: bool):
+        with self._lock:
+            counters = self.hits if hit else self.misses
+            counters[kind] = counters.get(kind, 0) + 1
+
+    def _touch(self, digest: str, path: str):
+        with self._lock:
+            if digest in self._entries:
+                self._entries.move_to_end(digest)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _account(self, digest: str, size: int) -> List[str]:
+        """Contabiliza bytes gravados e retira do índice as entradas menos usadas acima do limite (com o lock)"""
+        evicted = []
+        self._entries[digest] = self._entries.get(digest, 0) + size
+        self._entries.move_to_end(digest)
+        self._total_bytes += size
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            old_digest, old_size = self._entries.popitem(last=False)
+            self._total_bytes -= old_size
+            self.evictions += 1
+            evicted.append(old_digest)
+        return evicted
+
+    def _remove_files(self, evicted: List[str]):
+        for old_digest in evicted:
+            folder = os.path.join(self.directory, old_digest[:2])
+            for name in os.listdir(folder) if os.path.isdir(folder) else []:
+                if name.startswith(old_digest):
+                    try:
+                        os.remove(os.path.join(folder, name))
+                    except OSError:
+                        pass
+        if evicted:
+            logger.debug(f"Media cache evicted {len(evicted)} entries")
+
+    def _store(self, digest: str, path: str, source: BinaryIO, replace: bool = True) -> bool:
+        """
+        Grava em arquivo temporário e renomeia (leitores nunca veem arquivo parcial)
+
+        A renomeação e a contabilização dos bytes acontecem juntas sob o lock, então
+        gravações concorrentes do mesmo arquivo contam apenas a diferença de tamanho.
+        Com `replace=False` um arquivo já existente é mantido e nada é contabilizado (retorna False).
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as target:
+                shutil.copyfileobj(source, target)
+                size = target.tell()
+            with self._lock:
+                existing = os.path.getsize(path) if os.path.exists(path) else None
+                if existing is not None and not replace:
+                    os.remove(tmp_path)
+                    return False
+                os.replace(tmp_path, path)
+                evicted = self._account(digest, size - (existing or 0))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._remove_files(evicted)
+        return True
+
+    def open_media(self, sha256: str) -> Optional[BinaryIO]:
+        """Abre a mídia em cache para leitura (o chamador fecha o arquivo) ou retorna None"""
+        digest = normalize_sha256(sha256)
+        if digest is None:
+            return None
+        path = self._path(digest, "bin")
+        try:
+            media_file = open(path, "rb")
+        except FileNotFoundError:
+            self._record("media", hit=False)
+            return None
+        self._record("media", hit=True)
+        self._touch(digest, path)
+        return media_file
+
+    def put_media(self, sha256: str, source: BinaryIO) -> bool:
+        """
+        Armazena a mídia lida de `source` (a partir da posição atual, que é restaurada)
+
+        Retorna False se o sha256 for inválido ou não conferir com o conteúdo.
+        """
+        digest = normalize_sha256(sha256)
+        if digest is None:
+            return False
+
+        start = source.tell()
+        hasher = hashlib.sha256()
+        for chunk in iter(lambda: source.read(64 * 1024), b""):
+            hasher.update(chunk)
+        source.seek(start)
+        if hasher.hexdigest() != digest:
+            logger.warning(f"Media sha256 mismatch for {sha256}; not caching")
+            return False
+
+        path = self._path(digest, "bin")
+        if os.path.exists(path):
+            return True
+        # Outra gravação da mesma mídia pode terminar antes: a primeira renomeação vale
+        self._store(digest, path, source, replace=False)
+        source.seek(start)
+        return True
+
+    def get_result(self, sha256: str, kind: str) -> Optional[Any]:
+        """Retorna o resultado de processamento em cache (ex: kind="transcription")"""
+        digest = normalize_sha256(sha256)
+        if digest is None:
+            return None
+        path = self._path(digest, f"{kind}.json")
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                value = json.load(file)["value"]
+        except (FileNotFoundError, ValueError, KeyError):
+            self._record(kind, hit=False)
+            return None
+        self._record(kind, hit=True)
+        self._touch(digest, path)
+        return value
+
+    def put_result(self, sha256: str, kind: str, value: Any):
+        """Armazena um resultado de processamento serializável em JSON"""
+        digest = normalize_sha256(sha256)
+        if digest is None:
+            return
+        path = self._path(digest, f"{kind}.json")
+        encoded = json.dumps({"value": value}, ensure_ascii=False).encode("utf-8")
+        with tempfile.SpooledTemporaryFile() as source:
+            source.write(encoded)
+            source.seek(0)
+            self._store(digest, path, source)
+
+    def stats(self) -> Dict[str, Any]:
+        """Ocupação, evicções e taxa de acerto por tipo (media, transcription, image...)"""
+        with self._lock:
+            all_hits, all_misses = dict(self.hits), dict(self.misses)
+        hit_rate = {}
+        for kind in sorted(set(all_hits) | set(all_misses)):
+            hits, misses = all_hits.get(kind, 0), all_misses.get(kind, 0)
+            hit_rate[kind] = {"hits": hits, "misses": misses, "hit_rate": round(hits / (hits + misses), 4)}
+        return {
+            "entries": len(self._entries),
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+            "by_kind": hit_rate
+        }
@@ -0,0 +1,257 @@
+"""
+Fila de envio de mensagens com limite de taxa por número (token bucket) e envio assíncrono concorrente
+"""
+import asyncio
+import logging
+import threading
+import time
+import zlib
+from collections import deque
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, List, Optional
+
+from observability.metrics import OUTBOUND_SEND_SECONDS, latency_summary
+from whatsapp.graph_client import RETRYABLE_STATUS_CODES, AsyncGraphClient, GraphAPIError
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+class OutboundQueueFullError(Exception):
+    """Exceção quando a fila de envio do número está cheia"""
+    def __init__(self, phone_number_id: str):
+        self.phone_number_id = phone_number_id
+        super().__init__(f"Outbound queue for {phone_number_id} is full")
+
+class TokenBucket:
+    """
+    Token bucket assíncrono: `rate` envios por segundo com rajadas de até `capacity`
+
+    `pause` suspende a emissão de tokens (ex: após 429 com Retry-After), valendo
+    para todos os senders do mesmo número.
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    self._updated_at = time.monotonic()
+                    continue
+
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+class _NumberLane:
+    """
+    Filas, bucket, senders e métricas de um phone_number_id
+
+    Cada sender consome uma fila própria e o destinatário define a fila (hash), então
+    as respostas para o mesmo usuário saem em ordem e destinatários diferentes em paralelo.
+    """
+
+    def __init__(self, rate: float, burst: int, max_queue_size: int, concurrency: int):
+        queue_size = max(1, -(-max_queue_size // concurrency))
+        self.queues: List["asyncio.Queue"] = [asyncio.Queue(maxsize=queue_size) for _ in range(concurrency)]
+        self.bucket = TokenBucket(rate, burst)
+        self.tasks = []
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.throttled = 0
+
+    def queue_for(self, recipient: Optional[str]) -> "asyncio.Queue":
+        return self.queues[zlib.crc32((recipient or "").encode("utf-8")) % len(self.queues)]
+
+    def depth(self) -> int:
+        return sum(queue.qsize() for queue in self.queues)
+
+class OutboundDispatcher:
+    """
+    Despacha envios para a Graph API a partir de threads síncronas (workers da fila de entrada)
+
+    Um event loop dedicado roda em uma thread própria; cada phone_number_id tem um token
+    bucket e `concurrency` senders, cada um com sua fila limitada. Os envios para o mesmo
+    destinatário passam sempre pelo mesmo sender (em ordem). `submit` bloqueia enquanto a
+    fila estiver cheia (backpressure) e retorna um Future com a resposta da Graph API.
+    Respostas 429/5xx e erros de conexão são repetidos com backoff, respeitando Retry-After;
+    timeouts de leitura não são repetidos (a Graph API pode já ter aceitado a mensagem).
+    """
+
+    def __init__(self, client_factory: Callable[[], AsyncGraphClient] = None, rate_per_second: float = 80.0,
+                 burst: int = 20, concurrency: int = 10, max_queue_size: int = 1000,
+                 max_attempts: int = 5, retry_backoff_seconds: float = 1.0):
+        self.client_factory = client_factory or (lambda: AsyncGraphClient(max_retries=0))
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self.concurrency = concurrency
+        self.max_queue_size = max_queue_size
+        self.max_attempts = max_attempts
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self._lanes: Dict[str, _NumberLane] = {}
+        self._latencies_ms = deque(maxlen=1000)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._client: Optional[AsyncGraphClient] = None
+
+    def start(self):
+        """Inicia o event loop de envio em uma thread dedicada"""
+        if self._thread:
+            return
+
+        ready = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._client = self.client_factory()
+            ready.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name="outbound-sender", daemon=True)
+        self._thread.start()
+        ready.wait()
+        logger.info(f"Outbound dispatcher started ({self.rate_per_second}/s per number, {self.concurrency} senders)")
+
+    def stop(self, timeout: float = 10.0):
+        """Aguarda o esvaziamento das filas (até o timeout), cancela os senders e fecha o cliente"""
+        if not self._thread:
+            return
+
+        async def shutdown():
+            try:
+                await asyncio.wait_for(
+                    asyncio.gather(*(queue.join() for lane in self._lanes.values() for queue in lane.queues)),
+                    timeout
+                )
+            except asyncio.TimeoutError:
+                logger.warning(f"Outbound dispatcher stopped with {self.pending()} messages not sent")
+            for lane in self._lanes.values():
+                for task in lane.tasks:
+                    task.cancel()
+            await self._client.aclose()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop).result(timeout + 5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(5)
+        self._thread = None
+        self._lanes = {}
+        logger.info("Outbound dispatcher stopped")
+
+    def _lane(self, phone_number_id: str) -> _NumberLane:
+        """Cria sob demanda a fila do número (executado no event loop)"""
+        lane = self._lanes.get(phone_number_id)
+        if lane is None:
+            lane = _NumberLane(self.rate_per_second, self.burst, self.max_queue_size, self.concurrency)
+            lane.tasks = [
+                self._loop.create_task(self._sender(phone_number_id, lane, queue))
+                for queue in lane.queues
+            ]
+            self._lanes[phone_number_id] = lane
+        return lane
+
+    async def _enqueue(self, phone_number_id: str, payload: Dict[str, Any], result: Future):
+        await self._lane(phone_number_id).queue_for(payload.get("to")).put((time.monotonic(), payload, result))
+
+    def submit(self, phone_number_id: str, payload: Dict[str, Any], timeout: Optional[float] = None) -> Future:
+        """
+        Enfileira um envio (chamado de qualquer thread)
+
+        Bloqueia enquanto a fila do destinatário estiver cheia; com timeout, levanta
+        OutboundQueueFullError se não houver espaço a tempo.
+        """
+        if not self._thread:
+            raise RuntimeError("Outbound dispatcher is not running")
+
+        result: Future = Future()
+        enqueued = asyncio.run_coroutine_threadsafe(self._enqueue(phone_number_id, payload, result), self._loop)
+        try:
+            enqueued.result(timeout)
+        except FutureTimeoutError:
+            enqueued.cancel()
+            raise OutboundQueueFullError(phone_number_id)
+        return result
+
+    async def _sender(self, phone_number_id: str, lane: _NumberLane, queue: "asyncio.Queue"):
+        while True:
+            enqueued_at, payload, result = await queue.get()
+            try:
+                response = await self._send_with_retry(phone_number_id, lane, payload)
+                lane.sent += 1
+                elapsed = time.monotonic() - enqueued_at
+                self._latencies_ms.append(elapsed * 1000)
+                OUTBOUND_SEND_SECONDS.observe(elapsed)
+                result.set_result(response)
+            except asyncio.CancelledError:
+                result.cancel()
+                raise
+            except Exception as e:
+                lane.failed += 1
+                logger.error(f"Failed to send message to {payload.get('to')}: {e}")
+                result.set_exception(e)
+            finally:
+                queue.task_done()
+
+    async def _send_with_retry(self, phone_number_id: str, lane: _NumberLane, payload: Dict[str, Any]) -> Dict[str, Any]:
+        attempt = 0
+        while True:
+            await lane.bucket.acquire()
+            attempt += 1
+            try:
+                return await self._client.send_message(phone_number_id, payload)
+            except GraphAPIError as e:
+                # Sem status só é seguro repetir se a requisição não chegou ao servidor
+                retryable = e.connect_error or e.status_code in RETRYABLE_STATUS_CODES
+                if not retryable or attempt >= self.max_attempts:
+                    raise
+
+                delay = self.retry_backoff_seconds * (2 ** (attempt - 1))
+                if e.retry_after is not None:
+                    delay = e.retry_after
+                if e.status_code == 429:
+                    # Limite de throughput do número: pausa todos os senders do número
+                    lane.throttled += 1
+                    lane.bucket.pause(delay)
+                lane.retried += 1
+                logger.warning(f"Send to {payload.get('to')} failed ({e.status_code}), retry {attempt} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    def pending(self) -> int:
+        """Total de envios aguardando nas filas"""
+        return sum(lane.depth() for lane in self._lanes.values())
+
+    def stats(self) -> Dict[str, Any]:
+        """Profundidade das filas, contadores por número e latência de envio (enfileiramento → resposta)"""
+        latency = latency_summary(self._latencies_ms)
+        return {
+            "pending": self.pending(),
+            "numbers": {
+                phone_number_id: {
+                    "depth": lane.depth(),
+                    "capacity": self.max_queue_size,
+                    "sent": lane.sent,
+                    "failed": lane.failed,
+                    "retried": lane.retried,
+                    "throttled": lane.throttled
+                }
+                for phone_number_id, lane in list(self._lanes.items())
+            },
+            "latency": latency
+        }
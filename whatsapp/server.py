@@ -1,22 +1,111 @@
 
+import importlib.util
 import logging
+import time
+from contextlib import asynccontextmanager
+
 import uvicorn
-from fastapi import FastAPI, Query, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, Response
 
-from whatsapp.webhook_handler import WebhookHandler
+from observability import configure_logging, parse_sampling
+from observability.metrics import CONTENT_TYPE, REGISTRY, WEBHOOK_SECONDS
+from observability.query_stats import query_stats
+from whatsapp.admission import AdmissionRejectedError
+from whatsapp.dependencies import ServiceFactory
+from whatsapp.user_directory import install_reload_signal
+from whatsapp.webhook_handler import WebhookHandler, json_response
 from config.settings import settings
 
-# Configurar logging
-logging.basicConfig(level=logging.INFO)
+# Configurar logging (QueueHandler + listener em thread própria)
+configure_logging(
+    settings.LOG_LEVEL,
+    output=settings.LOG_OUTPUT,
+    fmt=settings.LOG_FORMAT,
+    sampling=parse_sampling(settings.LOG_SAMPLING),
+    queue_size=settings.LOG_QUEUE_SIZE
+)
 logger = logging.getLogger(__name__)
 
-# Criar instância do handler
-webhook_handler = WebhookHandler()
+# Handler criado sob demanda (no warmup do lifespan), não na importação do módulo
+_webhook_handler = None
+
+def get_webhook_handler() -> WebhookHandler:
+    global _webhook_handler
+    if _webhook_handler is None:
+        _webhook_handler = WebhookHandler()
+    return _webhook_handler
+
+def register_metrics():
+    """Gauges lidos na coleta do /metrics: profundidade das filas, pool do banco e stats() dos componentes"""
+    REGISTRY.gauge(
+        "job_queue_jobs", "Jobs da fila de entrada por status (exceto concluídos)",
+        lambda: ServiceFactory.get_job_queue().depth(), ("status",)
+    )
+    REGISTRY.gauge(
+        "job_queue_depth", "Jobs pendentes ou em processamento por tipo",
+        lambda: ServiceFactory.get_job_queue().depth_by_kind(), ("kind",)
+    )
+    REGISTRY.gauge(
+        "db_pool_connections", "Conexões do pool do banco por estado",
+        lambda: ServiceFactory.get_conversation_service().repository.pool_stats(), ("state",)
+    )
+    REGISTRY.register_stats("workers", lambda: ServiceFactory.get_job_worker_pool().stats())
+    REGISTRY.register_stats("media_workers", lambda: ServiceFactory.get_media_job_worker_pool().dispatcher.stats())
+    REGISTRY.register_stats("transcription", lambda: ServiceFactory.get_transcription_pool().stats())
+    REGISTRY.register_stats("engine", lambda: ServiceFactory.get_response_engine().stats())
+    REGISTRY.register_stats("admission", lambda: ServiceFactory.get_admission_controller().stats())
+    REGISTRY.register_stats("dedup", lambda: ServiceFactory.get_message_deduplicator().stats())
+    REGISTRY.register_stats("status_recorder", lambda: ServiceFactory.get_status_recorder().stats())
+    REGISTRY.register_stats("db_queries", query_stats)
+    if settings.WHATSAPP_SEND_REPLIES:
+        REGISTRY.register_stats("outbound", lambda: ServiceFactory.get_outbound_dispatcher().stats())
+    if settings.MEDIA_CACHE_ENABLED:
+        REGISTRY.register_stats("media_cache", lambda: ServiceFactory.get_media_cache().stats())
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Aquece os serviços e inicia os workers da fila de entrada (reprocessando jobs pendentes);
+    o /readiness só responde pronto depois disso. No shutdown drena os workers, o buffer de
+    status e a fila de envio. SIGHUP recarrega o diretório de usuários.
+    """
+    app.state.lifecycle = "starting"
+    start = time.perf_counter()
+    timings = ServiceFactory.warm_up()
+    get_webhook_handler()
+    install_reload_signal(ServiceFactory.get_user_directory())
+    if settings.WHATSAPP_SEND_REPLIES:
+        ServiceFactory.get_outbound_dispatcher().start()
+    status_recorder = ServiceFactory.get_status_recorder()
+    status_recorder.start()
+    ServiceFactory.get_message_deduplicator().start()
+    worker_pool = ServiceFactory.get_job_worker_pool()
+    media_worker_pool = ServiceFactory.get_media_job_worker_pool()
+    worker_pool.start()
+    media_worker_pool.start()
+    register_metrics()
+    app.state.lifecycle = "ready"
+    logger.info(f"Warmup finished in {(time.perf_counter() - start) * 1000:.0f}ms: {timings}")
+    yield
+    app.state.lifecycle = "draining"
+    drain_seconds = settings.SHUTDOWN_DRAIN_SECONDS
+    worker_pool.stop(timeout=drain_seconds)
+    media_worker_pool.stop(timeout=drain_seconds)
+    ServiceFactory.get_transcription_pool().shutdown(wait=True)
+    ServiceFactory.get_response_engine().stop()
+    status_recorder.stop()
+    ServiceFactory.get_message_deduplicator().stop()
+    if settings.WHATSAPP_SEND_REPLIES:
+        ServiceFactory.get_outbound_dispatcher().stop(timeout=drain_seconds)
+    ServiceFactory.get_graph_client().close()
+    logger.info("Shutdown drain finished")
 
 # Configurar FastAPI
 app = FastAPI(
     title="WhatsApp Bot",
     version="0.1.0",
+    lifespan=lifespan,
     openapi_url=f"/openapi.json" if settings.IS_DEV_ENVIRONMENT else None,
     docs_url=f"/docs" if settings.IS_DEV_ENVIRONMENT else None,
     redoc_url=f"/redoc" if settings.IS_DEV_ENVIRONMENT else None,
@@ -29,8 +118,91 @@ def health():
     return {"status": "healthy"}
 
 @app.get("/readiness")
-def readiness():
-    return {"status": "ready"}
+def readiness(request: Request):
+    """Pronto para receber tráfego; 503 durante o warmup, o shutdown ou com o controle de admissão saturado"""
+    lifecycle = getattr(request.app.state, "lifecycle", "starting")
+    if lifecycle != "ready":
+        return JSONResponse(status_code=503, content={"status": lifecycle})
+    admission = ServiceFactory.get_admission_controller()
+    saturation = admission.saturation()
+    if admission.is_saturated():
+        return JSONResponse(status_code=503, content={"status": "saturated", "saturation": saturation})
+    return {"status": "ready", "saturation": saturation}
+
+@app.get("/admission/stats")
+def admission_stats():
+    """Requisições em processamento, jobs enfileirados por classe e rejeições do controle de admissão"""
+    return ServiceFactory.get_admission_controller().stats()
+
+@app.exception_handler(AdmissionRejectedError)
+async def admission_rejected(request: Request, exc: AdmissionRejectedError):
+    return JSONResponse(
+        status_code=503,
+        content={"status": "rejected", "reason": exc.reason},
+        headers={"Retry-After": str(exc.retry_after_seconds)}
+    )
+
+@app.get("/queue/stats")
+def queue_stats():
+    """Profundidade da fila de entrada, latência dos jobs, lag das filas por worker e pool de transcrição"""
+    return {
+        **ServiceFactory.get_job_worker_pool().stats(),
+        "media_workers": ServiceFactory.get_media_job_worker_pool().dispatcher.stats(),
+        "transcription": ServiceFactory.get_transcription_pool().stats()
+    }
+
+@app.get("/metrics")
+def metrics():
+    """Métricas no formato texto do Prometheus (histogramas, contadores e gauges)"""
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+@app.get("/db/queries/stats")
+def db_query_stats():
+    """Queries por escopo (webhook, lotes de jobs): média e máximo de queries, tempo no banco, orçamentos excedidos e N+1"""
+    return query_stats()
+
+@app.get("/pipeline/stats")
+def pipeline_stats():
+    """Latência de cada estágio do pipeline do canal (parse, dedup, auth, extract, generate, persist, send)"""
+    return ServiceFactory.get_whatsapp_service().stage_stats()
+
+@app.get("/engine/stats")
+def engine_stats():
+    """Motor de resposta: gerações em andamento, aguardando o limite de concorrência, timeouts e latência"""
+    return ServiceFactory.get_response_engine().stats()
+
+@app.get("/outbound/stats")
+def outbound_stats():
+    """Profundidade das filas de envio, 429/retries por número e latência de envio"""
+    if not settings.WHATSAPP_SEND_REPLIES:
+        return {"enabled": False}
+    return {"enabled": True, **ServiceFactory.get_outbound_dispatcher().stats()}
+
+@app.get("/media/cache/stats")
+def media_cache_stats():
+    """Ocupação, evicções e taxa de acerto do cache de mídias e transcrições"""
+    if not settings.MEDIA_CACHE_ENABLED:
+        return {"enabled": False}
+    return {"enabled": True, **ServiceFactory.get_media_cache().stats()}
+
+@app.get("/messages/statuses")
+def message_statuses(ids: str = Query(..., description="IDs (wamid) das mensagens enviadas, separados por vírgula")):
+    """Status mais recente (sent/delivered/read/failed) de cada mensagem enviada"""
+    message_ids = [message_id for message_id in ids.split(",") if message_id][:500]
+    latest = ServiceFactory.get_status_recorder().get_latest_statuses(message_ids)
+    return {
+        message_id: {**status, "status": status["status"].name.lower()}
+        for message_id, status in latest.items()
+    }
+
+@app.get("/messages/{message_id}/status")
+def message_status(message_id: str):
+    """Status mais recente de uma mensagem enviada"""
+    latest = ServiceFactory.get_status_recorder().get_latest_statuses([message_id])
+    if message_id not in latest:
+        raise HTTPException(status_code=404, detail="Status not found")
+    status = latest[message_id]
+    return {**status, "status": status["status"].name.lower()}
 
 @app.get("/webhook")
 def verify_webhook(
@@ -39,18 +211,42 @@ def verify_webhook(
         hub_verify_token: str = Query(..., description="The verification token", alias="hub.verify_token"),
 ):
     """Endpoint para verificação do webhook do WhatsApp"""
-    return webhook_handler.verify_webhook(hub_mode, hub_challenge, hub_verify_token)
+    return get_webhook_handler().verify_webhook(hub_mode, hub_challenge, hub_verify_token)
 
 @app.post("/webhook", status_code=200)
-async def webhook(data: dict, background_tasks: BackgroundTasks):
-    """Endpoint para receber webhooks do WhatsApp"""
-    return await webhook_handler.handle_webhook(data, background_tasks)
+async def webhook(request: Request):
+    """Endpoint para receber webhooks do WhatsApp (corpo bruto validado direto pelo pydantic-core)"""
+    # A admissão é verificada antes de ler o corpo: rejeição rápida sob saturação
+    with WEBHOOK_SECONDS.time(), ServiceFactory.get_admission_controller().track_request():
+        return json_response(await get_webhook_handler().handle_webhook_body(await request.body()))
 
-if __name__ == "__main__":
-    logger.info(f"Starting WhatsApp Bot on {settings.HOST}:{settings.PORT}")
+def run():
+    """
+    Inicia o servidor: com DEBUG=true um processo com reload; caso contrário o modo de produção,
+    com SERVER_WORKERS processos, uvloop/httptools quando instalados e shutdown gracioso
+    """
+    if settings.DEBUG:
+        logger.info(f"Starting WhatsApp Bot on {settings.HOST}:{settings.PORT} (development, reload)")
+        uvicorn.run("whatsapp.server:app", host=settings.HOST, port=settings.PORT, reload=True)
+        return
+
+    loop = "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+    http = "httptools" if importlib.util.find_spec("httptools") else "h11"
+    logger.info(
+        f"Starting WhatsApp Bot on {settings.HOST}:{settings.PORT} "
+        f"(workers={settings.SERVER_WORKERS}, loop={loop}, http={http})"
+    )
     uvicorn.run(
-        "whatsapp.server:app", 
-        host=settings.HOST, 
-        port=settings.PORT, 
-        reload=settings.DEBUG
+        "whatsapp.server:app",
+        host=settings.HOST,
+        port=settings.PORT,
+        workers=settings.SERVER_WORKERS,
+        loop=loop,
+        http=http,
+        access_log=settings.SERVER_ACCESS_LOG,
+        timeout_keep_alive=settings.SERVER_KEEP_ALIVE_SECONDS,
+        timeout_graceful_shutdown=int(settings.SHUTDOWN_DRAIN_SECONDS)
     )
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,169 @@
+"""
+Pool limitado de transcrição de áudio com prazo por job e transcritor simulado para benchmarks
+"""
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, BinaryIO, Callable, Dict
+
+from observability.metrics import TRANSCRIPTION_SECONDS, latency_summary
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+class TranscriptionTimeoutError(Exception):
+    """Exceção quando a transcrição não termina dentro do prazo"""
+    def __init__(self, deadline_seconds: float):
+        self.deadline_seconds = deadline_seconds
+        super().__init__(f"Transcription did not finish within {deadline_seconds}s")
+
+class TranscriptionRejectedError(Exception):
+    """Exceção quando o pool de transcrição está saturado"""
+    def __init__(self, pending: int):
+        self.pending = pending
+        super().__init__(f"Transcription pool is full ({pending} pending)")
+
+class FakeTranscriber:
+    """Transcritor local com latência configurável (sem rede), para benchmarks e testes de carga"""
+
+    # Tipo próprio no cache de mídia: transcrições simuladas nunca são servidas como reais
+    cache_kind = "fake_transcription"
+
+    def __init__(self, latency_ms: float = 800.0, jitter_ms: float = 0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+
+    def __call__(self, audio_file: BinaryIO, filename: str = None) -> str:
+        size = len(audio_file.read()) if audio_file else 0
+        time.sleep(max(0.0, self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000)
+        return f"Transcrição simulada de {filename or 'áudio'} ({size} bytes)"
+
+class TranscriptionPool:
+    """
+    Executor dedicado à transcrição, separado dos workers que atendem texto
+
+    No máximo `max_workers` transcrições rodam ao mesmo tempo e até `max_pending`
+    aguardam; acima disso `submit` levanta TranscriptionRejectedError. Cada job tem um
+    prazo: quem espera recebe TranscriptionTimeoutError ao estourá-lo, e jobs que ainda
+    não começaram são cancelados (não ocupam um worker depois do prazo).
+
+    Um job já em execução não pode ser cancelado: com `key` (ex: sha256 da mídia), uma nova
+    tentativa da mesma mídia aguarda o job que ainda roda, com um prazo novo, em vez de
+    transcrever o mesmo áudio de novo.
+    """
+
+    def __init__(self, max_workers: int = 2, max_pending: int = 20, deadline_seconds: float = 60.0):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.deadline_seconds = deadline_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="transcription")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running: Dict[Any, Future] = {}
+        self._latencies_ms = deque(maxlen=1000)
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.cancelled = 0
+        self.rejected = 0
+        self.joined = 0
+
+    def _run(self, deadline: float, transcribe: Callable[..., str], *args) -> str:
+        # Prazo já vencido enquanto aguardava na fila: não inicia download nem transcrição
+        if time.monotonic() > deadline:
+            with self._lock:
+                self.cancelled += 1
+            raise TranscriptionTimeoutError(self.deadline_seconds)
+
+        start = time.monotonic()
+        try:
+            result = transcribe(*args)
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            raise
+        elapsed = time.monotonic() - start
+        with self._lock:
+            self.completed += 1
+            self._latencies_ms.append(elapsed * 1000)
+        TRANSCRIPTION_SECONDS.observe(elapsed)
+        return result
+
+    def _done(self, future: Future, key: Any = None):
+        with self._lock:
+            self._pending -= 1
+            if future.cancelled():
+                self.cancelled += 1
+            if key is not None and self._running.get(key) is future:
+                del self._running[key]
+
+    def submit(self, transcribe: Callable[..., str], *args, deadline_seconds: float = None, key: Any = None) -> Future:
+        """
+        Agenda `transcribe(*args)`; o Future guarda o prazo absoluto em `deadline`
+
+        Se um job com a mesma `key` ainda estiver em execução, retorna o Future dele com o prazo renovado.
+        """
+        deadline_seconds = deadline_seconds or self.deadline_seconds
+        with self._lock:
+            running = self._running.get(key) if key is not None else None
+            if running is not None and running.running():
+                running.deadline = time.monotonic() + deadline_seconds
+                running.deadline_seconds = deadline_seconds
+                self.joined += 1
+                return running
+
+            if self._pending >= self.max_workers + self.max_pending:
+                self.rejected += 1
+                raise TranscriptionRejectedError(self._pending)
+            self._pending += 1
+            self.submitted += 1
+
+            deadline = time.monotonic() + deadline_seconds
+            future = self._executor.submit(self._run, deadline, transcribe, *args)
+            future.deadline = deadline
+            future.deadline_seconds = deadline_seconds
+            if key is not None:
+                self._running[key] = future
+        # Fora do lock: o callback roda na hora se o job já terminou
+        future.add_done_callback(lambda done: self._done(done, key))
+        return future
+
+    def result(self, future: Future) -> str:
+        """Aguarda o resultado até o prazo do job; ao estourar, cancela o job se ainda não começou"""
+        try:
+            return future.result(timeout=max(0.0, future.deadline - time.monotonic()))
+        except FutureTimeoutError:
+            future.cancel()
+            with self._lock:
+                self.timeouts += 1
+            logger.warning(f"Transcription timed out after {future.deadline_seconds}s")
+            raise TranscriptionTimeoutError(future.deadline_seconds)
+
+    def run(self, transcribe: Callable[..., str], *args, deadline_seconds: float = None) -> str:
+        """Agenda e aguarda uma transcrição respeitando o prazo"""
+        return self.result(self.submit(transcribe, *args, deadline_seconds=deadline_seconds))
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Ocupação, contadores e latência das transcrições concluídas"""
+        latency = latency_summary(self._latencies_ms)
+        return {
+            "workers": self.max_workers,
+            "pending": self._pending,
+            "capacity": self.max_workers + self.max_pending,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "timeouts": self.timeouts,
+            "cancelled": self.cancelled,
+            "rejected": self.rejected,
+            "joined": self.joined,
+            "latency": latency
+        }
@@ -0,0 +1,216 @@
+"""
+Diretório de usuários autorizados com índice telefone → User em memória
+
+Uso (importar o JSON para o armazenamento SQLite):
+    python -m whatsapp.user_directory allowed_users.json users.db
+"""
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import Column, Enum as SQLEnum, Integer, MetaData, String, Table, create_engine, func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from whatsapp.whatsapp_models import RoleType, User
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+class UserDirectory(ABC):
+    """Interface de consulta de usuários autorizados por telefone"""
+
+    @abstractmethod
+    def get(self, phone: str) -> Optional[User]:
+        """Retorna o usuário do telefone ou None"""
+        pass
+
+    @abstractmethod
+    def get_many(self, phones: Iterable[str]) -> Dict[str, User]:
+        """Consulta em lote: retorna {telefone: User} apenas para os telefones encontrados"""
+        pass
+
+    @abstractmethod
+    def reload(self):
+        """Recarrega os usuários da origem"""
+        pass
+
+
+class JsonUserDirectory(UserDirectory):
+    """
+    Diretório carregado do allowed_users.json
+
+    O arquivo é lido uma única vez e indexado por telefone; o mtime é verificado no
+    máximo a cada `refresh_interval_seconds` e o índice é recarregado quando muda.
+    """
+
+    def __init__(self, path: str = "allowed_users.json", refresh_interval_seconds: float = 5.0):
+        self.path = path
+        self.refresh_interval_seconds = refresh_interval_seconds
+        self._index: Dict[str, User] = {}
+        self._mtime: Optional[float] = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        """Lê o arquivo e troca o índice de uma vez (leitores nunca veem um índice parcial)"""
+        with self._lock:
+            try:
+                mtime = os.stat(self.path).st_mtime
+                with open(self.path, 'r', encoding='utf-8') as file:
+                    allowed_users = json.load(file)
+                index = {user["phone"]: User(**user) for user in allowed_users}
+            except FileNotFoundError:
+                logger.warning(f"User directory file not found: {self.path}")
+                self._index, self._mtime = {}, None
+                self._last_check = time.monotonic()
+                return
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                # Mantém o índice anterior se o arquivo estiver sendo reescrito ou inválido
+                # (JSON malformado ou entrada sem campos obrigatórios)
+                logger.error(f"Failed to load user directory {self.path}: {e!r}")
+                self._last_check = time.monotonic()
+                return
+
+            self._index = index
+            self._mtime = mtime
+            self._last_check = time.monotonic()
+        logger.info(f"User directory loaded: {len(self._index)} users from {self.path}")
+
+    def _refresh_if_changed(self):
+        now = time.monotonic()
+        if now - self._last_check < self.refresh_interval_seconds:
+            return
+
+        self._last_check = now
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            mtime = None
+
+        if mtime != self._mtime:
+            self.reload()
+
+    def get(self, phone: str) -> Optional[User]:
+        self._refresh_if_changed()
+        return self._index.get(phone)
+
+    def get_many(self, phones: Iterable[str]) -> Dict[str, User]:
+        self._refresh_if_changed()
+        index = self._index
+        return {phone: index[phone] for phone in phones if phone in index}
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+
+class SqliteUserDirectory(UserDirectory):
+    """
+    Diretório em SQLite para bases grandes de usuários
+
+    O telefone é a chave primária, então cada consulta é uma busca indexada e a
+    consulta em lote usa IN em blocos.
+    """
+
+    LOOKUP_CHUNK_SIZE = 500
+
+    def __init__(self, db_path: str = "users.db"):
+        self.db_path = db_path
+        self.engine = create_engine(f"sqlite:///{db_path}")
+        self.metadata = MetaData()
+        self.users = Table(
+            "allowed_users", self.metadata,
+            Column("phone", String(32), primary_key=True),
+            Column("id", Integer, nullable=False),
+            Column("first_name", String(100), nullable=False),
+            Column("last_name", String(100), nullable=False),
+            Column("role", SQLEnum(RoleType), nullable=False, default=RoleType.BASIC)
+        )
+        self.metadata.create_all(self.engine)
+        logger.info(f"SQLite user directory configured: {db_path}")
+
+    def _to_user(self, row) -> User:
+        return User(id=row.id, first_name=row.first_name, last_name=row.last_name, phone=row.phone, role=row.role)
+
+    def reload(self):
+        """Os dados são lidos do banco a cada consulta; não há índice a recarregar"""
+        pass
+
+    def get(self, phone: str) -> Optional[User]:
+        with self.engine.connect() as connection:
+            row = connection.execute(select(self.users).where(self.users.c.phone == phone)).first()
+        return self._to_user(row) if row else None
+
+    def get_many(self, phones: Iterable[str]) -> Dict[str, User]:
+        unique_phones = list(dict.fromkeys(phones))
+        found: Dict[str, User] = {}
+        with self.engine.connect() as connection:
+            for start in range(0, len(unique_phones), self.LOOKUP_CHUNK_SIZE):
+                chunk = unique_phones[start:start + self.LOOKUP_CHUNK_SIZE]
+                for row in connection.execute(select(self.users).where(self.users.c.phone.in_(chunk))):
+                    found[row.phone] = self._to_user(row)
+        return found
+
+    def import_users(self, users: List[Dict]) -> int:
+        """Insere ou atualiza usuários em lote (formato do allowed_users.json)"""
+        if not users:
+            return 0
+
+        rows = [
+            {
+                "phone": user["phone"],
+                "id": user["id"],
+                "first_name": user["first_name"],
+                "last_name": user["last_name"],
+                "role": RoleType(user.get("role", RoleType.BASIC))
+            }
+            for user in users
+        ]
+        statement = sqlite_insert(self.users)
+        statement = statement.on_conflict_do_update(
+            index_elements=[self.users.c.phone],
+            set_={column: statement.excluded[column] for column in ("id", "first_name", "last_name", "role")}
+        )
+        with self.engine.begin() as connection:
+            connection.execute(statement, rows)
+        logger.info(f"Imported {len(rows)} users into {self.db_path}")
+        return len(rows)
+
+    def __len__(self) -> int:
+        with self.engine.connect() as connection:
+            return connection.execute(select(func.count()).select_from(self.users)).scalar_one()
+
+
+def install_reload_signal(directory: UserDirectory, signum: Optional[int] = None):
+    """Recarrega o diretório ao receber SIGHUP (ou o sinal informado)"""
+    signum = signum if signum is not None else getattr(signal, "SIGHUP", None)
+    if signum is None:
+        return
+
+    try:
+        signal.signal(signum, lambda *_: directory.reload())
+        logger.info(f"User directory reload bound to signal {signum}")
+    except ValueError:
+        # signal.signal só pode ser chamado na thread principal
+        logger.warning("Could not install user directory reload signal outside the main thread")
+
+
+def main():
+    """Importa um allowed_users.json para o diretório SQLite"""
+    if len(sys.argv) != 3:
+        print("Uso: python -m whatsapp.user_directory <allowed_users.json> <users.db>")
+        sys.exit(1)
+
+    with open(sys.argv[1], 'r', encoding='utf-8') as file:
+        users = json.load(file)
+    count = SqliteUserDirectory(sys.argv[2]).import_users(users)
+    print(f"{count} usuários importados para {sys.argv[2]}")
+
+if __name__ == "__main__":
+    main()
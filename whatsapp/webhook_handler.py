@@ -1,24 +1,54 @@
 """
 Handler para processar webhooks do WhatsApp
 """
-import json
 import logging
 import time
-from typing import Any, Dict
-from fastapi import HTTPException, BackgroundTasks
+from typing import Any, Dict, List, Optional, Tuple
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response
+from pydantic import TypeAdapter, ValidationError
 
+try:
+    # orjson é opcional: acelera a serialização da resposta do webhook
+    import orjson
+except ImportError:
+    orjson = None
+
+from conversation.status_recorder import status_event
+from observability import log_event
+from observability.metrics import DELIVERY_STATUSES_TOTAL, ERRORS_TOTAL, WEBHOOK_MESSAGES_TOTAL
+from observability.query_stats import QueryStats, track_queries
+from whatsapp.admission import AdmissionRejectedError
 from whatsapp.dependencies import ServiceFactory
-from whatsapp.whatsapp_models import Payload
+from whatsapp.whatsapp_models import Message, MessageContext, Payload
 from config.settings import settings
 
 # Configurar logging
 logger = logging.getLogger(__name__)
 
+# Validador criado uma única vez (o schema do Payload é compilado na importação)
+PAYLOAD_ADAPTER = TypeAdapter(Payload)
+
+# Orçamento de queries do recebimento: deduplicação (select + insert), margem para a autenticação
+# e um insert por job na fila de entrada (o SQLite não agrupa inserts com RETURNING pelo ORM)
+WEBHOOK_QUERY_BUDGET = 5
+
+def json_response(content: Any) -> Response:
+    """Serializa a resposta com orjson quando disponível"""
+    if orjson is not None:
+        return Response(content=orjson.dumps(content), media_type="application/json")
+    return JSONResponse(content)
+
 class WebhookHandler:
     """Handler para processar webhooks do WhatsApp"""
     
     def __init__(self):
         self.service = ServiceFactory.get_whatsapp_service()
+        self.deduplicator = ServiceFactory.get_message_deduplicator()
+        self.job_queue = ServiceFactory.get_job_queue()
+        self.status_recorder = ServiceFactory.get_status_recorder()
+        self.admission = ServiceFactory.get_admission_controller()
     
     def verify_webhook(self, hub_mode: str, hub_challenge: int, hub_verify_token: str) -> int:
         """
@@ -42,85 +72,170 @@ class WebhookHandler:
         logger.warning(f"Webhook verification failed: mode={hub_mode}, token={hub_verify_token}")
         raise HTTPException(status_code=403, detail="Invalid verification token")
     
-    async def handle_webhook(self, data: Dict[Any, Any], background_tasks: BackgroundTasks) -> Dict[str, Any]:
+    def _check_message(self, message: Message, context: Optional[MessageContext], error: Optional[Dict]) -> Tuple[Dict[str, Any], Optional[MessageContext]]:
+        """Converte o resultado da admissão de uma mensagem no resultado individual do webhook"""
+        outcome: Dict[str, Any] = {"message_id": message.id, "type": message.type}
+        
+        if error:
+            if error["status"] == "expired":
+                error = {**error, "status": "message_expired", "max_age_minutes": settings.MESSAGE_EXPIRY_MINUTES}
+            return {**outcome, **error}, None
+        
+        user = context.user
+        outcome["user_phone"] = user.phone
+        
+        # Áudios e imagens seguem para a fila de mídia (extraídos pelos media workers)
+        log_event(logger, "message.accepted", user_id=user.id, message_id=message.id, type=message.type)
+        return {**outcome, "status": "accepted"}, context
+    
+    def _enqueue(self, contexts: List[MessageContext], results: List[Dict[str, Any]]):
+        """Grava os contextos aceitos na fila de entrada e anota o job de cada mensagem"""
+        job_ids = self.job_queue.enqueue([
+            {
+                "channel": "whatsapp",
+                "kind": context.message.type,
+                "ordering_key": context.message.from_,
+                "payload": {"context": context.model_dump(mode="json", by_alias=True)}
+            }
+            for context in contexts
+        ])
+        
+        job_by_message = {context.message.id: job_id for context, job_id in zip(contexts, job_ids)}
+        for outcome in results:
+            if outcome["status"] == "accepted":
+                outcome["job_id"] = job_by_message[outcome["message_id"]]
+    
+    def _record_statuses(self, payload: Payload) -> int:
+        """Anexa os callbacks de status ao buffer de gravação em lote (fora do fluxo de conversas)"""
+        events = []
+        for status in self.service.parse_statuses(payload):
+            error_code = status.errors[0].code if status.errors else None
+            event = status_event(status.id, status.status, status.timestamp, status.recipient_id, error_code)
+            DELIVERY_STATUSES_TOTAL.labels(status.status).inc()
+            if event:
+                events.append(event)
+        return self.status_recorder.record(events) if events else 0
+    
+    async def handle_webhook(self, data: Dict[Any, Any]) -> Dict[str, Any]:
         """
-        Processa webhook do WhatsApp
+        Processa webhook do WhatsApp já decodificado em dict
         
         Args:
             data: Dados do webhook
-            background_tasks: Tarefas em background do FastAPI
             
         Returns:
-            Dict com status da operação
+            Dict com status da operação e o resultado de cada mensagem
+        """
+        try:
+            with self.service.stages.stage("parse"):
+                payload = PAYLOAD_ADAPTER.validate_python(data)
+        except ValidationError as e:
+            logger.warning(f"Invalid webhook payload: {e.error_count()} errors")
+            raise HTTPException(status_code=422, detail="Invalid webhook payload")
+        return await self.handle_payload(payload)
+    
+    async def handle_webhook_body(self, body: bytes) -> Dict[str, Any]:
+        """
+        Processa webhook do WhatsApp a partir do corpo bruto da requisição
+        
+        O JSON é decodificado e validado em uma única passada pelo pydantic-core,
+        sem criar o dict intermediário.
         """
+        if settings.DEBUG:
+            logger.info(f"Received WhatsApp webhook: {body[:2000].decode('utf-8', 'replace')}")
+        
+        try:
+            with self.service.stages.stage("parse"):
+                payload = PAYLOAD_ADAPTER.validate_json(body)
+        except ValidationError as e:
+            logger.warning(f"Invalid webhook payload: {e.error_count()} errors")
+            raise HTTPException(status_code=422, detail="Invalid webhook payload")
+        return await self.handle_payload(payload)
+    
+    async def handle_payload(self, payload: Payload) -> Dict[str, Any]:
+        """
+        Processa um webhook validado
+        
+        O processamento acessa o banco de forma síncrona, então roda no threadpool
+        para não bloquear o event loop (e para que o limite de requisições simultâneas
+        do controle de admissão tenha efeito).
+        """
+        return await run_in_threadpool(self.process_payload, payload)
+    
+    def process_payload(self, payload: Payload) -> Dict[str, Any]:
+        """
+        Todas as mensagens de todas as entries/changes são validadas em uma única
+        passada; as aceitas são gravadas na fila durável de entrada (JobQueue)
+        e processadas pelo JobWorkerPool.
+        """
+        with track_queries("webhook") as queries:
+            return self._admit_payload(payload, queries)
+    
+    def _admit_payload(self, payload: Payload, queries: QueryStats) -> Dict[str, Any]:
         start_time = time.time()
         
         try:
-            if settings.DEBUG:
-                logger.info(f"Received WhatsApp message: {json.dumps(data, indent=2)}")
+            messages = self.service.parse_messages(payload)
+            queries.budget = WEBHOOK_QUERY_BUDGET + len(messages)
             
-            # Parse do payload
-            payload = Payload(**data)
-            message = self.service.parse_message(payload)
-            
-            if not message:
+            if not messages:
+                statuses = self._record_statuses(payload)
+                if statuses:
+                    return {"status": "statuses_recorded", "statuses": statuses}
                 logger.info("No message found in payload")
                 return {"status": "no_message"}
             
-            # Verificar se mensagem não é muito antiga
-            if self.service.is_message_too_old(message.timestamp):
-                logger.warning(f"Message too old: {message.timestamp}")
-                raise HTTPException(
-                    status_code=422, 
-                    detail={
-                        "error": "message_expired",
-                        "message": "Message is too old to be processed",
-                        "max_age_minutes": settings.MESSAGE_EXPIRY_MINUTES
-                    }
-                )
-            
-            # Obter usuário
-            user = self.service.get_current_user(message)
-            if not user:
-                logger.warning(f"User not found for phone: {message.from_}")
-                raise HTTPException(status_code=404, detail="User not found")
+            # Admissão antes do registro de deduplicação: uma mensagem rejeitada com 503
+            # não pode ser marcada como recebida, senão a reentrega seria descartada
+            self.admission.admit_jobs(message.type for message in messages)
             
-            # Extrair conteúdo da mensagem
-            user_message = self.service.message_extractor(message, self.service.parse_audio_file(message))
-            image = self.service.parse_image_file(message)
+            # Estágios dedup e auth do pipeline do canal: reentregas da Meta são reconhecidas
+            # antes de qualquer processamento e os remetentes autenticados em uma única consulta
+            admitted = self.service.admit_messages(messages)
+            results = []
+            accepted = []
+            try:
+                for message, context, error in admitted:
+                    outcome, context = self._check_message(message, context, error)
+                    results.append(outcome)
+                    if context:
+                        accepted.append(context)
+                
+                # Gravar na fila durável (um insert por job, em uma única transação) e confirmar
+                if accepted:
+                    self._enqueue(accepted, results)
+            except Exception:
+                # Sem o job a mensagem se perderia: libera os IDs reivindicados por este
+                # webhook para que a reentrega da Meta seja aceita
+                self.service.release_messages([
+                    message.id for message, _, error in admitted
+                    if not (error and error["status"] == "duplicate")
+                ])
+                raise
             
-            if not user_message and not image:
-                logger.warning("No message content found")
-                raise HTTPException(status_code=400, detail="No message content found")
+            # Status só depois das mensagens aceitas: se o webhook falhar ou for rejeitado
+            # (503), a reentrega da Meta não grava os mesmos eventos duas vezes
+            self._record_statuses(payload)
             
-            # Processar imagem
-            if image:
-                logger.info(f"Image received from user {user.first_name} {user.last_name}")
-                return {"status": "image_received", "user_phone": user.phone}
+            for outcome in results:
+                WEBHOOK_MESSAGES_TOTAL.labels(outcome["status"]).inc()
+            if accepted:
+                self.admission.note_enqueued(context.message.type for context in accepted)
             
-            # Processar mensagem de texto/áudio
-            if user_message:
-                logger.info(f"Processing message from user {user.first_name} {user.last_name} ({user.phone})")
-                
-                # Adicionar processamento em background
-                background_tasks.add_task(self.service.respond_and_send_message, payload)
-                
-                processing_time = round((time.time() - start_time) * 1000, 2)
-                
-                return {
-                    "status": "accepted",
-                    "type": message.type,
-                    "user_phone": user.phone,
-                    "processing_time_ms": processing_time
-                }
+            processing_time = round((time.time() - start_time) * 1000, 2)
             
-            # Fallback (não deveria chegar aqui)
-            logger.warning("Unexpected state: no action taken")
-            return {"status": "no_action_taken"}
+            return {
+                "status": "accepted" if accepted else "no_action_taken",
+                "total": len(messages),
+                "accepted": len(accepted),
+                "results": results,
+                "processing_time_ms": processing_time
+            }
             
-        except HTTPException:
+        except (HTTPException, AdmissionRejectedError):
             # Re-raise HTTP exceptions
             raise
         except Exception as e:
             logger.error(f"Unexpected error processing webhook: {str(e)}", exc_info=True)
+            ERRORS_TOTAL.labels("webhook").inc()
             raise HTTPException(status_code=500, detail="Internal server error")
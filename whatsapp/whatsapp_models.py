@@ -49,11 +49,23 @@ class Metadata(BaseModel):
     display_phone_number: str
     phone_number_id: str
 
+class StatusError(BaseModel):
+    code: int
+    title: Optional[str] = None
+
+class Status(BaseModel):
+    id: str
+    status: str
+    timestamp: str
+    recipient_id: Optional[str] = None
+    errors: Optional[List[StatusError]] = None
+
 class Value(BaseModel):
     messaging_product: str
     metadata: Metadata
     contacts: Optional[List[Contact]] = None
     messages: Optional[List[Message]] = None
+    statuses: Optional[List[Status]] = None
 
 class Change(BaseModel):
     value: Value
@@ -75,3 +87,15 @@ class UserMessage(BaseModel):
     message: str | None = None
     image: Image | None = None
     audio: Audio | None = None
+
+
+class MessageContext(BaseModel):
+    """
+    Mensagem validada uma única vez no webhook e repassada ao processamento em background
+    (parse, autenticação e extração de conteúdo não são repetidos)
+    """
+    message: Message
+    user: User
+    content: Optional[str] = None  # None para mídia ainda não processada (ex: áudio a transcrever)
+    message_timestamp: float
+    received_at: float
@@ -1,20 +1,27 @@
 
 import os
-import json
 import time
+import tempfile
 import logging
 from fastapi import Depends
 from typing_extensions import Annotated
-import requests
-from typing import BinaryIO, Dict, Optional
+from concurrent.futures import Future
+from typing import BinaryIO, Callable, Dict, List, Optional
 
 from channel.channel import Channel
-from conversation.models import MessageData, MessageOwner
+from channel.response_engine import ResponseEngineRunner
+from conversation.dedup import MessageDeduplicator
+from conversation.job_queue import JOB_DEFERRED
 
 from dotenv import load_dotenv
 
 from conversation.service import ConversationService
-from whatsapp.whatsapp_models import Audio, Image, Message, Payload, User
+from whatsapp.whatsapp_models import Audio, Image, Message, MessageContext, Payload, Status, User
+from whatsapp.user_directory import JsonUserDirectory, UserDirectory
+from whatsapp.graph_client import GraphAPIError, GraphClient
+from whatsapp.media_cache import MediaCache
+from whatsapp.outbound import OutboundDispatcher, OutboundQueueFullError
+from whatsapp.transcription import TranscriptionPool, TranscriptionRejectedError, TranscriptionTimeoutError
 from config.settings import settings
 
 _ = load_dotenv() # forcar a execucao
@@ -26,15 +33,49 @@ WHATSAPP_API_KEY = settings.WHATSAPP_API_TOKEN
 MY_BUSINESS_TELEPHONE = settings.MY_BUSINESS_TELEPHONE
 
 class WhatsappService(Channel):
-    def __init__(self,  conversation_service: ConversationService, llm = None):
+    name = "whatsapp"
+    context_model = MessageContext
+    # Prazo de transcrição estourado ou pool saturado: o job volta para a fila com backoff
+    retryable_errors = (TranscriptionTimeoutError, TranscriptionRejectedError)
+
+    def __init__(self,  conversation_service: ConversationService, llm = None, user_directory: UserDirectory = None,
+                 graph_client: GraphClient = None, outbound: OutboundDispatcher = None,
+                 media_cache: MediaCache = None, transcriber: Callable[[BinaryIO, str], str] = None,
+                 transcription_pool: TranscriptionPool = None, response_engine: ResponseEngineRunner = None,
+                 deduplicator: MessageDeduplicator = None):
+        super().__init__(conversation_service, response_engine=response_engine, deduplicator=deduplicator)
         self.llm = llm
-        self.conversation_service = conversation_service
-        self.MESSAGE_EXPIRY_MINUTES = 5
+        self.user_directory = user_directory or JsonUserDirectory(settings.ALLOWED_USERS_PATH)
+        self.graph_client = graph_client or GraphClient()
+        # Sem dispatcher de saída as respostas são apenas persistidas (não enviadas ao WhatsApp)
+        self.outbound = outbound
+        self.media_cache = media_cache
+        # Transcritor alternativo ao Whisper (ex: FakeTranscriber) e executor dedicado com prazo por job
+        self.transcriber = transcriber
+        self.transcription_pool = transcription_pool
+        self._temp_dir: Optional[str] = None
+
+    def parse_messages(self, payload: Payload) -> List[Message]:
+        """Extrai todas as mensagens do payload (entregas em lote trazem várias entries/changes/messages)"""
+        return [
+            message
+            for entry in payload.entry
+            for change in entry.changes
+            for message in (change.value.messages or [])
+        ]
+
+    def parse_statuses(self, payload: Payload) -> List[Status]:
+        """Retorna os callbacks de status (sent/delivered/read/failed) de todas as entries/changes"""
+        return [
+            status
+            for entry in payload.entry
+            for change in entry.changes
+            for status in (change.value.statuses or [])
+        ]
 
     def parse_message(self, payload: Payload) -> Message | None:
-        if not payload.entry[0].changes[0].value.messages:
-            return None
-        return payload.entry[0].changes[0].value.messages[0]
+        messages = self.parse_messages(payload)
+        return messages[0] if messages else None
 
     def get_current_user(self, message: Annotated[Message, Depends(parse_message)]) -> User | None:
         if not message:
@@ -62,65 +103,20 @@ class WhatsappService(Channel):
             return message.text.body
         return None
 
-    def generate_response(self, user_message: str, user: User) -> str:
-        """
-        Gera uma resposta para a mensagem do usuário
-        TODO: Integrar com seus agentes de IA aqui
-        """
-        # Mock de resposta - substitua pela sua lógica
-        responses = [
-            f"Olá {user.first_name}! Recebi sua mensagem: '{user_message}'",
-            "Como posso ajudá-lo hoje?",
-            "Interessante! Me conte mais sobre isso.",
-            "Entendi. Há mais alguma coisa que gostaria de saber?",
-            "Obrigado pela mensagem. Vou processar isso para você."
-        ]
-        
-        # Escolher resposta baseada no comprimento da mensagem (mock)
-        response_index = len(user_message) % len(responses)
-        return responses[response_index]
-
-    def is_message_too_old(self, message_timestamp: str, max_age_minutes: int = None) -> bool:
-        """
-        Verifica se uma mensagem é muito antiga para ser processada.
-        
-        Args:
-            message_timestamp: Timestamp da mensagem (string ou int/float)
-            max_age_minutes: Idade máxima em minutos antes de considerar muito antiga
-        
-        Returns:
-            bool: True se a mensagem for muito antiga, False caso contrário
-        """
-        if max_age_minutes is None:
-            max_age_minutes = self.MESSAGE_EXPIRY_MINUTES
-            
-        current_time = time.time()
-        
-        # Converter message_timestamp para float se for string
-        try:
-            if isinstance(message_timestamp, str):
-                message_time = float(message_timestamp)
-            else:
-                message_time = float(message_timestamp)
-        except (ValueError, TypeError):
-            # Se não conseguir fazer parse do timestamp, considerar muito antigo por segurança
-            return True
-        
-        # Calcular idade em minutos
-        age_minutes = (current_time - message_time) / 60
-        
-        return age_minutes > max_age_minutes
-
-    def transcribe_audio_file(self, audio_file: BinaryIO) -> str:
+    def transcribe_audio_file(self, audio_file: BinaryIO, filename: str = None) -> str:
         if not audio_file:
             return "No audio file provided"
         
+        if self.transcriber is not None:
+            return self.transcriber(audio_file, filename)
+        
         if self.llm is None:
             return "No transcribe actived"
         
         try:
+            # Buffers em memória não têm nome; a extensão informa o formato do áudio à API
             transcription = self.llm.audio.transcriptions.create(
-                file=audio_file,
+                file=(filename, audio_file) if filename else audio_file,
                 model="whisper-1",
                 response_format="text"
             )
@@ -129,67 +125,145 @@ class WhatsappService(Channel):
             raise ValueError("Error transcribing audio") from e
 
     def transcribe_audio(self, audio: Audio) -> str:
-        file_path = self.download_file_from_facebook(audio.id, "audio", audio.mime_type)
-        with open(file_path, 'rb') as audio_binary:
-            transcription = self.transcribe_audio_file(audio_binary)
-        try:
-            os.remove(file_path)
-        except Exception as e:
-            print(f"Failed to delete file: {e}")
+        # Áudios encaminhados repetem o sha256: a transcrição é reaproveitada sem acessar a rede
+        cached = self.cached_transcription(audio)
+        if cached is not None:
+            return cached
+        return self._download_and_transcribe(audio)
+
+    @property
+    def transcription_cache_kind(self) -> Optional[str]:
+        """Tipo da transcrição no cache de mídia pela origem (None: não é armazenada)"""
+        if self.transcriber is not None:
+            return getattr(self.transcriber, "cache_kind", None)
+        return "transcription" if self.llm is not None else None
+
+    def cached_transcription(self, audio: Audio) -> Optional[str]:
+        kind = self.transcription_cache_kind
+        if self.media_cache and kind:
+            return self.media_cache.get_result(audio.sha256, kind)
+        return None
+
+    def _download_and_transcribe(self, audio: Audio) -> str:
+        with self.open_media(audio.id, audio.sha256, audio.mime_type) as audio_buffer:
+            transcription = self.transcribe_audio_file(audio_buffer, filename=self.media_filename(audio.id, audio.mime_type))
+
+        kind = self.transcription_cache_kind
+        if self.media_cache and kind:
+            self.media_cache.put_result(audio.sha256, kind, transcription)
         return transcription
 
-    def download_file_from_facebook(self, file_id: str, file_type: str, mime_type: str) -> str | None:
-        # First GET request to retrieve the download URL
-        url = f"https://graph.facebook.com/v22.0/{file_id}"
-        headers = {"Authorization": f"Bearer {WHATSAPP_API_KEY}"}
-        response = requests.get(url, headers=headers)
+    def submit_transcription(self, audio: Audio) -> Future:
+        """
+        Agenda a transcrição no pool dedicado (com prazo); resultados em cache não entram na fila
+
+        A chave é a mesma do cache de mídia: uma nova tentativa aguarda a transcrição do mesmo
+        áudio que ainda roda de uma tentativa anterior, em vez de transcrevê-lo de novo.
+        """
+        cached = self.cached_transcription(audio)
+        if cached is not None or self.transcription_pool is None:
+            future = Future()
+            future.deadline = time.monotonic()
+            try:
+                future.set_result(cached if cached is not None else self._download_and_transcribe(audio))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        return self.transcription_pool.submit(self._download_and_transcribe, audio, key=audio.sha256 or audio.id)
+
+    def wait_transcription(self, future: Future) -> str:
+        if self.transcription_pool is None or future.done():
+            return future.result()
+        return self.transcription_pool.result(future)
+
+    def process_image(self, image: Image) -> str:
+        """Processa uma imagem recebida e retorna a descrição textual usada como conteúdo da mensagem"""
+        if self.media_cache:
+            cached = self.media_cache.get_result(image.sha256, "image")
+            if cached is not None:
+                return cached
+
+        with self.open_media(image.id, image.sha256, image.mime_type) as image_buffer:
+            size = image_buffer.seek(0, os.SEEK_END)
+        description = f"[Imagem recebida: {image.mime_type}, {size} bytes]"
+
+        if self.media_cache:
+            self.media_cache.put_result(image.sha256, "image", description)
+        return description
+
+    def open_media(self, file_id: str, sha256: str, mime_type: str = None) -> BinaryIO:
+        """Retorna a mídia do cache local (pelo sha256) ou a baixa e armazena no cache"""
+        if self.media_cache:
+            cached = self.media_cache.open_media(sha256)
+            if cached is not None:
+                return cached
 
-        if response.status_code == 200:
-            download_url = response.json().get('url')
+        buffer = self.download_media(file_id, mime_type)
+        if self.media_cache:
+            self.media_cache.put_media(sha256, buffer)
+        return buffer
 
-            # Second GET request to download the file
-            response = requests.get(download_url, headers=headers)
+    @staticmethod
+    def media_filename(file_id: str, mime_type: str) -> str:
+        file_extension = mime_type.split('/')[-1].split(';')[0]  # Extract file extension from mime_type
+        return f"{file_id}.{file_extension}"
 
-            if response.status_code == 200:
-                file_extension = mime_type.split('/')[-1].split(';')[0]  # Extract file extension from mime_type
-                file_path = f"{file_id}.{file_extension}"
-                with open(file_path, 'wb') as file:
-                    file.write(response.content)
-                if file_type == "image" or file_type == "audio":
-                    return file_path
+    def download_media(self, file_id: str, mime_type: str = None) -> tempfile.SpooledTemporaryFile:
+        """
+        Baixa uma mídia em blocos para um buffer em memória (posicionado no início)
+
+        Acima de MEDIA_SPOOL_MAX_MEMORY_BYTES o buffer passa para um arquivo no diretório
+        temporário privado do processo; downloads acima de MEDIA_MAX_DOWNLOAD_BYTES são recusados.
+        O chamador deve fechar o buffer (o arquivo, se existir, é removido ao fechar).
+        """
+        buffer = tempfile.SpooledTemporaryFile(
+            max_size=settings.MEDIA_SPOOL_MAX_MEMORY_BYTES,
+            dir=self._media_temp_dir()
+        )
+        try:
+            self.graph_client.stream_media(file_id, buffer, max_bytes=settings.MEDIA_MAX_DOWNLOAD_BYTES)
+        except GraphAPIError as e:
+            buffer.close()
+            raise ValueError(f"Failed to download file {file_id}: {e}") from e
+        except Exception:
+            buffer.close()
+            raise
+        buffer.seek(0)
+        return buffer
 
-            raise ValueError(f"Failed to download file. Status code: {response.status_code}")
-        raise ValueError(f"Failed to retrieve download URL. Status code: {response.status_code}")
+    def _media_temp_dir(self) -> str:
+        """Diretório temporário privado (criado sob demanda) usado apenas por mídias grandes"""
+        if self._temp_dir is None:
+            self._temp_dir = settings.MEDIA_TEMP_DIR or tempfile.mkdtemp(prefix="whatsapp-media-")
+        return self._temp_dir
 
     def authenticate_user_by_phone_number(self, phone_number: str) -> User | None:
-        # TODO
-        with open('allowed_users.json', 'r', encoding='utf-8') as file:
-            allowed_users =  json.load(file)
-                
-        for user in allowed_users:
-            if user["phone"] == phone_number:
-                print("authenticate_user_by_phone_number - got")
-                return User(**user)
-        print("authenticate_user_by_phone_number - None")
-        return None
+        return self.user_directory.get(phone_number)
 
-    def send_whatsapp_message(self, to, message, template=True):
-        url = f"https://graph.facebook.com/v22.0/{MY_BUSINESS_TELEPHONE}/messages"
-        headers = {
-            "Authorization": f"Bearer " + WHATSAPP_API_KEY,
-            "Content-Type": "application/json"
+    def get_users_by_phone(self, phone_numbers: List[str]) -> Dict[str, User]:
+        """Autentica vários telefones de uma vez (uma consulta ao diretório por lote)"""
+        return self.user_directory.get_many(phone_numbers)
+
+    def get_users(self, senders: List[str]) -> Dict[str, User]:
+        return self.get_users_by_phone(senders)
+
+    @staticmethod
+    def text_message_payload(to: str, message: str) -> Dict:
+        """Monta o corpo de uma mensagem de texto da Cloud API"""
+        return {
+            "messaging_product": "whatsapp",
+            "preview_url": False,
+            "recipient_type": "individual",
+            "to": to,
+            "type": "text",
+            "text": {
+                "body": message
+            }
         }
+
+    def send_whatsapp_message(self, to, message, template=True):
         if not template:
-            data = {
-                "messaging_product": "whatsapp",
-                "preview_url": False,
-                "recipient_type": "individual",
-                "to": to,
-                "type": "text",
-                "text": {
-                    "body": message
-                }
-            }
+            data = self.text_message_payload(to, message)
         else:
             data = {
                 "messaging_product": "whatsapp",
@@ -203,8 +277,7 @@ class WhatsappService(Channel):
                 }
             }
 
-        response = requests.post(url, headers=headers, data=json.dumps(data))
-        return response.json()
+        return self.graph_client.send_message(MY_BUSINESS_TELEPHONE, data)
 
     def get_user_by_phone(self, phone_number: str) -> Optional[User]:
         """
@@ -217,154 +290,62 @@ class WhatsappService(Channel):
         if message.type == "text" and message.text:
             return message.text.body
         elif message.type == "audio" and message.audio:
-            return self.transcribe_audio(message.audio)
+            return self.wait_transcription(self.submit_transcription(message.audio))
         elif message.type == "image" and message.image:
             return self.process_image(message.image)
         return None
 
-    def save_request(self, user: User, owner: MessageOwner, channel: str, client_hub: str, message: str, message_type: str, meta: Dict = None):
-        """Salva a mensagem do usuário no sistema de conversação"""
-        client_hub = f"user_{user.id}"
-        
-        # Criar dados da mensagem
-        message_data = MessageData(
-            message=message,
-            type=message_type,
-            owner=owner,
-            meta=meta or {},
-            channel=channel
-        )
-        
-        # Obter ou criar conversa
-        conversation_uuid, is_new = self.conversation_service.get_or_create_conversation_uuid(
-            client_hub=client_hub,
-            channel=channel
-        )
-        
-        # Adicionar mensagem
-        message_dict, conversation_closed = self.conversation_service.add_message(
-            conversation_uuid=conversation_uuid,
-            message_data=message_data
-        )
-        
-        if is_new:
-            print(f"Nova conversa criada para usuário {user.first_name} {user.last_name}")
-        
-        print(f"Mensagem salva: {message[:50]}...")
-        return conversation_uuid, message_dict
-    
-    def save_response(self, user: User, owner: MessageOwner, channel: str, client_hub: str, response: str, message_type: str, agent_type: str = "local_agent" , meta: Dict = None):
-        """Salva a resposta do agente no sistema de conversação"""
-        client_hub = f"user_{user.id}"
-        
-        # Criar dados da resposta
-        message_data = MessageData(
-            message=response,
-            type=message_type,
-            owner=owner,
-            meta={
-                "agent_type": agent_type,
-                **(meta or {})
-            },
-            channel=channel
-        )
-        
-        # Obter conversa existente
-        conversation_uuid, _ = self.conversation_service.get_or_create_conversation_uuid(
-            client_hub=client_hub,
-            channel=channel
-        )
-        
-        # Adicionar resposta
-        message_dict, conversation_closed = self.conversation_service.add_message(
-            conversation_uuid=conversation_uuid,
-            message_data=message_data
-        )
-        
-        print(f"Resposta do agente salva: {response[:50]}...")
-        return message_dict
 
-    def respond_and_send_message(self, payload: Payload, channel: str = "whatsapp"):
+    def prepare_extraction(self, contexts: List[MessageContext]) -> Dict[int, Future]:
+        """Áudios do lote são agendados de uma vez no pool de transcrição (rodam em paralelo)"""
+        transcriptions: Dict[int, Future] = {}
+        for index, context in enumerate(contexts):
+            message = context.message
+            if context.content is None and message.type == "audio" and message.audio:
+                try:
+                    transcriptions[index] = self.submit_transcription(message.audio)
+                except TranscriptionRejectedError as e:
+                    transcriptions[index] = Future()
+                    transcriptions[index].set_exception(e)
+        return transcriptions
+
+    def wait_extraction(self, future: Future) -> str:
+        return self.wait_transcription(future)
+
+    def deliver(self, message: Message, user: User, response: str) -> Optional[str]:
+        """Sem dispatcher de saída a resposta fica apenas persistida"""
+        if self.outbound is None:
+            return None
+        return self.enqueue_reply(message.from_, response)
+
+    def enqueue_reply(self, to: str, response: str) -> str:
         """
-        Processa uma mensagem e gera resposta
+        Enfileira o envio da resposta no dispatcher de saída
+
+        A resposta já foi persistida, então uma fila cheia não gera nova tentativa do job
+        (evitando gravar a conversa em duplicidade): o envio é descartado e registrado.
         """
-        start_time = time.time()
-        
         try:
-            # Parse da mensagem
-            message = self.parse_message(payload)
-            if not message:
-                logger.warning("No message found in payload")
-                return {"status": "no_message", "error": "No message found in payload"}
-            
-            # Verificar se a mensagem não é muito antiga
-            if self.is_message_too_old(message.timestamp):
-                logger.warning(f"Message too old: {message.timestamp}")
-                return {
-                    "status": "expired", 
-                    "error": "Message is too old to be processed",
-                    "max_age_minutes": self.MESSAGE_EXPIRY_MINUTES
-                }
-            
-            # Obter usuário
-            user = self.get_current_user(message)
-            if not user:
-                logger.warning(f"User not found for phone: {message.from_}")
-                return {"status": "user_not_found", "error": "User not found"}
-            
-            # Extrair conteúdo da mensagem
-            message_content = self.extract_message_content(message)
-            if not message_content:
-                logger.warning("No message content found")
-                return {"status": "no_content", "error": "No message content found"}
-            
-            logger.info(f"Mensagem recebida de {user.first_name} {user.last_name}: {message_content}")
-            
-            # Salvar mensagem do usuário
-            conversation_uuid, user_message_dict = self.save_request(
-                user=user,
-                owner=MessageOwner.USER,
-                channel=channel,
-                client_hub="todo",
-                message=message_content,
-                message_type=message.type,
-                meta={"original_message_id": message.id}
+            self.outbound.submit(
+                MY_BUSINESS_TELEPHONE,
+                self.text_message_payload(to, response),
+                timeout=settings.OUTBOUND_ENQUEUE_TIMEOUT_SECONDS
             )
-            
-            # Gerar resposta
-            response = self.generate_response(message_content, user)
-            
-            # Salvar resposta do agente
-            agent_message_dict = self.save_response(
-                user=user,
-                owner=MessageOwner.AGENT,
-                channel=channel,
-                client_hub="todo",
-                message_type=message.type,
-                response=response,
-                meta={"response_to": message.id}
-            )
-            
-            processing_time = round((time.time() - start_time) * 1000, 2)
-            
-            logger.info(f"Processed message for user {user.first_name} {user.last_name} in {processing_time}ms")
-
-            return {
-                "status": "processed",
-                "user": {
-                    "id": user.id,
-                    "name": f"{user.first_name} {user.last_name}"
-                },
-                "conversation_uuid": conversation_uuid,
-                "user_message": user_message_dict,
-                "agent_response": agent_message_dict,
-                "response_text": response,
-                "processing_time_ms": processing_time
-            }
-            
-        except ValueError as e:
-            logger.error(f"Validation error: {e}")
-            return {"status": "error", "message": str(e)}
-        except Exception as e:
-            logger.error(f"Unexpected error processing message: {e}", exc_info=True)
-            return {"status": "error", "message": "Internal server error"}
+            return "queued"
+        except OutboundQueueFullError as e:
+            logger.error(f"Reply to {to} dropped: {e}")
+            return "queue_full"
+
+    def process_jobs(self, jobs: List[Dict]) -> List[Optional[str]]:
+        """
+        Handler da fila de entrada: processa o lote de jobs reivindicados
+        Retorna, para cada job, None em caso de sucesso, o erro que justifica nova tentativa
+        ou JOB_DEFERRED quando um job anterior do mesmo remetente falhou no lote
+        """
+        contexts = [MessageContext.model_validate(job["payload"]["context"]) for job in jobs]
+        batch_result = self.respond_to_contexts(contexts, strict_order=True)
+        return [
+            JOB_DEFERRED if result.get("status") == "deferred"
+            else result.get("message", "error") if result.get("retryable") else None
+            for result in batch_result["results"]
+        ]
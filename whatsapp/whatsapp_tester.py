@@ -1,218 +1,538 @@
 """
-Script to test the WhatsApp server
+Gerador de carga assíncrono para o servidor WhatsApp
+
+Envia webhooks no formato da Meta (texto, áudio, imagem e callbacks de status, com várias
+mensagens e entries por webhook) em uma taxa alvo (`--rps`, carga aberta) ou com um número
+fixo de requisições simultâneas (`--concurrency`, carga fechada). Respostas 429/5xx são
+reenviadas com backoff, como faz a Meta, e parte dos webhooks é reentregue com os mesmos IDs
+para exercitar a deduplicação. Ao final informa vazão, taxa de erros e latência p50/p95/p99,
+além da evolução por intervalo.
+
+Com `--spawn` o servidor é iniciado em um subprocesso com a Graph API apontando para o stub
+local (whatsapp.graph_stub), transcrição simulada e um banco temporário.
+
+Uso:
+    python -m whatsapp.whatsapp_tester message "Test message"
+    python -m whatsapp.whatsapp_tester load --spawn --rps 200 --duration 30
+    python -m whatsapp.whatsapp_tester load --url http://localhost:5001 --concurrency 50 --mix text=0.6,audio=0.2,image=0.1,status=0.1
 """
-import requests
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
 import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from observability import percentile
 
 SERVER_URL = "http://localhost:5001"
 TEST_PHONE = "+5511999999999"
+DEFAULT_MIX = "text=0.7,audio=0.1,image=0.05,status=0.15"
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+def parse_mix(value: str) -> Dict[str, float]:
+    """'text=0.7,audio=0.2' → pesos normalizados por tipo"""
+    mix = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        kind, _, weight = item.partition("=")
+        if kind.strip() not in ("text", "audio", "image", "status"):
+            raise ValueError(f"Tipo inválido no mix: {kind}")
+        mix[kind.strip()] = float(weight)
+    total = sum(mix.values())
+    if total <= 0:
+        raise ValueError("O mix precisa de ao menos um peso positivo")
+    return {kind: weight / total for kind, weight in mix.items()}
+
+def load_senders(path: Optional[str], count: int) -> List[str]:
+    """Telefones do allowed_users.json (remetentes autorizados) ou números gerados"""
+    if path and os.path.exists(path):
+        with open(path, encoding="utf-8") as file:
+            phones = [user["phone"] for user in json.load(file)]
+        if phones:
+            return phones[:count] if count else phones
+    return [f"+55119{index:08d}" for index in range(count or 100)]
+
+def write_users_file(path: str, count: int) -> List[str]:
+    users = [
+        {"id": index + 1, "phone": f"+55119{index:08d}", "first_name": "Carga", "last_name": str(index)}
+        for index in range(count)
+    ]
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(users, file)
+    return [user["phone"] for user in users]
+
+class PayloadFactory:
+    """Monta webhooks no formato da Meta com o mix de tipos configurado"""
+
+    TEXTS = ("oi", "menu", "obrigado pelo contato", "Qual o status do meu pedido?",
+             "Preciso falar com um atendente", "Bom dia! Gostaria de mais informações sobre o plano")
+
+    def __init__(self, senders: List[str], mix: Dict[str, float], batch_size: int = 1, entries: int = 1,
+                 seed: Optional[int] = None):
+        self.senders = senders
+        self.kinds = list(mix)
+        self.weights = [mix[kind] for kind in self.kinds]
+        self.batch_size = max(1, batch_size)
+        self.entries = max(1, entries)
+        self.random = random.Random(seed)
+        self._sequence = itertools.count(1)
+        self._run_id = uuid.uuid4().hex[:8]
+
+    def _message_id(self) -> str:
+        return f"wamid.load.{self._run_id}.{next(self._sequence)}"
+
+    def _item(self, kind: str, now: str) -> Dict[str, Any]:
+        sender = self.random.choice(self.senders)
+        if kind == "status":
+            return {
+                "id": f"wamid.stub.{self.random.randint(1, 1_000_000)}",
+                "status": self.random.choice(("sent", "delivered", "read")),
+                "timestamp": now,
+                "recipient_id": sender.lstrip("+")
+            }
+        message = {"from": sender, "id": self._message_id(), "timestamp": now, "type": kind}
+        if kind == "text":
+            message["text"] = {"body": self.random.choice(self.TEXTS)}
+        else:
+            mime_type = "audio/ogg; codecs=opus" if kind == "audio" else "image/jpeg"
+            message[kind] = {"mime_type": mime_type, "sha256": uuid.uuid4().hex, "id": str(self.random.randint(10**14, 10**15))}
+            if kind == "audio":
+                message[kind]["voice"] = True
+        return message
+
+    def build(self) -> Tuple[Dict[str, Any], Dict[str, int]]:
+        """Retorna (payload, quantidade de itens por tipo)"""
+        now = str(int(time.time()))
+        kinds = self.random.choices(self.kinds, self.weights, k=self.batch_size)
+        counts: Dict[str, int] = {}
+        entries = [{"id": f"entry_{index}", "changes": []} for index in range(min(self.entries, len(kinds)))]
+        for position, kind in enumerate(kinds):
+            counts[kind] = counts.get(kind, 0) + 1
+            key = "statuses" if kind == "status" else "messages"
+            entry = entries[position % len(entries)]
+            # Uma change por entry e tipo de conteúdo (messages ou statuses), como nos webhooks da Meta
+            change = next((change for change in entry["changes"] if key in change["value"]), None)
+            if change is None:
+                change = {"field": "messages", "value": {
+                    "messaging_product": "whatsapp",
+                    "metadata": {"display_phone_number": "15551234567", "phone_number_id": "123456789"},
+                    key: []
+                }}
+                entry["changes"].append(change)
+            item = self._item(kind, now)
+            change["value"][key].append(item)
+            if key == "messages":
+                change["value"].setdefault("contacts", []).append(
+                    {"profile": {"name": "Carga"}, "wa_id": item["from"].lstrip("+")}
+                )
+        return {"object": "whatsapp_business_account", "entry": entries}, counts
+
+class LoadStats:
+    """Resultados agregados e por intervalo"""
 
-class WhatsAppServerTester:
-    def __init__(self, base_url=SERVER_URL):
-        self.base_url = base_url
-        self.session = requests.Session()
-    
-    def test_server_health(self):
-        """Test if server is responding"""
-        try:
-            response = self.session.get(f"{self.base_url}/admin/stats", timeout=5)
-            if response.status_code == 200:
-                print("Server responding normally")
-                return True
-            else:
-                print(f"Server responded with status {response.status_code}")
-                return False
-        except requests.exceptions.ConnectionError:
-            print("Server not running or not accessible")
-            return False
-        except Exception as e:
-            print(f"Error testing server: {e}")
-            return False
-    
-    def test_webhook_verification(self):
-        """Test webhook verification (simulating WhatsApp)"""
-        params = {
-            'hub.mode': 'subscribe',
-            'hub.verify_token': 'test_token_123',
-            'hub.challenge': 'test_challenge_123'
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.start = time.monotonic()
+        self.latencies: List[float] = []
+        self.outcomes: Dict[str, int] = {}
+        self.items: Dict[str, int] = {}
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.redeliveries = 0
+        # Carga aberta: envios agendados e descartados pelo limite de requisições em voo
+        self.scheduled = 0
+        self.dropped = 0
+        self.timeline: Dict[int, Dict[str, Any]] = {}
+
+    def record(self, outcome: str, latency_ms: float, counts: Dict[str, int], redelivery: bool):
+        ok = outcome == "200"
+        self.requests += 1
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+        if redelivery:
+            self.redeliveries += 1
+        else:
+            for kind, count in counts.items():
+                self.items[kind] = self.items.get(kind, 0) + count
+        window = self.timeline.setdefault(int((time.monotonic() - self.start) // self.interval),
+                                          {"requests": 0, "errors": 0, "latencies": []})
+        window["requests"] += 1
+        if ok:
+            self.latencies.append(latency_ms)
+            window["latencies"].append(latency_ms)
+        else:
+            self.errors += 1
+            window["errors"] += 1
+
+    def window_summary(self, index: int) -> Dict[str, Any]:
+        window = self.timeline.get(index, {"requests": 0, "errors": 0, "latencies": []})
+        latencies = sorted(window["latencies"])
+        return {
+            "t_s": round((index + 1) * self.interval, 1),
+            "requests": window["requests"],
+            "rps": round(window["requests"] / self.interval, 1),
+            "errors": window["errors"],
+            "p50_ms": round(percentile(latencies, 0.5), 2),
+            "p95_ms": round(percentile(latencies, 0.95), 2)
         }
-        
-        try:
-            response = self.session.get(f"{self.base_url}/webhook", params=params)
-            
-            if response.status_code == 200:
-                print("Webhook verified successfully")
-                return True
-            else:
-                print(f"Webhook verification failed: {response.status_code}")
-                return False
-                
-        except Exception as e:
-            print(f"Error in webhook test: {e}")
-            return False
-    
-    def simulate_text_message(self, phone=TEST_PHONE, message="Hi, I need help!"):
-        """Simulate receiving text message via webhook"""
-        webhook_payload = {
-            "entry": [{
-                "id": "entry_id",
-                "changes": [{
-                    # Adicione a linha abaixo
-                    "field": "messages", 
-                    "value": {
-                        "messaging_product": "whatsapp",
-                        "metadata": {
-                            "display_phone_number": "15551234567",
-                            "phone_number_id": "123456789"
-                        },
-                        "messages": [{
-                            "from": phone,
-                            "id": f"msg_{int(time.time())}",
-                            "timestamp": str(int(time.time())),
-                            "type": "text",
-                            "text": {
-                                "body": message
-                            }
-                        }]
-                    }
-                }]
-            }]
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        latencies = sorted(self.latencies)
+        return {
+            "requests": self.requests,
+            "items": self.items,
+            "outcomes": self.outcomes,
+            "errors": self.errors,
+            "error_rate": round(self.errors / self.requests, 4) if self.requests else 0.0,
+            "retries": self.retries,
+            "redeliveries": self.redeliveries,
+            "scheduled": self.scheduled,
+            "dropped": self.dropped,
+            "drop_rate": round(self.dropped / self.scheduled, 4) if self.scheduled else 0.0,
+            "elapsed_s": round(elapsed, 2),
+            "throughput_per_s": round(self.requests / elapsed, 1) if elapsed else 0.0,
+            "latency_ms": {
+                "p50": round(percentile(latencies, 0.5), 2),
+                "p95": round(percentile(latencies, 0.95), 2),
+                "p99": round(percentile(latencies, 0.99), 2),
+                "max": round(latencies[-1], 2) if latencies else 0.0
+            },
+            "timeline": [self.window_summary(index) for index in sorted(self.timeline)]
         }
-        
-        try:
-            response = self.session.post(
-                f"{self.base_url}/webhook",
-                json=webhook_payload,
-                headers={'Content-Type': 'application/json'}
-            )
-            
-            if response.status_code == 200:
-                print("Text message processed successfully")
-                return True
-            else:
-                print(f"Error processing message: {response.status_code}")
-                return False
-                
-        except Exception as e:
-            print(f"Error simulating message: {e}")
-            return False
-    
-    def test_conversation_history(self, phone=TEST_PHONE):
-        """Test conversation history retrieval"""
-        try:
-            response = self.session.get(f"{self.base_url}/admin/conversations/{phone}")
-            
-            if response.status_code == 200:
-                data = response.json()
-                print("Conversation history retrieved successfully")
-                print(f"Total messages: {data.get('total', 0)}")
-                
-                # Show last messages
-                messages = data.get('messages', [])
-                if messages:
-                    print("\nLast messages:")
-                    for msg in messages[-3:]:
-                        owner = msg.get('owner', 'unknown')
-                        message = msg.get('message', '')[:50]
-                        print(f"  {owner}: {message}...")
-                
-                return True
-            else:
-                print(f"Error retrieving history: {response.status_code}")
-                return False
-                
-        except Exception as e:
-            print(f"Error in history test: {e}")
-            return False
-    
-    def test_admin_stats(self):
-        """Test admin statistics endpoint"""
-        try:
-            response = self.session.get(f"{self.base_url}/admin/stats")
-            
-            if response.status_code == 200:
-                stats = response.json()
-                print("Statistics retrieved successfully:")
-                print(f"  - Active conversations: {stats.get('total_active_conversations', 0)}")
-                print(f"  - Total messages: {stats.get('total_messages', 0)}")
-                print(f"  - Message types: {stats.get('message_types', {})}")
-                return True
-            else:
-                print(f"Error in statistics: {response.status_code}")
-                return False
-                
-        except Exception as e:
-            print(f"Error in stats test: {e}")
-            return False
-    
-    def run_all_tests(self):
-        """Run all tests"""
-        print("STARTING WHATSAPP SERVER TESTS")
-        print("=" * 50)
-        
-        tests = [
-            ("Server Health", self.test_server_health),
-            ("Webhook Verification", self.test_webhook_verification),
-            ("Text Message", lambda: self.simulate_text_message(message="Test message")),
-            ("Conversation History", self.test_conversation_history),
-            ("Admin Statistics", self.test_admin_stats),
-        ]
-        
-        results = {}
-        
-        for test_name, test_func in tests:
-            print(f"\nTesting {test_name}...")
+
+class WhatsAppLoadGenerator:
+    """
+    Dispara webhooks contra o servidor em carga aberta (taxa fixa) ou fechada (concorrência fixa)
+
+    Na carga aberta a latência é medida a partir do instante agendado do envio, então atrasos
+    do próprio servidor em aceitar conexões entram na medida (sem omissão coordenada).
+    """
+
+    def __init__(self, base_url: str, factory: PayloadFactory, rps: Optional[float] = None, concurrency: int = 10,
+                 duration: float = 10.0, max_retries: int = 3, redelivery_ratio: float = 0.0,
+                 timeout: float = 10.0, report_interval: float = 1.0, quiet: bool = False):
+        self.base_url = base_url.rstrip("/")
+        self.factory = factory
+        self.rps = rps
+        self.concurrency = concurrency
+        self.duration = duration
+        self.max_retries = max_retries
+        self.redelivery_ratio = redelivery_ratio
+        self.timeout = timeout
+        self.quiet = quiet
+        self.stats = LoadStats(report_interval)
+        self._tasks = set()
+        # Requisições na rede (esperas de backoff e reentregas agendadas não contam)
+        self._in_flight = 0
+
+    async def _post(self, client: httpx.AsyncClient, body: bytes, counts: Dict[str, int],
+                    scheduled_at: float, redelivery: bool = False, reserved: bool = False):
+        """`reserved`: a vaga da primeira tentativa já foi contada em _in_flight por quem agendou"""
+        outcome = "no_response"
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            if attempt or not reserved:
+                self._in_flight += 1
             try:
-                result = test_func()
-                results[test_name] = result
-            except Exception as e:
-                print(f"Error in test '{test_name}': {e}")
-                results[test_name] = False
-            
-            time.sleep(1)
-        
-        # Summary
-        print("\n" + "=" * 50)
-        print("TEST RESULTS SUMMARY:")
-        
-        passed = 0
-        for test_name, result in results.items():
-            status = "PASSED" if result else "FAILED"
-            print(f"  {test_name}: {status}")
-            if result:
-                passed += 1
-        
-        print(f"\nResult: {passed}/{len(tests)} tests passed")
-        
-        if passed == len(tests):
-            print("All tests passed! System working correctly.")
-        else:
-            print("Some tests failed. Check configuration.")
+                response = await client.post("/webhook", content=body, headers={"Content-Type": "application/json"})
+                outcome = str(response.status_code)
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    break
+                retry_after = response.headers.get("Retry-After")
+            except httpx.HTTPError as e:
+                outcome = type(e).__name__
+            finally:
+                self._in_flight -= 1
+            if attempt == self.max_retries:
+                break
+            self.stats.retries += 1
+            delay = float(retry_after) if retry_after and retry_after.replace(".", "", 1).isdigit() else 0.2 * 2 ** attempt
+            await asyncio.sleep(min(delay, 5.0))
+        self.stats.record(outcome, (time.monotonic() - scheduled_at) * 1000, counts, redelivery)
 
-if __name__ == "__main__":
-    import sys
-    
-    if len(sys.argv) > 1:
-        command = sys.argv[1]
-        
-        if command == "quick":
-            tester = WhatsAppServerTester()
-            print("Running quick test...")
-            tester.test_server_health()
-            tester.test_admin_stats()
-            
-        elif command == "message":
-            tester = WhatsAppServerTester()
-            message = sys.argv[2] if len(sys.argv) > 2 else "Test message"
-            print(f"Sending test message: {message}")
-            tester.simulate_text_message(message=message)
-            
-        else:
-            print("Available commands:")
-            print("  python mock_whatsapp_server_tester.py quick          # Quick test")
-            print("  python mock_whatsapp_server_tester.py message 'text' # Send test message")
-            print("  python mock_whatsapp_server_tester.py                # Run all tests")
+        if not redelivery and outcome == "200" and random.random() < self.redelivery_ratio:
+            # Reentrega da Meta: mesmo corpo (mesmos IDs) alguns segundos depois
+            self._spawn(self._redeliver(client, body, counts))
+
+    async def _redeliver(self, client: httpx.AsyncClient, body: bytes, counts: Dict[str, int]):
+        await asyncio.sleep(random.uniform(0.5, 2.0))
+        await self._post(client, body, counts, time.monotonic(), redelivery=True)
+
+    def _spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _next_body(self) -> Tuple[bytes, Dict[str, int]]:
+        payload, counts = self.factory.build()
+        return json.dumps(payload).encode(), counts
+
+    async def _open_loop(self, client: httpx.AsyncClient, deadline: float):
+        """
+        Taxa fixa: o envio i é agendado para start + i/rps; com `concurrency` requisições já
+        na rede o envio é descartado (contado em `dropped`)
+        """
+        start = time.monotonic()
+        for index in itertools.count():
+            scheduled_at = start + index / self.rps
+            if scheduled_at >= deadline:
+                break
+            delay = scheduled_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.stats.scheduled += 1
+            if self._in_flight >= self.concurrency:
+                self.stats.dropped += 1
+                continue
+            # A vaga é reservada já no agendamento: a task só começa na próxima volta do loop
+            self._in_flight += 1
+            body, counts = self._next_body()
+            self._spawn(self._post(client, body, counts, scheduled_at, reserved=True))
+
+    async def _closed_loop(self, client: httpx.AsyncClient, deadline: float):
+        async def worker():
+            while time.monotonic() < deadline:
+                body, counts = self._next_body()
+                await self._post(client, body, counts, time.monotonic())
+
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+
+    async def _reporter(self):
+        index = 0
+        while True:
+            await asyncio.sleep(self.stats.start + (index + 1) * self.stats.interval - time.monotonic())
+            window = self.stats.window_summary(index)
+            if not self.quiet:
+                print(f"[{window['t_s']:>6.1f}s] rps={window['rps']:>7.1f} errors={window['errors']:>4} "
+                      f"p50={window['p50_ms']:>8.2f}ms p95={window['p95_ms']:>8.2f}ms in_flight={self._in_flight}")
+            index += 1
+
+    async def run(self) -> Dict[str, Any]:
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        async with httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout, limits=limits) as client:
+            self.stats = LoadStats(self.stats.interval)
+            deadline = self.stats.start + self.duration
+            reporter = asyncio.create_task(self._reporter())
+            try:
+                if self.rps:
+                    await self._open_loop(client, deadline)
+                else:
+                    await self._closed_loop(client, deadline)
+                # Aguarda as requisições em voo e as reentregas agendadas
+                while self._tasks:
+                    await asyncio.gather(*list(self._tasks), return_exceptions=True)
+            finally:
+                reporter.cancel()
+            report = self.stats.report(time.monotonic() - self.stats.start)
+            report["server"] = await self._server_stats(client)
+        return report
+
+    @staticmethod
+    async def _server_stats(client: httpx.AsyncClient) -> Dict[str, Any]:
+        """Snapshot das estatísticas do servidor ao final da carga (melhor esforço)"""
+        stats = {}
+        for name, path in (("queue", "/queue/stats"), ("pipeline", "/pipeline/stats"), ("admission", "/admission/stats")):
+            try:
+                response = await client.get(path)
+                if response.status_code == 200:
+                    stats[name] = response.json()
+            except httpx.HTTPError:
+                pass
+        return stats
+
+class LocalServer:
+    """Servidor WhatsApp em subprocesso com a Graph API no stub local e transcrição simulada"""
+
+    def __init__(self, port: int = 5101, stub_port: int = 5155, stub_latency_ms: float = 30.0,
+                 stub_error_rate: float = 0.0, workers: int = 1, senders: int = 100,
+                 database_path: Optional[str] = None, send_replies: bool = True):
+        self.port = port
+        self.stub_port = stub_port
+        self.stub_options = {"latency_ms": stub_latency_ms, "error_rate": stub_error_rate}
+        self.workers = workers
+        self.send_replies = send_replies
+        self.tempdir = tempfile.TemporaryDirectory(prefix="whatsapp-load-")
+        self.database_path = database_path or os.path.join(self.tempdir.name, "conversations.db")
+        self.users_path = os.path.join(self.tempdir.name, "allowed_users.json")
+        self.senders = write_users_file(self.users_path, senders)
+        self.stub = None
+        self.process = None
+        self.log = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self, timeout: float = 30.0) -> "LocalServer":
+        from whatsapp.graph_stub import StubServer
+
+        self.stub = StubServer(port=self.stub_port, **self.stub_options).start()
+        env = {
+            **os.environ,
+            "PORT": str(self.port),
+            "HOST": "127.0.0.1",
+            "DEBUG": "false",
+            "SERVER_WORKERS": str(self.workers),
+            "GRAPH_API_BASE_URL": self.stub.base_url,
+            "MY_BUSINESS_TELEPHONE": "123456789",
+            "WHATSAPP_API_TOKEN": "load-test",
+            "TRANSCRIBER": "fake",
+            "WHATSAPP_SEND_REPLIES": "true" if self.send_replies else "false",
+            "DATABASE_PATH": self.database_path,
+            "ALLOWED_USERS_PATH": self.users_path,
+            "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING")
+        }
+        self.log = open(os.path.join(self.tempdir.name, "server.log"), "w")
+        self.process = subprocess.Popen([sys.executable, "-m", "whatsapp.server"], env=env,
+                                        stdout=self.log, stderr=subprocess.STDOUT)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Server exited with code {self.process.returncode}, see {self.log.name}")
+            try:
+                if httpx.get(f"{self.base_url}/readiness", timeout=1).status_code == 200:
+                    return self
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        self.stop()
+        raise RuntimeError("Server did not become ready")
+
+    def stub_stats(self) -> Dict[str, int]:
+        return dict(self.stub.app.state.counters) if self.stub else {}
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        if self.stub:
+            self.stub.stop()
+        if self.log:
+            self.log.close()
+        self.tempdir.cleanup()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+def show_report(report: Dict[str, Any]):
+    latency = report["latency_ms"]
+    print("\n" + "=" * 60)
+    print(f"Requests: {report['requests']} in {report['elapsed_s']}s ({report['throughput_per_s']}/s)")
+    print(f"Items: {report['items']}")
+    print(f"Outcomes: {report['outcomes']}")
+    if report["scheduled"]:
+        print(f"Dropped sends: {report['dropped']} of {report['scheduled']} scheduled "
+              f"({report['drop_rate'] * 100:.2f}%, client in-flight cap)")
+    print(f"Error rate: {report['error_rate'] * 100:.2f}% | retries={report['retries']} "
+          f"redeliveries={report['redeliveries']}")
+    print(f"Latency (ok): p50={latency['p50']}ms p95={latency['p95']}ms p99={latency['p99']}ms max={latency['max']}ms")
+    queue = report.get("server", {}).get("queue")
+    if queue:
+        print(f"Server queue depth: {queue.get('depth')} | job latency: {queue.get('latency')}")
+
+def send_message(base_url: str, phone: str, message: str) -> bool:
+    """Envia uma única mensagem de texto e mostra o resultado"""
+    factory = PayloadFactory([phone], {"text": 1.0})
+    payload, _ = factory.build()
+    payload["entry"][0]["changes"][0]["value"]["messages"][0]["text"]["body"] = message
+    try:
+        response = httpx.post(f"{base_url}/webhook", json=payload, timeout=10)
+    except httpx.HTTPError as e:
+        print(f"Server not accessible: {e}")
+        return False
+    print(f"{response.status_code} {response.text}")
+    return response.status_code == 200
+
+def main():
+    parser = argparse.ArgumentParser(description="Gerador de carga do servidor WhatsApp")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    message_parser = subparsers.add_parser("message", help="Envia uma mensagem de texto")
+    message_parser.add_argument("text", nargs="?", default="Test message")
+    message_parser.add_argument("--url", default=SERVER_URL)
+    message_parser.add_argument("--phone", default=TEST_PHONE)
+
+    load = subparsers.add_parser("load", help="Executa a carga e mostra o relatório")
+    load.add_argument("--url", default=SERVER_URL, help="Servidor alvo (ignorado com --spawn)")
+    load.add_argument("--spawn", action="store_true", help="Inicia o servidor e o stub da Graph API localmente")
+    load.add_argument("--rps", type=float, help="Taxa alvo de webhooks por segundo (carga aberta)")
+    load.add_argument("--concurrency", type=int, default=20, help="Requisições simultâneas (máximo em voo com --rps)")
+    load.add_argument("--duration", type=float, default=10.0)
+    load.add_argument("--mix", default=DEFAULT_MIX, help="Pesos por tipo: text, audio, image, status")
+    load.add_argument("--batch-size", type=int, default=1, help="Mensagens/status por webhook")
+    load.add_argument("--entries", type=int, default=1, help="Entries por webhook (itens distribuídos entre elas)")
+    load.add_argument("--senders", type=int, default=100, help="Remetentes distintos")
+    load.add_argument("--users-file", default="allowed_users.json", help="Remetentes autorizados (sem --spawn)")
+    load.add_argument("--redelivery-ratio", type=float, default=0.02, help="Fração dos webhooks reentregues")
+    load.add_argument("--max-retries", type=int, default=3)
+    load.add_argument("--timeout", type=float, default=10.0)
+    load.add_argument("--interval", type=float, default=1.0, help="Intervalo do relatório parcial em segundos")
+    load.add_argument("--server-workers", type=int, default=1)
+    load.add_argument("--port", type=int, default=5101, help="Porta do servidor iniciado com --spawn")
+    load.add_argument("--stub-port", type=int, default=5155)
+    load.add_argument("--stub-latency-ms", type=float, default=30.0)
+    load.add_argument("--stub-error-rate", type=float, default=0.0)
+    load.add_argument("--seed", type=int)
+    load.add_argument("--json", dest="json_path", help="Grava o relatório em JSON ('-' para stdout)")
+    args = parser.parse_args()
+
+    if args.command == "message":
+        sys.exit(0 if send_message(args.url, args.phone, args.text) else 1)
+
+    server = None
+    if args.spawn:
+        server = LocalServer(
+            port=args.port, stub_port=args.stub_port, stub_latency_ms=args.stub_latency_ms,
+            stub_error_rate=args.stub_error_rate, workers=args.server_workers, senders=args.senders
+        ).start()
+        base_url, senders = server.base_url, server.senders
     else:
-        # Run all tests
-        tester = WhatsAppServerTester()
-        tester.run_all_tests()
+        base_url, senders = args.url, load_senders(args.users_file, args.senders)
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    factory = PayloadFactory(senders, parse_mix(args.mix), args.batch_size, args.entries, args.seed)
+    generator = WhatsAppLoadGenerator(
+        base_url, factory, rps=args.rps, concurrency=args.concurrency, duration=args.duration,
+        max_retries=args.max_retries, redelivery_ratio=args.redelivery_ratio, timeout=args.timeout,
+        report_interval=args.interval, quiet=args.json_path == "-"
+    )
+    mode = f"rps={args.rps:g}" if args.rps else f"concurrency={args.concurrency}"
+    if args.json_path != "-":
+        print(f"Load against {base_url}: {mode} duration={args.duration:g}s batch={args.batch_size} mix={args.mix}")
+    try:
+        report = asyncio.run(generator.run())
+    finally:
+        if server:
+            stub_stats = server.stub_stats()
+            server.stop()
+    if server:
+        report["graph_stub"] = stub_stats
+
+    if args.json_path == "-":
+        print(json.dumps(report, indent=2))
+        return
+    show_report(report)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+        print(f"Report written to {args.json_path}")
+
+if __name__ == "__main__":
+    main()